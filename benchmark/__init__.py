@@ -0,0 +1,3 @@
+from .runner import BenchmarkProblem, BenchmarkReport, BenchmarkRunner, load_problem_set
+
+__all__ = ['BenchmarkProblem', 'BenchmarkReport', 'BenchmarkRunner', 'load_problem_set']
@@ -0,0 +1,233 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+
+import solvers
+from database import ResearchDatabase, Solution
+from solvers.base import BatchResult, Solver, SolverProperties
+from solvers.checkpoint import CheckpointStore
+from utils.budget import Budget
+from utils.aio import run_sync
+from utils.model import Model, ModelName
+from utils.reasoning import ReasoningPolicy
+from utils.transcript import TranscriptSettings, configure_transcript, new_id
+
+
+@dataclass
+class BenchmarkProblem:
+    problem_id: str
+    problem: str
+
+
+def load_problem_set(path: str) -> List[BenchmarkProblem]:
+    """Read a JSONL problem set with one {"problem_id": ..., "problem": ...} object per line."""
+    problems = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                problems.append(BenchmarkProblem(data["problem_id"], data["problem"]))
+    return problems
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, 0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+@dataclass
+class BenchmarkReport:
+    solver_type: str
+    experiment_version: str
+    solutions: List[Solution] = field(default_factory=list)
+    wall_time: float = 0.0
+    dollars_spent: float = 0.0
+    # Prompt tokens the reasoning policy kept out of downstream stages
+    reasoning_tokens_saved: int = 0
+
+    @property
+    def solve_rate(self) -> float:
+        if not self.solutions:
+            return 0.0
+        return sum(1 for solution in self.solutions if solution.success) / len(self.solutions)
+
+    @property
+    def call_latencies(self) -> List[float]:
+        return [
+            step.time_taken
+            for solution in self.solutions
+            for step in solution.solving_process.steps
+        ]
+
+    @property
+    def calls_per_problem(self) -> float:
+        if not self.solutions:
+            return 0.0
+        return len(self.call_latencies) / len(self.solutions)
+
+    def summary(self) -> str:
+        latencies = self.call_latencies
+        return (
+            f"{self.solver_type} ({self.experiment_version}): "
+            f"solved {sum(1 for s in self.solutions if s.success)}/{len(self.solutions)} "
+            f"({self.solve_rate:.1%}) in {self.wall_time:.1f}s wall time, ${self.dollars_spent:.2f}\n"
+            f"calls per problem: {self.calls_per_problem:.1f}, "
+            f"per-call latency p50: {percentile(latencies, 50):.2f}s, "
+            f"p95: {percentile(latencies, 95):.2f}s, "
+            f"reasoning tokens saved per problem: "
+            f"{self.reasoning_tokens_saved / max(1, len(self.solutions)):.0f}"
+        )
+
+
+class BenchmarkRunner:
+    """
+    Solve a problem set with one Solver, a bounded number of problems at a time.
+
+    Every Model call made while solving a problem becomes a SolvingStep of its
+    Solution, and each Solution is saved to the ResearchDatabase (if given).
+    """
+
+    def __init__(
+        self,
+        solver: Solver,
+        database: Optional[ResearchDatabase] = None,
+        experiment_version: str = "dev",
+        max_problems_in_flight: int = 4,
+        budget: Optional[Budget] = None,
+        run_id: Optional[str] = None,
+    ):
+        self.solver = solver
+        self.database = database
+        self.experiment_version = experiment_version
+        self.max_problems_in_flight = max_problems_in_flight
+        # Budget of the whole run; per-problem budgets live in the solver's properties
+        self.budget = budget
+        # Pass the id of an interrupted run (with the solver's checkpoint_store set) to resume it
+        self.run_id = run_id
+
+    def _record(self, problem: BenchmarkProblem, item: BatchResult) -> Solution:
+        result = item.result
+        steps = result.solving_process.steps
+        solution = Solution(
+            problem=problem.problem,
+            problem_id=problem.problem_id,
+            solution=result.answer,
+            solver_type=type(self.solver).__name__,
+            timestamp=item.started_at,
+            solving_process=result.solving_process,
+            success=result.solved,
+            error=result.error if result.error is not None else (
+                None if result.answer is not None else "Solver returned no answer"
+            ),
+        )
+        if self.database is not None:
+            self.database.save_solution(solution, self.experiment_version)
+        print(f"{problem.problem_id}: {'solved' if solution.success else 'not solved'} "
+              f"({solution.total_time():.1f}s across {len(steps)} calls)")
+        return solution
+
+    async def arun(self, problems: List[BenchmarkProblem]) -> BenchmarkReport:
+        report = BenchmarkReport(type(self.solver).__name__, self.experiment_version)
+        solutions: List[Optional[Solution]] = [None] * len(problems)
+
+        started = time.monotonic()
+        # Transcript records of problem i get the problem id "<run_id>-<i>"
+        run_id = self.run_id or f"{self.experiment_version}-{new_id()}"
+        print(f"Run id: {run_id}")
+        async for item in self.solver.arun_batch(
+            [problem.problem for problem in problems], self.max_problems_in_flight, self.budget, run_id
+        ):
+            solutions[item.index] = self._record(problems[item.index], item)
+            if item.result.budget is not None:
+                report.dollars_spent += item.result.budget.dollars_spent
+            report.reasoning_tokens_saved += item.result.reasoning_tokens_saved
+        report.solutions = solutions
+        report.wall_time = time.monotonic() - started
+        if self.database is not None:
+            await asyncio.to_thread(self.database.flush)
+        return report
+
+    def run(self, problems: List[BenchmarkProblem]) -> BenchmarkReport:
+        return run_sync(self.arun(problems))
+
+
+def main():
+    solver_names = [
+        name for name in solvers.__all__
+        if name not in ("Solver", "SolverResult", "BatchResult", "DeepCheck")
+    ]
+    parser = argparse.ArgumentParser(description="Run a solver across a JSONL problem set.")
+    parser.add_argument("problem_set", help="JSONL file with problem_id and problem fields")
+    parser.add_argument("--solver", choices=solver_names, default="FeedbackAndCondensed")
+    parser.add_argument("--max-problems-in-flight", type=int, default=4)
+    parser.add_argument("--experiment-version", default="dev")
+    parser.add_argument("--db", default="research_results.db", help="ResearchDatabase path")
+    parser.add_argument(
+        "--transcript", default=None,
+        help="JSONL transcript path (default: TRANSCRIPT_PATH, else transcript.jsonl next to --db)",
+    )
+    parser.add_argument("--limit", type=int, default=None, help="Only run the first N problems")
+    parser.add_argument(
+        "--model", choices=[name.name for name in ModelName], default=None,
+        help="Use this model for every role (e.g. FAKE for offline load tests)",
+    )
+    parser.add_argument("--problem-max-tokens", type=int, default=None)
+    parser.add_argument("--problem-max-dollars", type=float, default=None)
+    parser.add_argument("--problem-deadline", type=float, default=None, help="Seconds per problem")
+    parser.add_argument("--run-max-dollars", type=float, default=None)
+    parser.add_argument("--run-deadline", type=float, default=None, help="Seconds for the whole run")
+    parser.add_argument(
+        "--reasoning-policy", choices=[policy.value for policy in ReasoningPolicy], default="keep",
+        help="What verifier, divider and condenser prompts get of the reasoner's thinking",
+    )
+    parser.add_argument("--max-reasoning-tokens", type=int, default=2000, help="Thinking kept by --reasoning-policy truncate")
+    parser.add_argument("--checkpoints", default=None, help="CheckpointStore path; saves each completed solver stage")
+    parser.add_argument("--run-id", default=None, help="Resume this run from --checkpoints")
+    args = parser.parse_args()
+
+    transcript_settings = TranscriptSettings.from_env()
+    if args.transcript is not None:
+        transcript_settings.path = args.transcript
+    elif "TRANSCRIPT_PATH" not in os.environ:
+        transcript_settings.path = os.path.join(os.path.dirname(os.path.abspath(args.db)), "transcript.jsonl")
+    configure_transcript(transcript_settings)
+
+    properties = SolverProperties()
+    if args.model is not None:
+        model = Model(ModelName[args.model])
+        properties = SolverProperties(
+            reasoner_model=model,
+            verifier_model=model,
+            discussion_condenser_model=model,
+            proof_divider_model=model,
+            segment_verifier_model=model,
+        )
+    properties.budget = Budget(args.problem_max_tokens, args.problem_max_dollars, args.problem_deadline)
+    properties.reasoning_policy = ReasoningPolicy(args.reasoning_policy)
+    properties.max_reasoning_tokens = args.max_reasoning_tokens
+    if args.checkpoints is not None:
+        properties.checkpoint_store = CheckpointStore(args.checkpoints)
+
+    problems = load_problem_set(args.problem_set)[: args.limit]
+    runner = BenchmarkRunner(
+        getattr(solvers, args.solver)(properties),
+        ResearchDatabase(args.db),
+        args.experiment_version,
+        args.max_problems_in_flight,
+        Budget(max_dollars=args.run_max_dollars, deadline_seconds=args.run_deadline),
+        args.run_id,
+    )
+    print(runner.run(problems).summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
-from db import SolvingProcess, Solution, ResearchDatabase, SolutionType, SolvingStep
-from test_db import test_total_verification_attempts
+from .db import SolvingProcess, Solution, ResearchDatabase, SolutionType, SolvingStep
 
 __all__ = [
     "SolvingProcess",
@@ -3,17 +3,23 @@ from datetime import datetime
 import itertools
 from typing import Optional, List
 from enum import Enum
+import atexit
 import json
+import queue
+import threading
+import uuid
 
-from solvers import Feedback
-from solvers import NoFeedback
 import sqlite3
 
+from utils.transcript import LogLevel, log
+
 class SolutionType(Enum):
     REASONING = "reasoning"
     VERIFICATION = "verification"
     PARTIAL_SOLUTION = "partial solution"
     FINAL_SOLUTION = "final solution"
+    CONDENSATION = "condensation"
+    PROOF_DIVISION = "proof division"
     OTHER = "other"
 
 
@@ -35,7 +41,7 @@ class SolvingProcess:
             {
                 "steps": [
                     {
-                        "type": step.type,
+                        "type": step.type.value,
                         "content": step.content,
                         "timestamp": step.timestamp.isoformat(),
                         "model": step.model,
@@ -52,7 +58,7 @@ class SolvingProcess:
         data = json.loads(json_str)
         steps = [
             SolvingStep(
-                type=step["type"],
+                type=SolutionType(step["type"]),
                 content=step["content"],
                 timestamp=datetime.fromisoformat(step["timestamp"]),
                 model=step["model"],
@@ -82,10 +88,10 @@ class Solution:
     problem: str
     problem_id: str # Like: "IMO-2021-P1"
     solution: str
-    solver_type: NoFeedback | Feedback
-    success: bool = None
+    solver_type: str # Solver class name, like: "FeedbackAndCondensed"
     timestamp: datetime
     solving_process: SolvingProcess
+    success: bool = None
     error: Optional[str] = None
     
     def total_time(self):
@@ -97,16 +103,51 @@ class Solution:
     def total_verification_attempts(self) -> List[int]:
         return list(map(lambda listOfVerifiers: len(listOfVerifiers) ,list(map(lambda lst: list(filter(lambda step: step.type == SolutionType.VERIFICATION, lst)), split_list(self.solving_process.steps, lambda step: step.type == SolutionType.REASONING)))))
         
+class _FlushWaiter:
+    """Queued by flush(); set once everything queued before it is written, with the error if that failed."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+
+
 class ResearchDatabase:
-    def __init__(self, db_path: str = "research_results.db"):
+    """
+    SQLite store for solutions, built for many concurrent solver workers.
+
+    save_solution only enqueues; a dedicated writer thread owns one persistent
+    WAL-mode connection and commits whatever has queued up in a single
+    executemany batch. Every SolvingStep is also written to the indexed
+    solving_steps table so dashboards can query steps without parsing JSON.
+    """
+
+    def __init__(self, db_path: str = "research_results.db", batch_size: int = 256):
         self.db_path = db_path
+        self.batch_size = batch_size
+        self.last_error: Optional[Exception] = None
+        # Write failure not yet raised from flush()
+        self._unreported_error: Optional[Exception] = None
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
         self.init_db()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="research-db-writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
 
     def init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS solutions (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    problem_id TEXT,
                     problem TEXT NOT NULL,
                     solution TEXT,
                     solver_type TEXT NOT NULL,
@@ -118,22 +159,161 @@ class ResearchDatabase:
                     experiment_version TEXT NOT NULL
                 )
             """)
-
-    def save_solution(self, solution: Solution, experiment_version: str):
-        with sqlite3.connect(self.db_path) as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(solutions)")]
+            if "problem_id" not in columns:
+                conn.execute("ALTER TABLE solutions ADD COLUMN problem_id TEXT")
+            if "solution_uid" not in columns:
+                conn.execute("ALTER TABLE solutions ADD COLUMN solution_uid TEXT")
             conn.execute("""
+                CREATE TABLE IF NOT EXISTS solving_steps (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    solution_uid TEXT NOT NULL,
+                    step_index INTEGER NOT NULL,
+                    problem_id TEXT,
+                    experiment_version TEXT NOT NULL,
+                    solver_type TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    model TEXT,
+                    timestamp DATETIME NOT NULL,
+                    time_taken REAL NOT NULL,
+                    content TEXT,
+                    metadata JSON
+                )
+            """)
+            for statement in (
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_solutions_uid ON solutions (solution_uid)",
+                "CREATE INDEX IF NOT EXISTS idx_solutions_problem ON solutions (problem_id)",
+                "CREATE INDEX IF NOT EXISTS idx_solutions_experiment ON solutions (experiment_version)",
+                "CREATE INDEX IF NOT EXISTS idx_solutions_solver ON solutions (solver_type)",
+                "CREATE INDEX IF NOT EXISTS idx_steps_solution ON solving_steps (solution_uid, step_index)",
+                "CREATE INDEX IF NOT EXISTS idx_steps_problem ON solving_steps (problem_id)",
+                "CREATE INDEX IF NOT EXISTS idx_steps_experiment ON solving_steps (experiment_version)",
+                "CREATE INDEX IF NOT EXISTS idx_steps_solver ON solving_steps (solver_type)",
+                "CREATE INDEX IF NOT EXISTS idx_steps_type ON solving_steps (type)",
+            ):
+                conn.execute(statement)
+
+    def save_solution(self, solution: Solution, experiment_version: str) -> str:
+        """
+        Queue a solution for writing and return its uid without waiting for disk.
+
+        Call flush() to wait until everything queued so far is committed.
+        """
+        if self._closed:
+            raise RuntimeError("ResearchDatabase is closed")
+        solution_uid = uuid.uuid4().hex
+        solution_row = (
+            solution_uid,
+            solution.problem_id,
+            solution.problem,
+            solution.solution,
+            solution.solver_type,
+            solution.total_reasoning_attempts(),
+            bool(solution.success),
+            solution.timestamp.isoformat(),
+            solution.solving_process.to_json(),  # Store as JSON
+            solution.error,
+            experiment_version,
+        )
+        step_rows = [
+            (
+                solution_uid,
+                index,
+                solution.problem_id,
+                experiment_version,
+                solution.solver_type,
+                step.type.value,
+                step.model,
+                step.timestamp.isoformat(),
+                step.time_taken,
+                step.content,
+                json.dumps(step.metadata) if step.metadata is not None else None,
+            )
+            for index, step in enumerate(solution.solving_process.steps)
+        ]
+        self._queue.put((solution_row, step_rows))
+        return solution_uid
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every solution queued before this call is committed; False on timeout.
+
+        Raises the error of any write that failed since the last flush, instead
+        of reporting rows that were never written as committed.
+        """
+        if not self._writer.is_alive():
+            raise RuntimeError("ResearchDatabase writer is not running") from self.last_error
+        waiter = _FlushWaiter()
+        self._queue.put(waiter)
+        if not waiter.done.wait(timeout):
+            return False
+        if waiter.error is not None:
+            raise waiter.error
+        return True
+
+    def close(self) -> None:
+        """Commit what is queued and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        try:
+            running = True
+            while running:
+                items = [self._queue.get()]
+                while len(items) < self.batch_size:
+                    try:
+                        items.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                solution_rows = []
+                step_rows = []
+                waiters = []
+                for item in items:
+                    if item is None:
+                        running = False
+                    elif isinstance(item, _FlushWaiter):
+                        waiters.append(item)
+                    else:
+                        solution_rows.append(item[0])
+                        step_rows.extend(item[1])
+
+                # Any error, not just sqlite3's, must leave the writer running
+                # or every later flush() would wait forever
+                try:
+                    if solution_rows:
+                        self._write_batch(conn, solution_rows, step_rows)
+                except Exception as e:
+                    self.last_error = self._unreported_error = e
+                    log(
+                        LogLevel.ERROR, "db_write_failed",
+                        f"Failed to write {len(solution_rows)} solutions: {e}",
+                        solutions=len(solution_rows), error=str(e),
+                    )
+                if waiters:
+                    error, self._unreported_error = self._unreported_error, None
+                    for waiter in waiters:
+                        waiter.error = error
+                        waiter.done.set()
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, solution_rows, step_rows) -> None:
+        with conn:
+            conn.executemany("""
                 INSERT INTO solutions 
-                (problem, solution, solver_type, attempts, success, 
+                (solution_uid, problem_id, problem, solution, solver_type, attempts, success, 
                  timestamp, solving_process, error, experiment_version)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                solution.problem,
-                solution.solution,
-                solution.solver_type,
-                solution.attempts,
-                solution.success,
-                solution.timestamp,
-                solution.solving_process.to_json(),  # Store as JSON
-                solution.error,
-                experiment_version
-            ))
\ No newline at end of file
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, solution_rows)
+            conn.executemany("""
+                INSERT INTO solving_steps
+                (solution_uid, step_index, problem_id, experiment_version, solver_type,
+                 type, model, timestamp, time_taken, content, metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, step_rows)
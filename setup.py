@@ -10,6 +10,7 @@ setup(
         "openai>=1.61.0",
         "python-dotenv>=1.0.0",
         "requests>=2.32.0",
+        "httpx>=0.23.0",
     ],
     python_requires=">=3.8",
 )
@@ -1,7 +1,7 @@
-from .base import Solver
+from .base import BatchResult, Solver, SolverResult
 from .no_feedback import NoFeedback
 from .feedback import Feedback
 from .feedback_and_condensed import FeedbackAndCondensed
 from .deep_check import DeepCheck
 
-__all__ = ['Solver', 'NoFeedback', 'Feedback', 'FeedbackAndCondensed', 'DeepCheck']
\ No newline at end of file
+__all__ = ['Solver', 'SolverResult', 'BatchResult', 'NoFeedback', 'Feedback', 'FeedbackAndCondensed', 'DeepCheck']
\ No newline at end of file
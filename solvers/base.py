@@ -1,18 +1,116 @@
 from abc import ABC, abstractmethod
+import asyncio
 from dataclasses import dataclass, field
+from datetime import datetime
 from enum import Enum
-from typing import Optional, List
-from utils.model import Model, ModelName
+from typing import AsyncIterator, Iterable, Iterator, Optional, List
+from database.db import SolutionType, SolvingProcess, SolvingStep
+from utils.aio import iterate_sync, run_sync
+from utils.budget import Budget, BudgetReport, BudgetTracker, cheaper_model, current_budget, use_budget
+from utils.cancellation import CancelToken
+from utils.model import Model, ModelName, stop_on
+from utils.reasoning import ReasoningAccount, ReasoningPolicy, downstream_text, split_reasoning, use_reasoning_account
+from utils.replay import Cassette, use_cassette
+from utils.scheduler import Scheduler, use_scheduler
+from utils.tracing import CallTrace, trace_calls
+from utils.transcript import LogLevel, current_problem_id, current_run_id, log, new_id, transcript_ids
+from solvers.checkpoint import Checkpoint, CheckpointStore, problem_key
+from solvers.segment_cache import SegmentVerdictCache
 
 
 @dataclass
 class SolverProperties:
     max_reasoning_tries: Optional[int] = 4
     max_verifier_passes: Optional[int] = 4
+    # Run the verifier passes concurrently, cancelling the rest on the first INCORRECT verdict
+    parallel_verifier_passes: bool = False
     parallel_reasoning_tries: Optional[int] = 4  # Used in feedback_and_condensed
+    # Move each candidate through verification as soon as its reasoning is done, instead of
+    # in stages, and end the round at the first confirmed solution (used in feedback_and_condensed)
+    pipelined_rounds: bool = False
+    # Condense each failed candidate as soon as its verdict is final, overlapping the rest of the
+    # round, then merge the reports in one short call; False condenses the whole round in one call
+    # (used in feedback_and_condensed)
+    condense_per_candidate: bool = True
     reasoner_model: Optional[Model] = Model(ModelName.O3_MINI_HIGH)
     verifier_model: Optional[Model] = Model(ModelName.O3_MINI_HIGH)
     discussion_condenser_model: Optional[Model] = Model(ModelName.O3_MINI_HIGH)
+    proof_divider_model: Optional[Model] = Model(ModelName.O3_MINI_HIGH)  # Used in deep_check
+    segment_verifier_model: Optional[Model] = Model(ModelName.DEEPSEEK)  # Used in deep_check
+    # Record or replay every model call of a run (overrides MODEL_REPLAY_MODE)
+    cassette: Optional[Cassette] = None
+    # Segment verdicts shared by every DeepCheck of a solver; give it a store to reuse them across runs.
+    # FeedbackAndCondensed creates one per run when this is None
+    segment_verdict_cache: Optional[SegmentVerdictCache] = None
+    # Bounded, priority-ordered fan-out for every model call of a run; None uses the
+    # process-wide default (see utils.scheduler.default_scheduler)
+    scheduler: Optional[Scheduler] = None
+    # Tokens, dollars and wall-clock time one problem may use. Solvers shrink their fan-out
+    # as it runs down, stop starting new tries once it is spent, and give up at the deadline
+    budget: Optional[Budget] = None
+    # Below this share of the budget left, verifier_model is swapped for its cheaper tier
+    low_budget_threshold: float = 0.25
+    # How much of a response's thinking verifier, proof divider and condenser prompts get
+    reasoning_policy: ReasoningPolicy = ReasoningPolicy.KEEP
+    max_reasoning_tokens: int = 2000  # Thinking kept by ReasoningPolicy.TRUNCATE
+    # Save the result of each completed stage (used in feedback and feedback_and_condensed), so
+    # that rerunning a problem with the same run id resumes instead of repeating finished calls.
+    # The run id defaults to the batch's (see Solver.run_batch)
+    checkpoint_store: Optional[CheckpointStore] = None
+    run_id: Optional[str] = None
+
+
+def solving_process_from_trace(trace: CallTrace) -> SolvingProcess:
+    """One SolvingStep per traced Model call, in the order the calls started."""
+    steps = [
+        SolvingStep(
+            type=SolutionType(call.step_type) if call.step_type else SolutionType.OTHER,
+            content=call.response or "",
+            timestamp=call.started_at,
+            model=call.model,
+            time_taken=call.duration,
+            metadata={
+                "streamed": call.streamed,
+                "time_to_first_token": call.time_to_first_token,
+                "retries": call.retries,
+                "prompt_tokens": call.prompt_tokens,
+                "completion_tokens": call.completion_tokens,
+                "cached_prompt_tokens": call.cached_prompt_tokens,
+                "usage_estimated": call.usage_estimated,
+                "error": call.error,
+                **call.metadata,
+            },
+        )
+        for call in sorted(trace.calls, key=lambda call: call.started_monotonic)
+    ]
+    return SolvingProcess(steps=steps)
+
+
+@dataclass
+class SolverResult:
+    answer: Optional[str] = None
+    # Whether the solver believes `answer` is a verified solution
+    solved: bool = False
+    solving_process: SolvingProcess = field(default_factory=lambda: SolvingProcess(steps=[]))
+    error: Optional[str] = None
+    # Spent and remaining budget of this problem
+    budget: Optional[BudgetReport] = None
+    # Thinking behind `answer`, split off it
+    reasoning: Optional[str] = None
+    # Prompt tokens reasoning_policy kept out of downstream stages
+    reasoning_tokens_saved: int = 0
+
+
+@dataclass
+class BatchResult:
+    """One finished problem of Solver.run_batch."""
+
+    index: int  # Position of the problem in the batch
+    problem_statement: str
+    result: SolverResult
+    started_at: datetime
+    # Spent and remaining budget of the whole batch when this problem finished
+    batch_budget: Optional[BudgetReport] = None
 
 
 class Solver(ABC):
@@ -22,9 +120,218 @@ class Solver(ABC):
         self.properties = properties
 
     @abstractmethod
-    def run(self, problem_statement: str):
+    async def _arun(self, problem_statement: str, **kwargs) -> SolverResult:
         pass
 
+    @staticmethod
+    def _out_of_budget() -> bool:
+        budget = current_budget()
+        if budget is not None and budget.exhausted:
+            log(LogLevel.INFO, "budget_exhausted", "Budget exhausted, not starting another try")
+            return True
+        return False
+
+    @staticmethod
+    def _scaled(count: int) -> int:
+        """`count` shrunk in proportion to the budget left."""
+        budget = current_budget()
+        return budget.scale(count) if budget is not None else count
+
+    def _verifier(self) -> Model:
+        """verifier_model, or its cheaper tier once the budget runs low."""
+        budget = current_budget()
+        if budget is not None and budget.fraction_remaining() < self.properties.low_budget_threshold:
+            return cheaper_model(self.properties.verifier_model)
+        return self.properties.verifier_model
+
+    async def _checkpoint(self, problem_statement: str) -> Checkpoint:
+        """The stages of this problem already completed in this run; a no-op without a store or run id."""
+        store = self.properties.checkpoint_store
+        run_id = self.properties.run_id or current_run_id()
+        if store is None or run_id is None:
+            return Checkpoint()
+        problem = problem_key(type(self).__name__, problem_statement)
+        stages = await asyncio.to_thread(store.load, run_id, problem)
+        if stages:
+            log(LogLevel.INFO, "checkpoint_loaded", f"Resuming run {run_id}: {len(stages)} stages already done")
+        return Checkpoint(store, run_id, problem, stages)
+
+    def _downstream(self, response: str, uses: int = 1) -> str:
+        """`response` as later stages should see it, under reasoning_policy."""
+        return downstream_text(
+            response, self.properties.reasoning_policy, self.properties.max_reasoning_tokens, uses
+        )
+
+    @staticmethod
+    def _pass_incorrect(response: str) -> bool:
+        """Verdict of one verifier pass; a reply without a verdict has not confirmed anything, so it fails."""
+        return "SOLUTION INCORRECT" in response or "SOLUTION CORRECT" not in response
+
+    async def _solution_incorrect(self, verifier_conversation) -> bool:
+        """Run up to max_verifier_passes verifier passes; True once any of them is INCORRECT."""
+        model = self._verifier()
+        # Once the budget runs down, later passes are the first to go
+        passes = self._scaled(self.properties.max_verifier_passes)
+        if not self.properties.parallel_verifier_passes:
+            for i in range(passes):
+                response = await model.asend_request(verifier_conversation, sample_index=i)
+                if self._pass_incorrect(response):
+                    return True
+            return False
+
+        # Streaming, so cancelling the group stops the other passes mid-generation,
+        # and each pass stops generating as soon as its own verdict is INCORRECT
+        group = CancelToken()
+
+        async def verifier_pass(i: int) -> str:
+            response = await model.asend_request_streaming(
+                verifier_conversation,
+                sample_index=i,
+                cancel_token=group,
+                stop_when=stop_on("SOLUTION INCORRECT"),
+            )
+            if group.cancelled or "SOLUTION INCORRECT" in response or "SOLUTION CORRECT" in response:
+                return response
+            # Streaming only retries rate limits and returns failures (or what it got before one)
+            # instead of raising; redo the pass the way the sequential path sends it
+            return await model.asend_request(verifier_conversation, sample_index=i)
+
+        tasks = [asyncio.ensure_future(verifier_pass(i)) for i in range(passes)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                if self._pass_incorrect(await next_done):
+                    return True
+            return False
+        finally:
+            group.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def asolve(self, problem_statement: str, **kwargs) -> SolverResult:
+        """Solve and return the answer together with a SolvingStep for every Model call made."""
+        # Problems of a batch already have an id
+        with transcript_ids(problem_id=current_problem_id() or new_id()):
+            log(
+                LogLevel.INFO, "problem_started", f"Solving with {type(self).__name__}",
+                solver=type(self).__name__, problem=problem_statement,
+            )
+            result = await self._asolve(problem_statement, **kwargs)
+            calls = len(result.solving_process.steps)
+            log(
+                LogLevel.INFO, "problem_finished",
+                f"{'Solved' if result.solved else 'Not solved'} after {calls} calls",
+                solved=result.solved, error=result.error, answer=result.answer, calls=calls,
+            )
+        return result
+
+    async def _asolve(self, problem_statement: str, **kwargs) -> SolverResult:
+        # Inside a batch, the problem's budget also draws on the batch's
+        budget = BudgetTracker(self.properties.budget, parent=current_budget())
+        reasoning_account = ReasoningAccount()
+        with use_cassette(self.properties.cassette), use_scheduler(self.properties.scheduler):
+            with use_budget(budget), use_reasoning_account(reasoning_account):
+                with trace_calls(on_record=budget.charge) as trace:
+                    if budget.exhausted:
+                        result = SolverResult(error="Budget exhausted before solving started")
+                    else:
+                        try:
+                            result = await asyncio.wait_for(
+                                self._arun(problem_statement, **kwargs), budget.seconds_remaining()
+                            )
+                        except asyncio.TimeoutError:
+                            result = SolverResult(error="Budget deadline exceeded")
+        result.solving_process = solving_process_from_trace(trace)
+        result.budget = budget.report()
+        if result.answer is not None and result.reasoning is None:
+            reasoning, result.answer = split_reasoning(result.answer)
+            result.reasoning = reasoning or None
+        result.reasoning_tokens_saved = reasoning_account.tokens_saved
+        return result
+
+    def solve(self, problem_statement: str, **kwargs) -> SolverResult:
+        """Blocking wrapper around asolve for callers without an event loop."""
+        return run_sync(self.asolve(problem_statement, **kwargs))
+
+    async def arun(self, problem_statement: str, **kwargs) -> Optional[str]:
+        return (await self.asolve(problem_statement, **kwargs)).answer
+
+    def run(self, problem_statement: str, **kwargs) -> Optional[str]:
+        """Blocking wrapper around arun for callers without an event loop."""
+        return run_sync(self.arun(problem_statement, **kwargs))
+
+    async def arun_batch(
+        self,
+        problem_statements: Iterable[str],
+        max_concurrent_problems: int = 4,
+        budget: Optional[Budget] = None,
+        run_id: Optional[str] = None,
+        **kwargs,
+    ) -> AsyncIterator[BatchResult]:
+        """
+        Solve many problems at once, yielding each result as soon as it is done.
+
+        Up to `max_concurrent_problems` problems are solved concurrently on one
+        event loop, sharing the client pools, rate limiters and scheduler, so one
+        problem's calls fill the capacity another leaves idle while it waits on
+        a long reasoning call. A problem that raises yields a result with `error`.
+        Closing the iterator early cancels the problems still running.
+
+        `budget` caps the whole batch on top of each problem's own budget; once
+        it is spent, the remaining problems end without being attempted.
+
+        Transcript records of problem i are tagged with `run_id` (a new id by
+        default) and the problem id "<run_id>-<i>".
+        """
+        if max_concurrent_problems <= 0:
+            raise ValueError("max_concurrent_problems must be positive")
+        pending = enumerate(problem_statements)
+        finished: asyncio.Queue = asyncio.Queue()
+        running = set()
+
+        batch_budget = BudgetTracker(budget, parent=current_budget())
+        run_id = run_id or new_id()
+
+        async def solve_one(index: int, problem_statement: str) -> BatchResult:
+            started_at = datetime.now()
+            try:
+                with use_budget(batch_budget), transcript_ids(run_id, f"{run_id}-{index}"):
+                    result = await self.asolve(problem_statement, **kwargs)
+            except Exception as e:
+                result = SolverResult(error=f"{e}")
+            return BatchResult(index, problem_statement, result, started_at, batch_budget.report())
+
+        def start_next() -> None:
+            for index, problem_statement in pending:
+                task = asyncio.ensure_future(solve_one(index, problem_statement))
+                running.add(task)
+                task.add_done_callback(finished.put_nowait)
+                return
+
+        for _ in range(max_concurrent_problems):
+            start_next()
+        try:
+            while running:
+                task = await finished.get()
+                running.discard(task)
+                start_next()
+                yield task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def run_batch(
+        self,
+        problem_statements: Iterable[str],
+        max_concurrent_problems: int = 4,
+        budget: Optional[Budget] = None,
+        run_id: Optional[str] = None,
+        **kwargs,
+    ) -> Iterator[BatchResult]:
+        """Blocking wrapper around arun_batch; iterate it to get results in completion order."""
+        return iterate_sync(
+            self.arun_batch(problem_statements, max_concurrent_problems, budget, run_id, **kwargs)
+        )
+
 class Reasoner(ABC):
     def __init__(self, problem_statement: str):
         self.problem_statement = problem_statement
@@ -48,9 +355,14 @@ class VerifierOutput:
     verdict: Verdict = Verdict.UNKNOWN
     entire_discussion: str = ""
     error: Optional[str] = None
+    solving_process: Optional[SolvingProcess] = None
 
 
 class Verifier(ABC):
     @abstractmethod
-    def verify(self) -> VerifierOutput:
+    async def averify(self, problem: str, solution: str) -> VerifierOutput:
         pass
+
+    def verify(self, problem: str, solution: str) -> VerifierOutput:
+        """Blocking wrapper around averify for callers without an event loop."""
+        return run_sync(self.averify(problem, solution))
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from utils.transcript import LogLevel, log
+
+T = TypeVar("T")
+
+
+def problem_key(solver_name: str, problem_statement: str) -> str:
+    """Key of one problem's checkpoint within a run."""
+    canonical = json.dumps(
+        {"solver": solver_name, "problem": problem_statement},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CheckpointStore:
+    """
+    SQLite-backed results of completed solver stages, one row per (run id,
+    problem, stage). Safe to share between threads and event loops.
+    """
+
+    def __init__(self, path: str = "solver_checkpoints.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS stages (
+                run_id TEXT NOT NULL,
+                problem TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                value TEXT NOT NULL,
+                saved REAL NOT NULL,
+                PRIMARY KEY (run_id, problem, stage)
+            )
+        """)
+
+    def load(self, run_id: str, problem: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, value FROM stages WHERE run_id = ? AND problem = ?", (run_id, problem)
+            ).fetchall()
+        return {stage: json.loads(value) for stage, value in rows}
+
+    def save(self, run_id: str, problem: str, stage: str, value: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stages (run_id, problem, stage, value, saved) VALUES (?, ?, ?, ?, ?)",
+                (run_id, problem, stage, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+
+    def clear(self, run_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM stages WHERE run_id = ?", (run_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class Checkpoint:
+    """
+    The completed stages of one problem in one run.
+
+    A solver wraps each stage in stage(); its result is saved as soon as it
+    is done, and a rerun with the same run id gets it back instead of making
+    the stage's model calls again. Without a store every stage just runs.
+    """
+
+    def __init__(
+        self,
+        store: Optional[CheckpointStore] = None,
+        run_id: Optional[str] = None,
+        problem: Optional[str] = None,
+        stages: Optional[Dict[str, Any]] = None,
+        prefix: str = "",
+    ):
+        self.store = store
+        self.run_id = run_id
+        self.problem = problem
+        # Encoded results by stage name, shared with every scoped() view
+        self.stages = stages if stages is not None else {}
+        self.prefix = prefix
+
+    def scoped(self, prefix: str) -> "Checkpoint":
+        """A view whose stage names start with `prefix`, e.g. one per round."""
+        return Checkpoint(self.store, self.run_id, self.problem, self.stages, f"{self.prefix}{prefix}/")
+
+    async def stage(
+        self,
+        name: str,
+        compute: Callable[[], Awaitable[T]],
+        encode: Callable[[T], Any] = lambda value: value,
+        decode: Callable[[Any], T] = lambda value: value,
+        complete: Callable[[T], bool] = lambda value: True,
+    ) -> T:
+        """
+        The result of stage `name`: the saved one if there is one, else `compute()`.
+
+        `encode`/`decode` convert the result to and from JSON; results that
+        `complete` rejects (e.g. ones carrying an error) are not saved, so a
+        rerun tries them again.
+        """
+        name = self.prefix + name
+        if name in self.stages:
+            log(LogLevel.DEBUG, "stage_resumed", f"Resuming {name} from checkpoint", stage=name)
+            return decode(self.stages[name])
+        value = await compute()
+        if self.store is not None and complete(value):
+            encoded = encode(value)
+            self.stages[name] = encoded
+            await asyncio.to_thread(self.store.save, self.run_id, self.problem, name, encoded)
+        return value
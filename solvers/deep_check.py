@@ -1,185 +1,274 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import contextvars
+from typing import Optional
 import openai
-from solvers.base import Solver, Verdict, Verifier, VerifierOutput
-from utils.model import Model, ModelName
+from database.db import SolutionType
+from solvers.base import Solver, Verdict, Verifier, VerifierOutput, solving_process_from_trace
+from solvers.segment_cache import SegmentVerdictCache, segment_check_key
+from utils.aio import run_sync
+from utils.cancellation import CancelToken
+from utils.model import Model, ModelName, stop_on
 from utils.prompts import Prompts
+from utils.reasoning import ReasoningPolicy, downstream_text
+from utils.scheduler import Priority, priority
+from utils.tracing import step, trace_calls
+from utils.transcript import LogLevel, log
 import re
 
 
+# Start of each "Segment N:" block in the proof divider's output
+SEGMENT_HEADER = re.compile(r"Segment \d+:")
+
+
+def segment_check_prefix(problem: str, proof_fragments: list[str]) -> str:
+    """
+    Problem and segments 1..n, the part of a check's prompt shared with other checks.
+
+    A check of segment k sends segments 1..k, so its prompt starts with the
+    same bytes as every later check's and providers can reuse the cached prefix.
+    """
+    segments = "\n\n".join(
+        f"Segment {j + 1}: {fragment}" for j, fragment in enumerate(proof_fragments)
+    )
+    return f"Problem Statement: {problem}\n\nProof segments:\n\n{segments}\n\n"
+
+
+def segment_check_task(index: int) -> str:
+    """The short suffix asking to verify segment `index` (0-based)."""
+    if index == 0:
+        return Prompts.PROOF_SEGMENT_CHECK_FIRST_SEGMENT_TASK.value["content"]
+    return Prompts.PROOF_SEGMENT_CHECK_NEXT_SEGMENT_TASK.value["content"].format(
+        previous=index, index=index + 1
+    )
+
+
+def segment_check_tasks(segment_count: int) -> list[str]:
+    """The short suffix of each check: one per segment, then the goal check."""
+    return [segment_check_task(i) for i in range(segment_count)] + [
+        Prompts.PROOF_SEGMENT_CHECK_GOAL_TASK.value["content"]
+    ]
+
+
+class ProofSegmentParser:
+    """
+    Splits the proof divider's output into segments while it is streaming.
+
+    A segment is complete once the next "Segment N:" header has arrived; the
+    last one only when the stream ends. Matches what re.findall with
+    "Segment \\d+:\\s*(.*?)\\s*(?=Segment \\d+:|$)" gives on the full text.
+    """
+
+    def __init__(self):
+        # Text from the start of the segment currently being streamed
+        self._pending = ""
+
+    def feed(self, delta: str) -> list[str]:
+        """Add a content delta; returns the segments it completed."""
+        self._pending += delta
+        headers = list(SEGMENT_HEADER.finditer(self._pending))
+        if not headers:
+            # Keep only what could still become the first header
+            self._pending = self._pending[-len("Segment 999:"):]
+            return []
+        completed = [
+            self._pending[header.end():following.start()].strip()
+            for header, following in zip(headers, headers[1:])
+        ]
+        self._pending = self._pending[headers[-1].start():]
+        return completed
+
+    def finish(self) -> list[str]:
+        """The last segment, once the stream has ended."""
+        pending, self._pending = self._pending, ""
+        header = SEGMENT_HEADER.match(pending)
+        return [pending[header.end():].strip()] if header else []
+
 class DeepCheck(Verifier):
-    
-    def verify(self, problem: str, solution: str) -> VerifierOutput:
+    def __init__(
+        self,
+        proof_divider_model: Optional[Model] = None,
+        segment_verifier_model: Optional[Model] = None,
+        segment_cache: Optional[SegmentVerdictCache] = None,
+        reasoning_policy: ReasoningPolicy = ReasoningPolicy.KEEP,
+        max_reasoning_tokens: int = 2000,
+    ):
+        self.proof_divider_model = proof_divider_model or Model(ModelName.O3_MINI_HIGH)
+        self.segment_verifier_model = segment_verifier_model or Model(ModelName.DEEPSEEK)
+        # Reuses verdicts of checks already made for other candidates, rounds or runs
+        self.segment_cache = segment_cache
+        # Thinking of the solution (and of the checks, in the discussion) passed on, see SolverProperties
+        self.reasoning_policy = reasoning_policy
+        self.max_reasoning_tokens = max_reasoning_tokens
+
+    def _downstream(self, response: str) -> str:
+        return downstream_text(response, self.reasoning_policy, self.max_reasoning_tokens)
+
+    async def averify(self, problem: str, solution: str) -> VerifierOutput:
+        with trace_calls() as trace:
+            output = await self._averify(problem, solution)
+        output.solving_process = solving_process_from_trace(trace)
+        cached = [call.cached_prompt_tokens for call in trace.calls if call.cached_prompt_tokens is not None]
+        if cached:
+            prompt_tokens = sum(call.prompt_tokens or 0 for call in trace.calls)
+            log(
+                LogLevel.INFO, "deep_check_prompt_cache",
+                f"Deep check: {sum(cached)}/{prompt_tokens} prompt tokens served from the provider's cache",
+                cached_prompt_tokens=sum(cached), prompt_tokens=prompt_tokens,
+            )
+        return output
+
+    async def _averify(self, problem: str, solution: str) -> VerifierOutput:
         try:
             proof_divider_conversation = [
                 Prompts.PROOF_DIVIDER_SYSTEM_PROMPT.value,
                 {
                     "role": "user",
-                    "content": f"Problem: {problem}\n\nSolution to fragment: {solution}",
+                    "content": f"Problem: {problem}\n\nSolution to fragment: {self._downstream(solution)}",
                 },
             ]
-            proof_divider_response = Model(ModelName.O3_MINI_HIGH).send_request(
-                proof_divider_conversation
-            )
-            print("Proof divider response: ", proof_divider_response)
+            model = self.segment_verifier_model
+            proof_fragments: list[str] = []
+            parser = ProofSegmentParser()
+            responses: dict[int, str] = {}
+            verdict = Verdict.CORRECT
 
-            proof_fragments: list[str] = re.findall(
-                r"Segment \d+:\s*(.*?)\s*(?=Segment \d+:|$)",
-                proof_divider_response,
-                re.DOTALL,
-            )
+            # Helper function to check if a response indicates incorrect solution
+            def is_incorrect(response):
+                return ("SOLUTION INCORRECT" in response) or ("SEGMENT INCORRECT" in response)
 
-            proof_progression_list = (
-                [
-                    f"Problem Statement: {problem}\n\nFirst segment to verify:\n\n{proof_fragments[0]}"
-                ]
-                + [
-                    f"Problem Statement: {problem}\n\n"
-                    + f"Assume that the following segments are correct and fully rigorous (1 to {i + 1}):\n\n"
-                    + "\n\n".join(
-                        [
-                            f"Segment {j + 1}: " + proof_segment
-                            for j, proof_segment in enumerate(
-                                proof_fragments[: (i + 1)]
-                            )
-                        ]
-                    )
-                    + f"\n\nDetermine whether the following logically segment follows from all the segments above:\n\nSegment {i+2}: "
-                    + proof_fragments[i + 1]
-                    for i in range(len(proof_fragments) - 1)
+            # Cancelling the group stops the divider and every check mid-generation
+            group = CancelToken()
+            # Finished divider and check tasks, in completion order
+            finished: asyncio.Queue = asyncio.Queue()
+            running: dict[asyncio.Future, int] = {}
+            # Checks are started from the divider's delta callback; running them in
+            # these contexts keeps them labelled as verification, not proof division.
+            # They are the last step before a solution is accepted, so they go ahead
+            # of fresh reasoning when the scheduler is saturated, the goal check first
+            with step(SolutionType.VERIFICATION.value), priority(Priority.HIGH):
+                check_context = contextvars.copy_context()
+                with priority(Priority.CRITICAL):
+                    goal_context = contextvars.copy_context()
+
+            def dispatch(
+                index: int, prompt: str, key: str, context: contextvars.Context = check_context
+            ) -> None:
+                conversation = [
+                    Prompts.PROOF_SEGMENT_CHECK_SYSTEM_PROMPT.value,
+                    {"role": "user", "content": prompt},
                 ]
-                + [
-                    f"Problem Statement: {problem}\n\n"
-                    + "\n\n".join(
-                        [
-                            f"Segment {j + 1}: " + proof_segment
-                            for j, proof_segment in enumerate(
-                                proof_fragments[: (len(proof_fragments) - 1)]
-                            )
-                        ]
+
+                def check(cancel_token: CancelToken):
+                    return model.asend_request_streaming(
+                        conversation,
+                        cancel_token=cancel_token,
+                        # Abort the generation the moment the verdict appears
+                        stop_when=stop_on("SOLUTION INCORRECT", "SEGMENT INCORRECT"),
                     )
-                    + f"\n\nSegment {len(proof_fragments)}: "
-                    + proof_fragments[len(proof_fragments) - 1]
-                ]
-            )
 
-            proof_segment_verifier_conversations = (
-                [
-                    [
-                        Prompts.PROOF_SEGMENT_VERIFIER_INITIAL_SYSTEM_PROMPT.value,
-                        {
-                            "role": "user",
-                            "content": proof_progression_list[0],
-                        },
-                    ]
-                ]
-                + [
-                    [
-                        Prompts.PROOF_SEGMENT_VERIFIER_SYSTEMP_PROMPT.value,
-                        {
-                            "role": "user",
-                            "content": proof_progression,
-                        },
-                    ]
-                    for proof_progression in proof_progression_list[
-                        1 : len(proof_progression_list) - 1
-                    ]
-                ]
-                + [
-                    [
-                        Prompts.PROOF_ACHEIVES_GOAL_SYSTEM_PROMPT.value,
-                        {
-                            "role": "user",
-                            "content": proof_progression_list[
-                                len(proof_progression_list) - 1
-                            ],
-                        },
-                    ]
-                ]
-            )
+                if self.segment_cache is not None:
+                    request = self.segment_cache.averify(key, check, cancel_token=group)
+                else:
+                    request = check(group)
+                task = context.run(asyncio.ensure_future, request)
+                running[task] = index
+                task.add_done_callback(finished.put_nowait)
 
-            # Use ThreadPoolExecutor with early termination pattern
-            model = Model(ModelName.DEEPSEEK)
-            responses = [None] * len(proof_segment_verifier_conversations)
-            verdict = Verdict.CORRECT
-            
-            # Helper function to check if a response indicates incorrect solution
-            def is_incorrect(response):
-                return ("SOLUTION INCORRECT" in response) or ("SEGMENT INCORRECT" in response)
-            
-            # Process conversations in parallel with streaming to allow cancellation mid-generation
-            with ThreadPoolExecutor() as executor:
-                # Map each future to its index in the original list
-                future_to_idx = {
-                    executor.submit(model.send_request_streaming, conv): idx
-                    for idx, conv in enumerate(proof_segment_verifier_conversations)
-                }
-                
-                # Process results as they complete
-                completed_count = 0
-                total_count = len(future_to_idx)
-                
-                for future in as_completed(future_to_idx):
-                    idx = future_to_idx[future]
-                    completed_count += 1
-                    
+            def dispatch_segment(fragment: str) -> None:
+                # Segment k is checked against segments 1..k as soon as it is complete
+                proof_fragments.append(fragment)
+                index = len(proof_fragments) - 1
+                dispatch(
+                    index,
+                    segment_check_prefix(problem, proof_fragments) + segment_check_task(index),
+                    segment_check_key(model.model_name.value, problem, proof_fragments[:-1], fragment),
+                )
+
+            def on_divider_delta(content: str, reasoning: str) -> None:
+                if verdict == Verdict.CORRECT:
+                    for fragment in parser.feed(content):
+                        dispatch_segment(fragment)
+
+            with step(SolutionType.PROOF_DIVISION.value), priority(Priority.HIGH):
+                divider = asyncio.ensure_future(
+                    self.proof_divider_model.asend_request_streaming(
+                        proof_divider_conversation,
+                        cancel_token=group,
+                        on_delta=on_divider_delta,
+                    )
+                )
+            running[divider] = -1
+            divider.add_done_callback(finished.put_nowait)
+
+            try:
+                while running and verdict == Verdict.CORRECT:
+                    task = await finished.get()
+                    idx = running.pop(task)
+                    if task is divider:
+                        for fragment in parser.finish():
+                            dispatch_segment(fragment)
+                        log(
+                            LogLevel.DEBUG, "proof_divided", f"Proof divided into {len(proof_fragments)} segments",
+                            response=divider.result(),
+                        )
+                        if not proof_fragments:
+                            raise ValueError("Proof divider returned no segments")
+                        # The goal check needs the whole proof, so it starts last
+                        dispatch(
+                            len(proof_fragments),
+                            segment_check_prefix(problem, proof_fragments)
+                            + Prompts.PROOF_SEGMENT_CHECK_GOAL_TASK.value["content"],
+                            segment_check_key(model.model_name.value, problem, proof_fragments, None),
+                            goal_context,
+                        )
+                        continue
                     try:
-                        response = future.result()
+                        response = task.result()
                         responses[idx] = response
-                        print(f"Completed verification {idx+1}/{total_count}")
-                        
-                        # If this segment is incorrect, cancel remaining tasks
+                        log(
+                            LogLevel.DEBUG, "segment_checked",
+                            f"Completed verification {idx+1} ({len(proof_fragments)} segments so far)",
+                            check=idx + 1, response=response,
+                        )
+
                         if is_incorrect(response):
-                            print(f"Verification {idx+1} failed. Stopping early.")
+                            log(LogLevel.INFO, "segment_incorrect", f"Verification {idx+1} failed. Stopping early.", check=idx + 1)
                             verdict = Verdict.INCORRECT
-                            
-                            # Set the cancel flag on the model to stop streaming
-                            model.cancel_stream = True
-                            
-                            # Cancel any pending futures
-                            for fut in future_to_idx:
-                                if not fut.done() and not fut.cancelled():
-                                    fut.cancel()
-                                    
-                            # Fill any None responses with placeholder
-                            for i, resp in enumerate(responses):
-                                if resp is None:
-                                    responses[i] = "[Verification cancelled]"
-                                    
-                            break
-                            
+
                     except Exception as e:
-                        print(f"Error in verification {idx+1}: {e}")
+                        log(LogLevel.WARNING, "segment_check_error", f"Error in verification {idx+1}: {e}", check=idx + 1)
                         responses[idx] = f"[Error: {e}]"
-            
-            # If any responses are None (shouldn't happen but just in case)
-            for i, resp in enumerate(responses):
-                if resp is None:
-                    responses[i] = "[No response]"
-            
-            entire_conversation = "DEEP CHECK:\n\n" + "\n\n".join(
-                [
-                    f"Verification {i + 1}:\n\n{proof_progression_list[i]}\n\n{responses[i]}"
-                    for i in range(len(proof_fragments))
-                ]
-                + [
-                    f"Checking whether Goal of Problem if Met:\n\n{proof_progression_list[len(proof_fragments)]}\n\n{responses[len(proof_fragments)]}"
-                ]
+            finally:
+                # Closes the HTTP stream of the divider and every check still running
+                group.cancel()
+                if running:
+                    await asyncio.gather(*running, return_exceptions=True)
+
+            check_tasks = segment_check_tasks(len(proof_fragments))
+            default = "[Verification cancelled]" if verdict == Verdict.INCORRECT else "[No response]"
+            verifications = [responses.get(i, default) for i in range(len(check_tasks))]
+
+            entire_conversation = (
+                f"DEEP CHECK:\n\n{segment_check_prefix(problem, proof_fragments)}"
+                + "\n\n".join(
+                    f"Verification {i + 1}:\n\n{check_task}\n\n{self._downstream(verifications[i])}"
+                    for i, check_task in enumerate(check_tasks)
+                )
             )
-            return VerifierOutput(responses, verdict, entire_conversation)
+            return VerifierOutput(verifications, verdict, entire_conversation)
 
         except openai.APIError as e:
-            print(f"OpenAI API error: {e}")
+            log(LogLevel.ERROR, "deep_check_error", f"OpenAI API error: {e}", error=str(e))
             return VerifierOutput(error=f"{e}")
         except Exception as e:
-            print(f"Unexpected error: {e}")
+            log(LogLevel.ERROR, "deep_check_error", f"Unexpected error: {e}", error=str(e))
             return VerifierOutput(error=f"{e}")
 
 
-    def verify_parallel(self, problems: str, solutions: str) -> list[bool]:
-        with ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(self.check, problems[i], solutions[i])
-                for i in range(len(problems))
-            ]
-            results = [future.result() for future in futures]
-        return results
+    async def averify_parallel(self, problems: list[str], solutions: list[str]) -> list[VerifierOutput]:
+        return await asyncio.gather(
+            *(self.averify(problems[i], solutions[i]) for i in range(len(problems)))
+        )
+
+    def verify_parallel(self, problems: list[str], solutions: list[str]) -> list[VerifierOutput]:
+        return run_sync(self.averify_parallel(problems, solutions))
@@ -1,6 +1,10 @@
 import openai
+from database.db import SolutionType
 from utils.prompts import Prompts
-from . import Solver
+from utils.scheduler import Priority, priority
+from utils.tracing import step
+from utils.transcript import LogLevel, log
+from .base import Solver, SolverResult
 
 class Feedback(Solver):
     def validate_input(self, problem_statement) -> None:
@@ -11,9 +15,10 @@ class Feedback(Solver):
         if self.properties.max_verifier_passes <= 0:
             raise ValueError("max_verifier_passes must be positive")
 
-    def run(self, problem_statement: str) -> str:
+    async def _arun(self, problem_statement: str) -> SolverResult:
         try:
             self.validate_input(problem_statement)
+            checkpoint = await self._checkpoint(problem_statement)
             reasoner_conversation = [
                 Prompts.REASONER_INITIAL_SYSTEM_PROMPT.value,
                 {
@@ -21,25 +26,30 @@ class Feedback(Solver):
                     "content": f"Math Olympiad Problem: {problem_statement}",
                 },
             ]
-            for _ in range(self.properties.max_reasoning_tries):
-                reasoner_response = self.properties.reasoner_model.send_request(
-                    reasoner_conversation
+            for attempt in range(self.properties.max_reasoning_tries):
+                if attempt and self._out_of_budget():
+                    break
+                attempt_checkpoint = checkpoint.scoped(f"attempt {attempt}")
+                with step(SolutionType.REASONING.value), priority(Priority.LOW):
+                    reasoner_response = await attempt_checkpoint.stage(
+                        "reasoning",
+                        lambda: self.properties.reasoner_model.asend_request(reasoner_conversation),
+                    )
+                # Goes into every verifier pass, and the partial-progress request after them
+                solution = self._downstream(
+                    reasoner_response, uses=self._scaled(self.properties.max_verifier_passes) + 1
                 )
                 verifier_conversation = [
                     Prompts.VERIFIER_SYSTEM_PROMPT.value,
                     {
                         "role": "user",
-                        "content": f"Problem: {problem_statement}\nPotential Solution: {reasoner_response}",
+                        "content": f"Problem: {problem_statement}\nPotential Solution: {solution}",
                     },
                 ]
-                solution_incorrect = False
-                for _ in range(self.properties.max_verifier_passes):
-                    verifier_response = self.properties.verifier_model.send_request(
-                        verifier_conversation
+                with step(SolutionType.VERIFICATION.value):
+                    solution_incorrect = await attempt_checkpoint.stage(
+                        "verification", lambda: self._solution_incorrect(verifier_conversation)
                     )
-                    if "SOLUTION INCORRECT" in verifier_response:
-                        solution_incorrect = True
-                        break
 
                 if not solution_incorrect:
                     break
@@ -47,9 +57,10 @@ class Feedback(Solver):
                 verifier_conversation.append(
                     Prompts.VERIFIER_PARTIAL_PROGRESS_PROMPT.value
                 )
-                partial_progress = self.properties.verifier_model.send_request(
-                    verifier_conversation
-                )
+                with step(SolutionType.PARTIAL_SOLUTION.value):
+                    partial_progress = await attempt_checkpoint.stage(
+                        "partial progress", lambda: self._verifier().asend_request(verifier_conversation)
+                    )
                 reasoner_conversation = [
                     Prompts.REASONER_SYSTEM_PROMPT.value,
                     {
@@ -58,9 +69,11 @@ class Feedback(Solver):
                     },
                 ]
         
-            return reasoner_response
+            return SolverResult(answer=reasoner_response, solved=not solution_incorrect)
 
         except openai.APIError as e:
-            print(f"OpenAI API error: {e}")
+            log(LogLevel.ERROR, "solver_error", f"OpenAI API error: {e}", error=str(e))
+            return SolverResult(error=f"{e}")
         except Exception as e:
-            print(f"Unexpected error: {e}")
+            log(LogLevel.ERROR, "solver_error", f"Unexpected error: {e}", error=str(e))
+            return SolverResult(error=f"{e}")
@@ -1,18 +1,54 @@
 from dataclasses import dataclass, field
 from enum import Enum
+from typing import Any, Callable, Dict, Optional
+import asyncio
 import openai
-from concurrent.futures import ThreadPoolExecutor
-from solvers.base import Solver, Verifier, VerifierOutput
+from database.db import SolutionType
+from solvers.base import Solver, SolverResult, Verifier, VerifierOutput
+from solvers.checkpoint import Checkpoint
 from solvers.deep_check import DeepCheck
+from solvers.segment_cache import SegmentVerdictCache
 from utils.prompts import Prompts
+from utils.scheduler import Priority, priority
+from utils.tracing import step
+from utils.transcript import LogLevel, log
 from solvers.base import Verdict
 
 
+def _verification_to_dict(verification: VerifierOutput) -> Dict[str, Any]:
+    return {
+        "verifications": verification.verifications,
+        "verdict": verification.verdict.value,
+        "entire_discussion": verification.entire_discussion,
+        "error": verification.error,
+    }
+
+
+def _verification_from_dict(data: Dict[str, Any]) -> VerifierOutput:
+    return VerifierOutput(
+        verifications=data["verifications"],
+        verdict=Verdict(data["verdict"]),
+        entire_discussion=data["entire_discussion"],
+        error=data["error"],
+    )
+
+
 @dataclass
 class VerifiedSolution:
     solution: str
     verification: VerifierOutput
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {"solution": self.solution, "verification": _verification_to_dict(self.verification)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "VerifiedSolution":
+        return cls(data["solution"], _verification_from_dict(data["verification"]))
+
+
+# Called with a candidate's index in the round once its verdict can no longer change
+OnFinal = Callable[[int, VerifiedSolution], None]
+
 
 class FeedbackAndCondensed(Solver):
     def validate_input(self, problem_statement) -> None:
@@ -25,11 +61,300 @@ class FeedbackAndCondensed(Solver):
         if self.properties.parallel_reasoning_tries <= 0:
             raise ValueError("parallel_reasoning_tries must be positive")
 
-    def run(self, problem_statement: str, light_check: bool = True) -> str:
-        file = open("output7.txt", "a")
+    def _deep_check(self, segment_cache: SegmentVerdictCache) -> DeepCheck:
+        return DeepCheck(
+            self.properties.proof_divider_model,
+            self.properties.segment_verifier_model,
+            segment_cache,
+            self.properties.reasoning_policy,
+            self.properties.max_reasoning_tokens,
+        )
+
+    async def _round(
+        self,
+        problem_statement: str,
+        reasoner_conversation,
+        segment_cache: SegmentVerdictCache,
+        light_check: bool,
+        on_final: Optional[OnFinal] = None,
+        checkpoint: Optional[Checkpoint] = None,
+    ) -> dict[int, VerifiedSolution]:
+        """One round in stages: all reasoning, then each light-verification pass, then all deep checks."""
+        checkpoint = checkpoint or Checkpoint()
+        with step(SolutionType.REASONING.value), priority(Priority.LOW):
+            responses = await checkpoint.stage(
+                "reasoning",
+                lambda: self.properties.reasoner_model.asend_request_times(
+                    reasoner_conversation, self._scaled(self.properties.parallel_reasoning_tries)
+                ),
+            )
+        log(LogLevel.DEBUG, "reasoning_done", f"Reasoning done ({len(responses)} candidates)")
+        response_objects = [
+            VerifiedSolution(solution=response, verification=VerifierOutput())
+            for response in responses
+        ]
+        ###
+        if light_check:
+            verifier_model = self._verifier()
+            for i in range(self._scaled(self.properties.max_verifier_passes)):
+                verifier_conversations = [
+                    [
+                        Prompts.VERIFIER_SYSTEM_PROMPT.value,
+                        {
+                            "role": "user",
+                            "content": f"Problem: {problem_statement}\nPotential Solution: {self._downstream(response_object.solution)}",
+                        },
+                    ]
+                    for response_object in response_objects
+                    if response_object.verification.verdict == Verdict.UNKNOWN
+                ]
+                log(
+                    LogLevel.DEBUG, "light_verification",
+                    f"Verifier pass {i + 1}: {len(verifier_conversations)} candidates",
+                    verifier_pass=i + 1, candidates=len(verifier_conversations),
+                )
+                with step(SolutionType.VERIFICATION.value):
+                    verifier_responses = await checkpoint.stage(
+                        f"verifier pass {i}",
+                        lambda: verifier_model.asend_request_parallel(
+                            verifier_conversations, sample_index=i
+                        ),
+                    )
+                verifier_index = 0
+                for idx, response_object in enumerate(response_objects):
+                    if response_object.verification.verdict == Verdict.UNKNOWN:
+                        response_object.verification.verifications.append(
+                            verifier_responses[verifier_index]
+                        )
+                        if (
+                            "SOLUTION INCORRECT"
+                            in verifier_responses[verifier_index]
+                        ):
+                            response_object.verification.verdict = Verdict.INCORRECT
+                            if on_final is not None:
+                                on_final(idx, response_object)
+                        verifier_index += 1
+        ###
+
+        for response_object in response_objects:
+            if response_object.verification.verdict == Verdict.UNKNOWN:
+                response_object.verification.verdict = Verdict.CORRECT
+        # Perform deep checking in parallel for all solutions with Verdict.CORRECT
+        correct_solutions = [
+            response_object for response_object in response_objects
+            if response_object.verification.verdict == Verdict.CORRECT
+        ]
+
+        async def deep_check(idx: int, response_object: VerifiedSolution) -> None:
+            deep_check_response = await checkpoint.stage(
+                f"deep check {idx}",
+                lambda: self._deep_check(segment_cache).averify(
+                    problem_statement,
+                    response_object.solution
+                ),
+                _verification_to_dict,
+                _verification_from_dict,
+                # A deep check that failed with an error is tried again on a rerun
+                complete=lambda output: output.error is None,
+            )
+            # Update the response object with the deep check result as soon as it is in
+            response_object.verification.verdict = deep_check_response.verdict
+            response_object.verification.verifications.extend(
+                deep_check_response.verifications
+            )
+            response_object.verification.entire_discussion = (
+                deep_check_response.entire_discussion
+            )
+            if on_final is not None:
+                on_final(idx, response_object)
+
+        if correct_solutions:
+            await asyncio.gather(
+                *(
+                    deep_check(idx, response_object)
+                    for idx, response_object in enumerate(response_objects)
+                    if response_object.verification.verdict == Verdict.CORRECT
+                )
+            )
+        self._log_verdicts(response_objects)
+        return dict(enumerate(response_objects))
+
+    async def _candidate(
+        self,
+        problem_statement: str,
+        reasoner_conversation,
+        index: int,
+        segment_cache: SegmentVerdictCache,
+        light_check: bool,
+        checkpoint: Checkpoint,
+    ) -> VerifiedSolution:
+        """Reason, light-verify and deep-check one candidate, stopping at its first INCORRECT verdict."""
+        with step(SolutionType.REASONING.value), priority(Priority.LOW):
+            solution = await checkpoint.stage(
+                f"candidate {index} reasoning",
+                lambda: self.properties.reasoner_model.asend_request(
+                    reasoner_conversation, sample_index=index
+                ),
+            )
+        response_object = VerifiedSolution(solution=solution, verification=VerifierOutput())
+        verification = response_object.verification
+        if light_check:
+            passes = self._scaled(self.properties.max_verifier_passes)
+            verifier_conversation = [
+                Prompts.VERIFIER_SYSTEM_PROMPT.value,
+                {
+                    "role": "user",
+                    "content": f"Problem: {problem_statement}\nPotential Solution: {self._downstream(solution, uses=passes)}",
+                },
+            ]
+            verifier_model = self._verifier()
+            for i in range(passes):
+                with step(SolutionType.VERIFICATION.value):
+                    verifier_response = await verifier_model.asend_request(
+                        verifier_conversation, sample_index=i
+                    )
+                verification.verifications.append(verifier_response)
+                if "SOLUTION INCORRECT" in verifier_response:
+                    verification.verdict = Verdict.INCORRECT
+                    return response_object
+
+        deep_check_response = await self._deep_check(segment_cache).averify(problem_statement, solution)
+        verification.verdict = deep_check_response.verdict
+        verification.verifications.extend(deep_check_response.verifications)
+        verification.entire_discussion = deep_check_response.entire_discussion
+        # Keeps an errored deep check out of the checkpoint, so a rerun tries it again
+        verification.error = deep_check_response.error
+        return response_object
+
+    async def _pipelined_round(
+        self,
+        problem_statement: str,
+        reasoner_conversation,
+        segment_cache: SegmentVerdictCache,
+        light_check: bool,
+        on_final: Optional[OnFinal] = None,
+        checkpoint: Optional[Checkpoint] = None,
+    ) -> dict[int, VerifiedSolution]:
+        """
+        One round where each candidate moves on to verification as soon as its own
+        reasoning is done; the round stops, cancelling everything still running,
+        at the first candidate confirmed CORRECT. Candidates that failed or were
+        cancelled are missing from the result.
+        """
+        checkpoint = checkpoint or Checkpoint()
+
+        async def candidate(index: int) -> tuple[int, VerifiedSolution]:
+            # Candidates finish in any order; the index keeps labels and stage names stable
+            return index, await checkpoint.stage(
+                f"candidate {index}",
+                lambda: self._candidate(
+                    problem_statement, reasoner_conversation, index, segment_cache, light_check, checkpoint
+                ),
+                VerifiedSolution.to_dict,
+                VerifiedSolution.from_dict,
+                complete=lambda response_object: response_object.verification.error is None,
+            )
+
+        tasks = [
+            asyncio.ensure_future(candidate(i))
+            for i in range(self._scaled(self.properties.parallel_reasoning_tries))
+        ]
+        response_objects: dict[int, VerifiedSolution] = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    index, response_object = await next_done
+                except Exception as e:
+                    log(LogLevel.ERROR, "candidate_error", f"Error in candidate: {e}", error=str(e))
+                    continue
+                response_objects[index] = response_object
+                if on_final is not None:
+                    on_final(index, response_object)
+                if response_object.verification.verdict == Verdict.CORRECT:
+                    log(LogLevel.INFO, "candidate_correct", "Candidate confirmed correct, cancelling the rest of the round")
+                    break
+        finally:
+            # Cancelling a candidate closes whichever request it is waiting on
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        response_objects = dict(sorted(response_objects.items()))
+        self._log_verdicts(list(response_objects.values()))
+        return response_objects
+
+    @staticmethod
+    def _log_verdicts(response_objects: list[VerifiedSolution]) -> None:
+        verdicts = [
+            response_object.verification.verdict.value
+            for response_object in response_objects
+        ]
+        log(LogLevel.INFO, "round_verdicts", f"Verdicts: {verdicts}", verdicts=verdicts)
+
+    def _candidate_discussion(self, idx: int, response_object: VerifiedSolution) -> str:
+        """A candidate's attempt, its verifications and its deep-check transcript, as the condenser sees them."""
+        return (
+            f"Reasoner's Attempt {idx}: {self._downstream(response_object.solution)}\nVerifications: \n"
+            + "\n\n".join(
+                [
+                    f"Verification {i+1}: {self._downstream(s)}"
+                    for i, s in enumerate(
+                        response_object.verification.verifications
+                    )
+                ]
+            )
+        ) + response_object.verification.entire_discussion
+
+    async def _condense_candidate(self, discussion: str) -> str:
+        with step(SolutionType.CONDENSATION.value):
+            return await self.properties.discussion_condenser_model.asend_request(
+                [
+                    Prompts.CONDENSE_ATTEMPT_PROMPT.value,
+                    {
+                        "role": "user",
+                        "content": discussion,
+                    },
+                ]
+            )
+
+    async def _condense(self, entire_discussion: str, condensations: dict[int, asyncio.Future]) -> str:
+        """
+        Reduce step: merge the per-candidate reports in one short call. Falls back to
+        condensing `entire_discussion` in one call when there are no reports.
+        """
+        reports = []
+        for idx in sorted(condensations):
+            try:
+                reports.append((idx, await condensations[idx]))
+            except Exception as e:
+                log(LogLevel.WARNING, "condensation_error", f"Error condensing attempt {idx}: {e}", attempt=idx)
+        if len(reports) == 1:
+            return reports[0][1]
+        if reports:
+            prompt = Prompts.MERGE_CONDENSED_ATTEMPTS_PROMPT.value
+            discussion = "\n\n\n".join(
+                f"Report on Reasoner's Attempt {idx}:\n{report}" for idx, report in reports
+            )
+        else:
+            prompt = Prompts.CONDENSE_ENTIRE_DISCUSSION_PROMPT.value
+            discussion = entire_discussion
+        with step(SolutionType.CONDENSATION.value):
+            return await self.properties.discussion_condenser_model.asend_request(
+                [
+                    prompt,
+                    {
+                        "role": "user",
+                        "content": discussion,
+                    },
+                ]
+            )
+
+    async def _arun(self, problem_statement: str, light_check: bool = True) -> SolverResult:
         try:
             problem_solved = False
             self.validate_input(problem_statement)
+            # Candidates often open with the same lemmas; check each such segment once
+            segment_cache = self.properties.segment_verdict_cache or SegmentVerdictCache()
+            checkpoint = await self._checkpoint(problem_statement)
             reasoner_conversation = [
                 Prompts.REASONER_INITIAL_SYSTEM_PROMPT.value,
                 {
@@ -37,136 +362,78 @@ class FeedbackAndCondensed(Solver):
                     "content": f"Math Olympiad Problem: {problem_statement}",
                 },
             ]
-            for _ in range(self.properties.max_reasoning_tries):
-                responses = self.properties.reasoner_model.send_request_times(
-                    reasoner_conversation, self.properties.parallel_reasoning_tries
-                )
-                print("Reasoning done!")
-                response_objects = [
-                    VerifiedSolution(solution=response, verification=VerifierOutput())
-                    for response in responses
-                ]
-                ###
-                if light_check:
-                    for i in range(self.properties.max_verifier_passes):
-                        print("Verifying..." + str(i))
-                        verifier_conversations = [
-                            [
-                                Prompts.VERIFIER_SYSTEM_PROMPT.value,
-                                {
-                                    "role": "user",
-                                    "content": f"Problem: {problem_statement}\nPotential Solution: {response_object.solution}",
-                                },
-                            ]
-                            for response_object in response_objects
-                            if response_object.verification.verdict == Verdict.UNKNOWN
-                        ]
-                        print(len(verifier_conversations))
-                        verifier_responses = (
-                            self.properties.verifier_model.send_request_parallel(
-                                verifier_conversations
-                            )
-                        )
-                        verifier_index = 0
-                        for response_object in response_objects:
-                            if response_object.verification.verdict == Verdict.UNKNOWN:
-                                if (
-                                    "SOLUTION INCORRECT"
-                                    in verifier_responses[verifier_index]
-                                ):
-                                    response_object.verification.verdict = Verdict.INCORRECT
-                                response_object.verification.verifications.append(
-                                    verifier_responses[verifier_index]
-                                )
-                                verifier_index += 1
-                ###
-
-                for response_object in response_objects:
-                    if response_object.verification.verdict == Verdict.UNKNOWN:
-                        response_object.verification.verdict = Verdict.CORRECT
-                # Perform deep checking in parallel for all solutions with Verdict.CORRECT
-                correct_solutions = [
-                    response_object for response_object in response_objects
-                    if response_object.verification.verdict == Verdict.CORRECT
-                ]
+            for round_index in range(self.properties.max_reasoning_tries):
+                # Later rounds shrink their fan-out as the budget runs down, and stop once it is spent
+                if round_index and self._out_of_budget():
+                    break
+                round_checkpoint = checkpoint.scoped(f"round {round_index}")
+                # Map step of the condensation: each failed candidate is condensed while the
+                # rest of the round is still being verified
+                condensations: dict[int, asyncio.Future] = {}
 
-                if correct_solutions:
-                    with ThreadPoolExecutor() as executor:
-                        futures = [
-                            executor.submit(
-                                DeepCheck().verify,
-                                problem_statement, 
-                                response_object.solution
-                            )
-                            for response_object in correct_solutions
-                        ]
-                        deep_check_responses = [future.result() for future in futures]
-
-                    # Update the response objects with the deep check results
-                    deep_check_idx = 0
-                    for response_object in response_objects:
-                        if response_object.verification.verdict == Verdict.CORRECT:
-                            deep_check_response = deep_check_responses[deep_check_idx]
-                            response_object.verification.verdict = deep_check_response.verdict
-                            response_object.verification.verifications.extend(
-                                deep_check_response.verifications
+                def condense_when_final(idx: int, response_object: VerifiedSolution) -> None:
+                    if response_object.verification.verdict != Verdict.CORRECT:
+                        discussion = self._candidate_discussion(idx, response_object)
+                        condensations[idx] = asyncio.ensure_future(
+                            round_checkpoint.stage(
+                                f"condensation {idx}", lambda: self._condense_candidate(discussion)
                             )
-                            response_object.verification.entire_discussion = (
-                                deep_check_response.entire_discussion
-                            )
-                            deep_check_idx += 1
-                print(
-                    [
-                        response_object.verification.verdict.value
-                        for response_object in response_objects
-                    ]
-                )
-
-                correct_responses = [
-                    response_object
-                    for response_object in response_objects
-                    if response_object.verification.verdict == Verdict.CORRECT
-                ]
+                        )
 
-                for idx, response_object in enumerate(response_objects):
-                    response_object.verification.entire_discussion = (
-                        f"Reasoner's Attempt {idx}: {response_object.solution}\nVerifications: \n"
-                        + "\n\n".join(
-                            [
-                                f"Verification {i+1}: {s}"
-                                for i, s in enumerate(
-                                    response_object.verification.verifications
-                                )
-                            ]
+                on_final = condense_when_final if self.properties.condense_per_candidate else None
+                try:
+                    if self.properties.pipelined_rounds:
+                        response_objects = await self._pipelined_round(
+                            problem_statement, reasoner_conversation, segment_cache, light_check, on_final,
+                            round_checkpoint,
+                        )
+                    else:
+                        response_objects = await self._round(
+                            problem_statement, reasoner_conversation, segment_cache, light_check, on_final,
+                            round_checkpoint,
                         )
-                    ) + response_object.verification.entire_discussion
 
-                entire_discussion = "\n\n\n".join(
-                    [
-                        response_object.verification.entire_discussion
-                        for response_object in response_objects
+                    correct_responses = [
+                        response_object
+                        for response_object in response_objects.values()
+                        if response_object.verification.verdict == Verdict.CORRECT
                     ]
-                )
-
-                file.write(entire_discussion)
 
-                if correct_responses:
-                    problem_solved = True
-                    return correct_responses[0].solution
+                    for idx, response_object in response_objects.items():
+                        response_object.verification.entire_discussion = self._candidate_discussion(
+                            idx, response_object
+                        )
 
-                condensed_discussion = (
-                    self.properties.discussion_condenser_model.send_request(
+                    entire_discussion = "\n\n\n".join(
                         [
-                            Prompts.CONDENSE_ENTIRE_DISCUSSION_PROMPT.value,
-                            {
-                                "role": "user",
-                                "content": entire_discussion,
-                            },
+                            response_object.verification.entire_discussion
+                            for response_object in response_objects.values()
                         ]
                     )
-                )
 
-                file.write("\n\nCondensed discussion:" + condensed_discussion + "\n\n")
+                    log(
+                        LogLevel.INFO, "round_discussion",
+                        f"Round {round_index + 1}: {len(response_objects)} candidates, {len(correct_responses)} correct",
+                        round=round_index + 1, discussion=entire_discussion,
+                    )
+
+                    if correct_responses:
+                        problem_solved = True
+                        return SolverResult(answer=correct_responses[0].solution, solved=True)
+
+                    condensed_discussion = await round_checkpoint.stage(
+                        "condensed discussion", lambda: self._condense(entire_discussion, condensations)
+                    )
+                finally:
+                    # A solved round (or an error) leaves the map step's reports unused
+                    for task in condensations.values():
+                        task.cancel()
+                    await asyncio.gather(*condensations.values(), return_exceptions=True)
+
+                log(
+                    LogLevel.INFO, "condensed_discussion", f"Round {round_index + 1} condensed",
+                    round=round_index + 1, condensed_discussion=condensed_discussion,
+                )
 
                 reasoner_conversation = [
                     Prompts.REASONER_CONDENSED_DISCUSSION_PROMPT.value,
@@ -176,9 +443,13 @@ class FeedbackAndCondensed(Solver):
                     },
                 ]
 
-            return f"Couldn't solve problem. Here's a summary of what we tried:\n{condensed_discussion}"
+            return SolverResult(
+                answer=f"Couldn't solve problem. Here's a summary of what we tried:\n{condensed_discussion}"
+            )
 
         except openai.APIError as e:
-            print(f"OpenAI API error: {e}")
+            log(LogLevel.ERROR, "solver_error", f"OpenAI API error: {e}", error=str(e))
+            return SolverResult(error=f"{e}")
         except Exception as e:
-            print(f"Unexpected error: {e}")
+            log(LogLevel.ERROR, "solver_error", f"Unexpected error: {e}", error=str(e))
+            return SolverResult(error=f"{e}")
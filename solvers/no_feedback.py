@@ -1,6 +1,10 @@
 import openai
+from database.db import SolutionType
 from utils.prompts import Prompts
-from . import Solver
+from utils.scheduler import Priority, priority
+from utils.tracing import step
+from utils.transcript import LogLevel, log
+from .base import Solver, SolverResult
 
 class NoFeedback(Solver):
     def validate_input(self, problem_statement) -> None:
@@ -12,10 +16,12 @@ class NoFeedback(Solver):
         if self.properties.max_verifier_passes <= 0:
             raise ValueError("max_verifier_passes must be positive")
 
-    def run(self, problem_statement: str) -> str:
+    async def _arun(self, problem_statement: str) -> SolverResult:
         try:
             self.validate_input(problem_statement)
             for reasoner_trial in range(self.properties.max_reasoning_tries):
+                if reasoner_trial and self._out_of_budget():
+                    break
                 reasoner_conversation = [
                     Prompts.REASONER_INITIAL_SYSTEM_PROMPT.value,
                     {
@@ -23,32 +29,33 @@ class NoFeedback(Solver):
                         "content": f"Math Olympiad Problem: {problem_statement}",
                     },
                 ]
-                reasoner_response = self.properties.reasoner_model.send_request(
-                    reasoner_conversation
+                with step(SolutionType.REASONING.value), priority(Priority.LOW):
+                    reasoner_response = await self.properties.reasoner_model.asend_request(
+                        reasoner_conversation, sample_index=reasoner_trial
+                    )
+                # Goes into every verifier pass
+                solution = self._downstream(
+                    reasoner_response, uses=self._scaled(self.properties.max_verifier_passes)
                 )
                 verifier_conversation = [
                     Prompts.VERIFIER_SYSTEM_PROMPT.value,
                     {
                         "role": "user",
-                        "content": f"Problem: {problem_statement}\nPotential Solution: {reasoner_response}",
+                        "content": f"Problem: {problem_statement}\nPotential Solution: {solution}",
                     },
                 ]
-                solution_incorrect = False
-                for i in range(self.properties.max_verifier_passes):
-                    verifier_response = self.properties.verifier_model.send_request(
-                        verifier_conversation
-                    )
-                    if "SOLUTION INCORRECT" in verifier_response:
-                        solution_incorrect = True
-                        break
+                with step(SolutionType.VERIFICATION.value):
+                    solution_incorrect = await self._solution_incorrect(verifier_conversation)
 
                 if solution_incorrect:
                     continue
 
                 break
-            return reasoner_response
+            return SolverResult(answer=reasoner_response, solved=not solution_incorrect)
 
         except openai.APIError as e:
-            print(f"OpenAI API error: {e}")
+            log(LogLevel.ERROR, "solver_error", f"OpenAI API error: {e}", error=str(e))
+            return SolverResult(error=f"{e}")
         except Exception as e:
-            print(f"Unexpected error: {e}")
\ No newline at end of file
+            log(LogLevel.ERROR, "solver_error", f"Unexpected error: {e}", error=str(e))
+            return SolverResult(error=f"{e}")
\ No newline at end of file
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from utils.cache import ResponseCache
+from utils.cancellation import CancelToken
+
+# A response is only worth reusing once it carries one of these verdicts
+VERDICT_MARKERS = ("SEGMENT CORRECT", "SEGMENT INCORRECT", "SOLUTION CORRECT", "SOLUTION INCORRECT")
+
+# Returned to a caller whose own cancel token fired while it waited on a shared check
+CANCELLED_RESPONSE = "[Verification cancelled]"
+
+
+def normalize_segment(text: str) -> str:
+    """Segment text with all whitespace runs collapsed, so reflowed copies of a lemma match."""
+    return " ".join(text.split())
+
+
+def segment_check_key(
+    model_name: str,
+    problem: str,
+    preceding_segments: List[str],
+    segment: Optional[str],
+) -> str:
+    """
+    Key of one DeepCheck check.
+
+    `segment` is None for the goal check, which is keyed on the whole proof
+    passed as `preceding_segments`.
+    """
+    canonical = json.dumps(
+        {
+            "model": model_name,
+            "problem": normalize_segment(problem),
+            "preceding": [normalize_segment(s) for s in preceding_segments],
+            "segment": normalize_segment(segment) if segment is not None else None,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _InFlight:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future: asyncio.Future = loop.create_future()
+        # Cancelled once every caller waiting on this check has given up
+        self.token = CancelToken()
+        self.waiters = 0
+
+
+class SegmentVerdictCache:
+    """
+    Segment verdicts shared across candidate solutions, rounds and (with a
+    `store`) reruns.
+
+    Identical checks are verified once: a check already in flight is awaited
+    by later callers instead of being sent again, and it is only cancelled
+    when all of its callers have cancelled. Only responses that reached a
+    verdict are kept.
+    """
+
+    def __init__(self, store: Optional[ResponseCache] = None):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        self._responses: Dict[str, str] = {}
+        self._in_flight: Dict[str, _InFlight] = {}
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            response = self._responses.get(key)
+        if response is None and self.store is not None:
+            response = self.store.get(key)
+            if response is not None:
+                with self._lock:
+                    self._responses[key] = response
+        return response
+
+    def put(self, key: str, response: str) -> None:
+        with self._lock:
+            self._responses[key] = response
+        if self.store is not None:
+            self.store.put(key, response)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() that reads the store (SQLite) in a worker thread, off the event loop."""
+        if self.store is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def averify(
+        self,
+        key: str,
+        check: Callable[[CancelToken], Awaitable[str]],
+        cancel_token: Optional[CancelToken] = None,
+    ) -> str:
+        """
+        Return the cached response for `key`, or run `check` (sharing it with
+        concurrent callers of the same key).
+
+        Args:
+            check: Sends the verification request, stopping when given token is cancelled
+            cancel_token: Stops this caller waiting, and the check once no caller is left
+        """
+        cached = await self.aget(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return cached
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._in_flight.get(key)
+            # Futures are bound to their loop; callers on other loops run their own check.
+            # A check whose callers all gave up is being cancelled, so it can't be joined
+            start = entry is None or entry.loop is not loop or entry.token.cancelled
+            if start:
+                entry = _InFlight(loop)
+                self._in_flight[key] = entry
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+            entry.waiters += 1
+        if start:
+            asyncio.ensure_future(self._run(key, entry, check))
+
+        cancelled = loop.create_future()
+        unregister = (
+            cancel_token.on_cancel(lambda: loop.call_soon_threadsafe(_resolve, cancelled))
+            if cancel_token is not None
+            else None
+        )
+        try:
+            await asyncio.wait({entry.future, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if unregister is not None:
+                unregister()
+            self._leave(key, entry)
+        if entry.future.done():
+            return entry.future.result()
+        return CANCELLED_RESPONSE
+
+    async def _run(self, key: str, entry: _InFlight, check) -> None:
+        try:
+            response = await check(entry.token)
+        except asyncio.CancelledError:
+            entry.future.cancel()
+            raise
+        except Exception as e:
+            entry.future.set_exception(e)
+            # Mark the exception retrieved so an abandoned check does not log it
+            entry.future.exception()
+        else:
+            keep = not entry.token.cancelled and any(marker in response for marker in VERDICT_MARKERS)
+            if keep:
+                with self._lock:
+                    self._responses[key] = response
+            entry.future.set_result(response)
+            if keep and self.store is not None:
+                await asyncio.to_thread(self.store.put, key, response)
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is entry:
+                    del self._in_flight[key]
+
+    def _leave(self, key: str, entry: _InFlight) -> None:
+        with self._lock:
+            entry.waiters -= 1
+            abandoned = entry.waiters == 0 and not entry.future.done()
+            # The next caller of this key must start a fresh check, not join the cancelled one
+            if abandoned and self._in_flight.get(key) is entry:
+                del self._in_flight[key]
+        if abandoned:
+            entry.token.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "deduplicated": self.deduplicated,
+                "entries": len(self._responses),
+            }
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
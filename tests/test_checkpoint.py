@@ -0,0 +1,44 @@
+import pytest
+
+from solvers import FeedbackAndCondensed
+from solvers.base import SolverProperties, Verdict, VerifierOutput
+from solvers.checkpoint import CheckpointStore
+from solvers.deep_check import DeepCheck
+from utils.fake import FakeModelSettings, configure_fake_model
+from utils.model import Model, ModelName
+
+
+@pytest.fixture(autouse=True)
+def fast_fake_model():
+    configure_fake_model(FakeModelSettings(
+        latency_median=0.01, response_tokens=5, tokens_per_second=10_000, incorrect_probability=0.0, seed=0,
+    ))
+    yield
+    configure_fake_model(FakeModelSettings())
+
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_errored_deep_check_is_retried_on_resume(tmp_path, monkeypatch, pipelined):
+    model = Model(ModelName.FAKE)
+    properties = SolverProperties(
+        reasoner_model=model, verifier_model=model, discussion_condenser_model=model,
+        proof_divider_model=model, segment_verifier_model=model,
+        max_reasoning_tries=1, parallel_reasoning_tries=2, max_verifier_passes=1,
+        pipelined_rounds=pipelined, checkpoint_store=CheckpointStore(str(tmp_path / "checkpoints.db")), run_id="run",
+    )
+    deep_checks = []
+
+    async def failing(self, problem, solution):
+        deep_checks.append("failed")
+        return VerifierOutput(error="provider down")
+
+    async def passing(self, problem, solution):
+        deep_checks.append("passed")
+        return VerifierOutput(verdict=Verdict.CORRECT)
+
+    monkeypatch.setattr(DeepCheck, "averify", failing)
+    assert not FeedbackAndCondensed(properties).solve("1 + 1 = 2").solved
+
+    monkeypatch.setattr(DeepCheck, "averify", passing)
+    assert FeedbackAndCondensed(properties).solve("1 + 1 = 2").solved
+    assert "passed" in deep_checks
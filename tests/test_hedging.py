@@ -0,0 +1,53 @@
+import asyncio
+import itertools
+
+import pytest
+
+from utils import hedging
+from utils.fake import FakeBackend, FakeModelSettings, configure_fake_model
+from utils.hedging import HedgePolicy, hedge_stats
+from utils.model import Model, ModelName
+
+CONVERSATION = [{"role": "user", "content": "Say something."}]
+
+# Time to first token of the primaries, in an even spread plus a slow tail
+PRIMARY_LATENCIES = [0.02 * i for i in range(1, 9)] + [0.4, 0.4]
+
+
+@pytest.fixture(autouse=True)
+def fresh_hedge_state(monkeypatch):
+    monkeypatch.setattr(hedging, "_trackers", {})
+    monkeypatch.setattr(hedging, "_counters", hedging._HedgeCounters())
+    yield
+    configure_fake_model(FakeModelSettings())
+
+
+def fake_settings(**overrides) -> FakeModelSettings:
+    defaults = dict(response_tokens=5, tokens_per_second=1e6, tokens_per_chunk=5)
+    defaults.update(overrides)
+    return FakeModelSettings(**defaults)
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_hedge_rate_does_not_grow_across_slow_primaries(streamed):
+    latencies = itertools.cycle(PRIMARY_LATENCIES)
+    configure_fake_model(fake_settings(latency_sampler=lambda rng: next(latencies)))
+    # Duplicates go to a fast backend, so every hedge is won by the duplicate
+    alternate = Model(ModelName.FAKE)
+    alternate.fake = FakeBackend(fake_settings(latency_median=0.005, latency_sigma=0.0))
+    model = Model(ModelName.FAKE, hedge=HedgePolicy(percentile=70, min_samples=10, alternate=alternate))
+    send = model.asend_request_streaming if streamed else model.asend_request
+
+    async def round_of_calls() -> int:
+        fired = hedge_stats().get("fake", {}).get("fired", 0)
+        await asyncio.gather(*(send(CONVERSATION, use_cache=False) for _ in PRIMARY_LATENCIES))
+        return hedge_stats()["fake"]["fired"] - fired
+
+    async def main():
+        return [await round_of_calls() for _ in range(6)]
+
+    fired = asyncio.run(main())
+    # The first round only fills the latency window
+    assert fired[0] == 0
+    # Only the slowest primaries are hedged, round after round
+    assert all(1 <= n <= 4 for n in fired[1:]), fired
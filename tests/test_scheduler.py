@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+from utils.scheduler import Priority, Scheduler
+
+
+def test_async_slots_are_granted_by_priority():
+    scheduler = Scheduler(max_concurrent=1)
+    order = []
+
+    async def call(priority: Priority):
+        async with scheduler.slot(priority):
+            order.append(priority)
+
+    async def main():
+        await scheduler.acquire()
+        tasks = [asyncio.ensure_future(call(priority)) for priority in (Priority.LOW, Priority.NORMAL, Priority.CRITICAL, Priority.HIGH)]
+        # Let every task queue up behind the held slot
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["queued_async"]["LOW"] == 1
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == [Priority.CRITICAL, Priority.HIGH, Priority.NORMAL, Priority.LOW]
+
+
+def test_default_scheduler_bounds_async_calls():
+    assert Scheduler().max_concurrent is not None
+
+
+def test_queued_work_runs_by_priority():
+    scheduler = Scheduler(max_workers=1)
+    started = threading.Event()
+    unblock = threading.Event()
+    order = []
+
+    def hold():
+        started.set()
+        unblock.wait()
+
+    scheduler.submit(hold)
+    started.wait()
+    futures = [
+        scheduler.submit(order.append, priority, priority=priority)
+        for priority in (Priority.LOW, Priority.NORMAL, Priority.CRITICAL, Priority.HIGH)
+    ]
+    unblock.set()
+    for future in futures:
+        future.result()
+    assert order == [Priority.CRITICAL, Priority.HIGH, Priority.NORMAL, Priority.LOW]
+
+
+def test_nested_fan_out_runs_in_parallel():
+    scheduler = Scheduler(max_workers=2)
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def leaf(_):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.1)
+        with lock:
+            running -= 1
+
+    def parent():
+        return scheduler.map(leaf, range(4))
+
+    # The parent's worker waits on its children, so both places go to them
+    scheduler.submit(parent).result(timeout=5)
+    assert peak == 2
+
+
+def test_nested_fan_out_cannot_deadlock_a_full_pool():
+    scheduler = Scheduler(max_workers=1)
+    future = scheduler.submit(lambda: scheduler.map(lambda item: item * 2, range(3)))
+    assert future.result(timeout=5) == [0, 2, 4]
+
+
+def test_nested_fan_out_stays_within_max_workers():
+    scheduler = Scheduler(max_workers=3)
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def busy(work):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        try:
+            return work()
+        finally:
+            with lock:
+                running -= 1
+
+    def leaf(_):
+        return busy(lambda: time.sleep(0.02))
+
+    def middle(_):
+        # Counted only while it runs, not while it waits on its children
+        busy(lambda: None)
+        return scheduler.map(leaf, range(4))
+
+    def top(_):
+        busy(lambda: None)
+        return scheduler.map(middle, range(3))
+
+    for _ in range(3):
+        scheduler.map(top, range(3))
+    assert peak <= 3
+    # Threads started for blocked workers exit again once idle
+    deadline = time.monotonic() + 2
+    while scheduler.stats()["workers"] > 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scheduler.stats()["workers"] <= 3
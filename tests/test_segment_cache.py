@@ -0,0 +1,28 @@
+import asyncio
+
+from solvers.segment_cache import CANCELLED_RESPONSE, SegmentVerdictCache
+from utils.cancellation import CancelToken
+
+
+def test_check_abandoned_by_its_only_caller_is_not_joined():
+    cache = SegmentVerdictCache()
+    calls = []
+
+    async def check(token: CancelToken) -> str:
+        calls.append(token)
+        if len(calls) == 1:
+            # Stands in for a check still waiting on a scheduler slot when it is cancelled
+            await asyncio.sleep(0.5)
+            return ""
+        return "Fine.\nSEGMENT CORRECT"
+
+    async def main():
+        caller = CancelToken()
+        first = asyncio.ensure_future(cache.averify("key", check, caller))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        assert await first == CANCELLED_RESPONSE
+        return await cache.averify("key", check)
+
+    assert asyncio.run(main()).endswith("SEGMENT CORRECT")
+    assert len(calls) == 2 and calls[0].cancelled
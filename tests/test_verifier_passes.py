@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from solvers import NoFeedback
+from solvers.base import SolverProperties
+from utils.fake import FakeBackend, FakeModelSettings, configure_fake_model
+from utils.model import Model, ModelName
+from utils.prompts import Prompts
+from utils.rate_limit import ProviderServerError
+
+CONVERSATION = [
+    Prompts.VERIFIER_SYSTEM_PROMPT.value,
+    {"role": "user", "content": "Problem: 1 + 1 = 2\nPotential Solution: Obvious."},
+]
+
+
+@pytest.fixture(autouse=True)
+def reset_fake_model():
+    yield
+    configure_fake_model(FakeModelSettings())
+
+
+def fast_settings(**overrides) -> FakeModelSettings:
+    return FakeModelSettings(latency_median=0.01, response_tokens=5, tokens_per_second=10_000, seed=0, **overrides)
+
+
+def solution_incorrect(parallel: bool, conversation=CONVERSATION) -> bool:
+    model = Model(ModelName.FAKE)
+    solver = NoFeedback(SolverProperties(verifier_model=model, max_verifier_passes=3, parallel_verifier_passes=parallel))
+    return asyncio.run(solver._solution_incorrect(conversation))
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_failed_verifier_passes_are_not_a_correct_verdict(parallel):
+    configure_fake_model(FakeModelSettings(latency_median=0.01, server_error_probability=1.0, seed=0))
+    with pytest.raises(Exception):
+        solution_incorrect(parallel)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+@pytest.mark.parametrize("incorrect_probability, incorrect", [(0.0, False), (1.0, True)])
+def test_verifier_passes_verdict(parallel, incorrect_probability, incorrect):
+    configure_fake_model(fast_settings(incorrect_probability=incorrect_probability))
+    assert solution_incorrect(parallel) is incorrect
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_reply_without_verdict_fails_the_pass(parallel):
+    configure_fake_model(fast_settings(incorrect_probability=0.0))
+    # The fake only gives a verdict to the verifier prompt
+    conversation = [{"role": "system", "content": "Chat."}, CONVERSATION[1]]
+    assert solution_incorrect(parallel, conversation) is True
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_transient_server_error_is_retried(parallel, monkeypatch):
+    configure_fake_model(fast_settings(incorrect_probability=0.0))
+    plan = FakeBackend._plan
+    failures = [ProviderServerError("Fake provider: 503 Service Unavailable")]
+
+    def flaky_plan(self, conversation):
+        if failures:
+            raise failures.pop()
+        return plan(self, conversation)
+
+    monkeypatch.setattr(FakeBackend, "_plan", flaky_plan)
+    assert solution_incorrect(parallel) is False
+    assert not failures
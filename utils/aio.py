@@ -0,0 +1,88 @@
+from concurrent.futures import Future
+from typing import AsyncIterator, Awaitable, Iterator, Optional, TypeVar
+import asyncio
+import queue
+import threading
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Process-wide event loop running on a daemon thread.
+
+    The sync wrappers around async solver code all submit here, so pooled
+    async clients stay alive across runs instead of dying with a per-call loop.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="model-event-loop", daemon=True
+                )
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def _check_not_on_background_loop(caller: str) -> asyncio.AbstractEventLoop:
+    loop = background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError(f"{caller}() called from the background loop; await the coroutine instead")
+    return loop
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """
+    Run a coroutine on the background loop and block until it finishes.
+
+    Safe to call from any thread, including threads that run their own event
+    loop. Interrupting the wait (e.g. Ctrl-C) cancels the coroutine.
+    """
+    loop = _check_not_on_background_loop("run_sync")
+    future: Future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+_DONE = object()
+
+
+def iterate_sync(iterator: AsyncIterator[T]) -> Iterator[T]:
+    """
+    Consume an async iterator on the background loop, yielding its items as they arrive.
+
+    Closing the returned generator early (or interrupting it) cancels the async iterator.
+    """
+    loop = _check_not_on_background_loop("iterate_sync")
+    items: queue.Queue = queue.Queue()
+
+    async def drain() -> None:
+        try:
+            async for item in iterator:
+                items.put(item)
+        finally:
+            items.put(_DONE)
+
+    future: Future = asyncio.run_coroutine_threadsafe(drain(), loop)
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            yield item
+        future.result()
+    finally:
+        future.cancel()
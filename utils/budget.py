@@ -0,0 +1,177 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Optional
+import math
+import threading
+import time
+
+from utils.model import Model, ModelName
+from utils.tracing import CallRecord
+
+
+@dataclass
+class ModelPricing:
+    """USD per million tokens."""
+
+    prompt: float
+    completion: float
+    # Prompt tokens served from the provider's prompt cache; None bills them as prompt tokens
+    cached_prompt: Optional[float] = None
+
+
+# List prices; update when providers change theirs
+PRICING: Dict[str, ModelPricing] = {
+    ModelName.O3_MINI_HIGH.value: ModelPricing(1.10, 4.40, 0.55),
+    ModelName.O3_MINI_MEDIUM.value: ModelPricing(1.10, 4.40, 0.55),
+    ModelName.O3_MINI_LOW.value: ModelPricing(1.10, 4.40, 0.55),
+    ModelName.DEEPSEEK.value: ModelPricing(0.55, 2.19, 0.14),
+    ModelName.DEEPSEEK_OPENROUTER.value: ModelPricing(0.55, 2.19),
+    ModelName.FAKE.value: ModelPricing(0.0, 0.0),
+}
+
+# The next cheaper tier of a model, used when a budget runs low. The o3-mini
+# tiers share a price per token but spend far fewer reasoning tokens
+CHEAPER_TIER: Dict[ModelName, ModelName] = {
+    ModelName.O3_MINI_HIGH: ModelName.O3_MINI_MEDIUM,
+    ModelName.O3_MINI_MEDIUM: ModelName.O3_MINI_LOW,
+}
+
+
+def call_cost(record: CallRecord) -> float:
+    """Dollar cost of one traced call (0 for models without a PRICING entry)."""
+    pricing = PRICING.get(record.model)
+    if pricing is None:
+        return 0.0
+    prompt_tokens = record.prompt_tokens or 0
+    cached = min(record.cached_prompt_tokens or 0, prompt_tokens)
+    cached_price = pricing.cached_prompt if pricing.cached_prompt is not None else pricing.prompt
+    return (
+        (prompt_tokens - cached) * pricing.prompt
+        + cached * cached_price
+        + (record.completion_tokens or 0) * pricing.completion
+    ) / 1_000_000
+
+
+def cheaper_model(model: Model) -> Model:
+    """The next cheaper tier of `model` (sharing its response cache), or `model` itself."""
+    cheaper = CHEAPER_TIER.get(model.model_name)
+    if cheaper is None:
+        return model
+    return Model(cheaper, cache=model._cache)
+
+
+@dataclass
+class Budget:
+    """Limits for one problem (SolverProperties.budget) or one batch; None means unlimited."""
+
+    max_tokens: Optional[int] = None
+    max_dollars: Optional[float] = None
+    # Wall-clock seconds from the start of the problem (or batch)
+    deadline_seconds: Optional[float] = None
+
+
+@dataclass
+class BudgetReport:
+    tokens_spent: int
+    dollars_spent: float
+    elapsed_seconds: float
+    tokens_remaining: Optional[int] = None
+    dollars_remaining: Optional[float] = None
+    seconds_remaining: Optional[float] = None
+
+
+class BudgetTracker:
+    """
+    Tokens and dollars spent against a Budget, charged from the finished calls
+    of a trace (see trace_calls(on_record=...)).
+
+    A tracker started inside another one (a problem inside a batch) also
+    charges its parent, and counts as exhausted when the parent is.
+    """
+
+    def __init__(self, budget: Optional[Budget] = None, parent: Optional["BudgetTracker"] = None):
+        self.budget = budget or Budget()
+        self.parent = parent
+        self.started = time.monotonic()
+        self.tokens_spent = 0
+        self.dollars_spent = 0.0
+        self._lock = threading.Lock()
+
+    def charge(self, record: CallRecord) -> None:
+        tokens = (record.prompt_tokens or 0) + (record.completion_tokens or 0)
+        dollars = call_cost(record)
+        tracker = self
+        while tracker is not None:
+            with tracker._lock:
+                tracker.tokens_spent += tokens
+                tracker.dollars_spent += dollars
+            tracker = tracker.parent
+
+    def seconds_remaining(self) -> Optional[float]:
+        remaining = None
+        if self.budget.deadline_seconds is not None:
+            remaining = self.budget.deadline_seconds - (time.monotonic() - self.started)
+        if self.parent is not None:
+            parent_remaining = self.parent.seconds_remaining()
+            if parent_remaining is not None:
+                remaining = parent_remaining if remaining is None else min(remaining, parent_remaining)
+        return remaining
+
+    def fraction_remaining(self) -> float:
+        """Share of the tightest limit still left, between 0 and 1 (1 when unlimited)."""
+        fractions = [1.0]
+        with self._lock:
+            if self.budget.max_tokens is not None:
+                fractions.append(1 - self.tokens_spent / self.budget.max_tokens)
+            if self.budget.max_dollars is not None:
+                fractions.append(1 - self.dollars_spent / self.budget.max_dollars)
+        if self.budget.deadline_seconds is not None:
+            fractions.append(1 - (time.monotonic() - self.started) / self.budget.deadline_seconds)
+        if self.parent is not None:
+            fractions.append(self.parent.fraction_remaining())
+        return max(0.0, min(fractions))
+
+    @property
+    def exhausted(self) -> bool:
+        return self.fraction_remaining() <= 0
+
+    def scale(self, count: int) -> int:
+        """`count` shrunk in proportion to the budget left, but at least 1."""
+        return max(1, min(count, math.ceil(count * self.fraction_remaining())))
+
+    def report(self) -> BudgetReport:
+        with self._lock:
+            tokens_spent, dollars_spent = self.tokens_spent, self.dollars_spent
+        seconds_remaining = self.seconds_remaining()
+        return BudgetReport(
+            tokens_spent=tokens_spent,
+            dollars_spent=dollars_spent,
+            elapsed_seconds=time.monotonic() - self.started,
+            tokens_remaining=(
+                max(0, self.budget.max_tokens - tokens_spent)
+                if self.budget.max_tokens is not None else None
+            ),
+            dollars_remaining=(
+                max(0.0, self.budget.max_dollars - dollars_spent)
+                if self.budget.max_dollars is not None else None
+            ),
+            seconds_remaining=max(0.0, seconds_remaining) if seconds_remaining is not None else None,
+        )
+
+
+_current_budget: ContextVar[Optional[BudgetTracker]] = ContextVar("current_budget", default=None)
+
+
+def current_budget() -> Optional[BudgetTracker]:
+    return _current_budget.get()
+
+
+@contextmanager
+def use_budget(tracker: Optional[BudgetTracker]):
+    """Make `tracker` the budget that solvers in this context adapt to."""
+    token = _current_budget.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_budget.reset(token)
@@ -0,0 +1,181 @@
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def normalize_conversation(conversation: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Conversation reduced to what affects the answer: roles and whitespace-normalized content."""
+    return [
+        {
+            "role": message["role"],
+            "content": "\n".join(
+                line.rstrip() for line in (message.get("content") or "").strip().splitlines()
+            ),
+        }
+        for message in conversation
+    ]
+
+
+def make_cache_key(
+    model_name: str,
+    conversation: List[Dict[str, Any]],
+    params: Optional[Dict[str, Any]] = None,
+    sample_index: Optional[int] = None,
+) -> str:
+    """
+    Canonical hash of a request.
+
+    `sample_index` distinguishes otherwise identical sampled calls (parallel
+    reasoning, repeated verifier passes), so a cached rerun reproduces the
+    same set of diverse samples instead of collapsing them into one.
+    """
+    canonical = json.dumps(
+        {
+            "model": model_name,
+            "conversation": normalize_conversation(conversation),
+            "params": params or {},
+            "sample": sample_index,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed, content-addressed store of model responses.
+
+    Entries expire after `ttl_seconds`; once `max_entries` or `max_bytes` is
+    exceeded the least recently used entries are evicted. Safe to share
+    between threads and event loops.
+    """
+
+    def __init__(
+        self,
+        path: str = "model_cache.db",
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,)
+            )
+        if self.max_entries is not None:
+            self._conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+                stale = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> Optional[ResponseCache]:
+    """
+    Cache used by Models that were not given one explicitly.
+
+    Disabled unless set_default_cache() was called or MODEL_CACHE_PATH is set
+    (with optional MODEL_CACHE_TTL seconds and MODEL_CACHE_MAX_ENTRIES).
+    """
+    global _default_cache
+    if _default_cache is None and os.getenv("MODEL_CACHE_PATH"):
+        with _default_cache_lock:
+            if _default_cache is None:
+                ttl = os.getenv("MODEL_CACHE_TTL")
+                max_entries = os.getenv("MODEL_CACHE_MAX_ENTRIES")
+                _default_cache = ResponseCache(
+                    os.environ["MODEL_CACHE_PATH"],
+                    ttl_seconds=float(ttl) if ttl else None,
+                    max_entries=int(max_entries) if max_entries else None,
+                )
+    return _default_cache
+
+
+def set_default_cache(cache: Optional[ResponseCache]) -> None:
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache
@@ -0,0 +1,61 @@
+from typing import Callable, List, Optional
+import threading
+
+from utils.transcript import LogLevel, log
+
+
+class CancelToken:
+    """
+    Cancellation handle for one or more streaming requests.
+
+    Pass the same token to several calls (or hand out child() tokens) to
+    cancel them as a group. cancel() may be called from any thread or event
+    loop: it runs the callbacks the in-flight requests registered, which close
+    their HTTP streams at once instead of waiting for the next chunk.
+    """
+
+    def __init__(self, parent: Optional["CancelToken"] = None):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+        if parent is not None:
+            parent.on_cancel(self.cancel)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def child(self) -> "CancelToken":
+        """A token that is cancelled together with this one, but can also be cancelled on its own."""
+        return CancelToken(parent=self)
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                log(LogLevel.ERROR, "cancel_callback_error", f"Error in cancel callback: {e}", error=str(e))
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Run `callback` when the token is cancelled (immediately if it already is).
+
+        Returns:
+            A function that unregisters the callback
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
@@ -0,0 +1,215 @@
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+import openai
+import requests
+from dotenv import load_dotenv
+
+from utils.transcript import LogLevel, log
+from requests.adapters import HTTPAdapter
+
+from utils.scheduler import current_scheduler
+
+
+# Matches the default worker count of the shared scheduler so that every
+# worker of a fan-out can hold its own keep-alive connection.
+DEFAULT_POOL_SIZE = int(
+    os.getenv("MODEL_POOL_SIZE", os.getenv("MODEL_MAX_WORKERS", 32))
+)
+
+# Async fan-out is not bounded by threads, so the event-loop clients may hold
+# many more connections than the thread-pool-sized sync clients.
+DEFAULT_ASYNC_POOL_SIZE = int(os.getenv("MODEL_ASYNC_POOL_SIZE", 1000))
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def ensure_env_loaded() -> None:
+    """Read .env once per process instead of once per request."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if not _env_loaded:
+            load_dotenv()
+            _env_loaded = True
+
+
+class ClientPool:
+    """
+    Long-lived, thread-safe HTTP clients for one endpoint.
+
+    Every Model talking to the same base URL with the same API key shares one
+    pool, so repeated reasoning, verifier and DeepCheck calls reuse keep-alive
+    connections instead of paying a fresh TCP+TLS handshake per request.
+    Clients are created lazily on first use.
+    """
+
+    def __init__(self, base_url: str, api_key_env: str, pool_size: int = DEFAULT_POOL_SIZE):
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._http_client: Optional[httpx.Client] = None
+        self._openai_client: Optional[openai.OpenAI] = None
+        # Async clients are bound to the event loop they were created on
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def api_key(self) -> Optional[str]:
+        ensure_env_loaded()
+        return os.getenv(self.api_key_env)
+
+    @property
+    def origin(self) -> str:
+        parts = urlsplit(self.base_url)
+        return f"{parts.scheme}://{parts.netloc}/"
+
+    def session(self) -> requests.Session:
+        """Shared requests.Session used for the raw HTTP (OpenRouter, DeepSeek) branches."""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self.pool_size, pool_block=False
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(
+                        {
+                            "Authorization": f"Bearer {self.api_key}",
+                            "Content-Type": "application/json",
+                        }
+                    )
+                    self._session = session
+        return self._session
+
+    def openai_client(self) -> openai.OpenAI:
+        """Shared OpenAI client backed by a pooled httpx.Client."""
+        if self._openai_client is None:
+            with self._lock:
+                if self._openai_client is None:
+                    self._http_client = httpx.Client(
+                        limits=self._limits(),
+                        timeout=httpx.Timeout(600.0, connect=10.0),
+                    )
+                    self._openai_client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=self._http_client,
+                    )
+        return self._openai_client
+
+    def _limits(self, size: Optional[int] = None) -> httpx.Limits:
+        size = size or self.pool_size
+        return httpx.Limits(max_connections=size, max_keepalive_connections=size)
+
+    def _async_clients_for_loop(self) -> Tuple[httpx.AsyncClient, openai.AsyncOpenAI]:
+        loop = asyncio.get_running_loop()
+        clients = self._async_clients.get(loop)
+        if clients is None:
+            with self._lock:
+                clients = self._async_clients.get(loop)
+                if clients is None:
+                    http_client = httpx.AsyncClient(
+                        limits=self._limits(max(self.pool_size, DEFAULT_ASYNC_POOL_SIZE)),
+                        timeout=httpx.Timeout(600.0, connect=10.0),
+                        headers={
+                            "Authorization": f"Bearer {self.api_key}",
+                            "Content-Type": "application/json",
+                        },
+                    )
+                    # The OpenAI SDK sets its own auth headers on top of the shared client
+                    clients = (
+                        http_client,
+                        openai.AsyncOpenAI(
+                            api_key=self.api_key,
+                            base_url=self.base_url,
+                            http_client=http_client,
+                        ),
+                    )
+                    self._async_clients[loop] = clients
+        return clients
+
+    def async_http(self) -> httpx.AsyncClient:
+        """Pooled httpx.AsyncClient for the running event loop (raw HTTP branches)."""
+        return self._async_clients_for_loop()[0]
+
+    def async_openai_client(self) -> openai.AsyncOpenAI:
+        """Pooled AsyncOpenAI client for the running event loop."""
+        return self._async_clients_for_loop()[1]
+
+    def prewarm(self, connections: int = 1, use_openai: bool = False) -> None:
+        """
+        Open `connections` keep-alive connections ahead of the first real request.
+
+        Args:
+            connections: Number of connections to establish concurrently
+            use_openai: Warm the OpenAI client's pool instead of the requests.Session
+        """
+        connections = max(1, min(connections, self.pool_size))
+        if use_openai:
+            self.openai_client()
+
+            def touch():
+                self._http_client.head(self.origin)
+        else:
+            session = self.session()
+
+            def touch():
+                session.head(self.origin, timeout=10)
+
+        def safe_touch(_):
+            try:
+                touch()
+            except Exception as e:
+                log(LogLevel.WARNING, "prewarm_failed", f"Pre-warming {self.origin} failed: {e}", origin=self.origin)
+
+        current_scheduler().map(safe_touch, range(connections))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+                self._openai_client = None
+
+
+_pools: Dict[Tuple[str, str], ClientPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_client_pool(base_url: str, api_key_env: str, pool_size: Optional[int] = None) -> ClientPool:
+    """
+    Return the process-wide pool for an endpoint, creating it on first use.
+
+    Passing a larger `pool_size` than the existing pool's grows it for clients
+    that have not been created yet; already-created clients keep their size.
+    """
+    key = (base_url, api_key_env)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ClientPool(base_url, api_key_env, pool_size or DEFAULT_POOL_SIZE)
+            _pools[key] = pool
+        elif pool_size and pool_size > pool.pool_size:
+            pool.pool_size = pool_size
+        return pool
+
+
+def close_client_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,170 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import random
+import threading
+import time
+
+from utils.prompts import Prompts
+from utils.rate_limit import ProviderRateLimitError, ProviderServerError
+
+
+@dataclass
+class FakeModelSettings:
+    # Chance that a verifier / segment verifier response carries an INCORRECT verdict
+    incorrect_probability: float = 0.3
+    # Inclusive range for how many "Segment N:" blocks the proof divider emits
+    segment_count: Tuple[int, int] = (2, 6)
+    # Time to first token (non-streamed: to the full response); lognormal by default
+    latency_median: float = 0.5
+    latency_sigma: float = 0.5
+    latency_sampler: Optional[Callable[[random.Random], float]] = None
+    response_tokens: int = 200
+    tokens_per_second: float = 400.0
+    # Tokens per streamed chunk; raise it to cut timer overhead in large load tests
+    tokens_per_chunk: int = 1
+    rate_limit_probability: float = 0.0
+    server_error_probability: float = 0.0
+    retry_after: Optional[float] = 1.0
+    seed: Optional[int] = None
+
+
+class FakeBackend:
+    """
+    Local stand-in for a provider, used by ModelName.FAKE.
+
+    Answers by recognising the system prompt: the proof divider gets
+    "Segment N:" blocks, verifiers get a CORRECT/INCORRECT verdict with the
+    configured probability, everything else gets filler tokens. Latency,
+    token-by-token streaming and 429/5xx errors are simulated so that
+    concurrency, cancellation and backoff can be load-tested without network.
+    """
+
+    def __init__(self, settings: Optional[FakeModelSettings] = None):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "requests": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+            "cancelled": 0,
+        }
+        self.configure(settings or FakeModelSettings())
+
+    def configure(self, settings: FakeModelSettings) -> None:
+        with self._lock:
+            self.settings = settings
+            self._random = random.Random(settings.seed)
+
+    def _plan(self, conversation) -> Tuple[float, List[str]]:
+        """Draw latency and output tokens for a request, raising the injected error if any."""
+        with self._lock:
+            settings = self.settings
+            rng = self._random
+            self.counters["requests"] += 1
+            roll = rng.random()
+            if roll < settings.rate_limit_probability:
+                self.counters["rate_limited"] += 1
+                raise ProviderRateLimitError("Fake provider: 429 Too Many Requests", settings.retry_after)
+            if roll < settings.rate_limit_probability + settings.server_error_probability:
+                self.counters["server_errors"] += 1
+                raise ProviderServerError("Fake provider: 503 Service Unavailable")
+
+            if settings.latency_sampler is not None:
+                latency = settings.latency_sampler(rng)
+            else:
+                latency = rng.lognormvariate(0, settings.latency_sigma) * settings.latency_median
+            text = self._respond(conversation, rng)
+        return max(0.0, latency), _tokenize(text)
+
+    def _respond(self, conversation, rng: random.Random) -> str:
+        system = conversation[0]["content"] if conversation else ""
+        filler = " ".join(f"token{i}" for i in range(self.settings.response_tokens))
+        incorrect = rng.random() < self.settings.incorrect_probability
+
+        def uses(*prompts: Prompts) -> bool:
+            return any(system.startswith(prompt.value["content"]) for prompt in prompts)
+
+        if uses(Prompts.PROOF_DIVIDER_SYSTEM_PROMPT):
+            low, high = self.settings.segment_count
+            return "\n".join(
+                f"Segment {i + 1}: Fake proof step {i + 1}." for i in range(rng.randint(low, high))
+            )
+        if uses(Prompts.PROOF_SEGMENT_CHECK_SYSTEM_PROMPT):
+            task = conversation[-1]["content"]
+            if task.endswith(Prompts.PROOF_SEGMENT_CHECK_GOAL_TASK.value["content"]):
+                return f"{filler}\nSOLUTION {'INCORRECT' if incorrect else 'CORRECT'}"
+            return f"{filler}\nSEGMENT {'INCORRECT' if incorrect else 'CORRECT'}"
+        if uses(Prompts.VERIFIER_SYSTEM_PROMPT):
+            return f"{filler}\nSOLUTION {'INCORRECT' if incorrect else 'CORRECT'}"
+        return filler
+
+    def _chunks(self, tokens: List[str]) -> List[str]:
+        size = max(1, self.settings.tokens_per_chunk)
+        return ["".join(tokens[i:i + size]) for i in range(0, len(tokens), size)]
+
+    def _chunk_delay(self) -> float:
+        return max(1, self.settings.tokens_per_chunk) / self.settings.tokens_per_second
+
+    def complete(self, conversation) -> str:
+        latency, tokens = self._plan(conversation)
+        time.sleep(latency + len(tokens) / self.settings.tokens_per_second)
+        return "".join(tokens)
+
+    async def acomplete(self, conversation) -> str:
+        latency, tokens = self._plan(conversation)
+        await asyncio.sleep(latency + len(tokens) / self.settings.tokens_per_second)
+        return "".join(tokens)
+
+    def stream(self, conversation, on_delta: Callable[[str], None], should_stop: Callable[[], bool]) -> bool:
+        """Emit chunks through `on_delta`; returns False if `should_stop` ended the stream early."""
+        latency, tokens = self._plan(conversation)
+        time.sleep(latency)
+        delay = self._chunk_delay()
+        for chunk in self._chunks(tokens):
+            if should_stop():
+                self._count("cancelled")
+                return False
+            on_delta(chunk)
+            time.sleep(delay)
+        return True
+
+    async def astream(self, conversation, on_delta: Callable[[str], None]) -> None:
+        latency, tokens = self._plan(conversation)
+        try:
+            await asyncio.sleep(latency)
+            delay = self._chunk_delay()
+            for chunk in self._chunks(tokens):
+                on_delta(chunk)
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self._count("cancelled")
+            raise
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+
+def _tokenize(text: str) -> List[str]:
+    """Split into word-sized tokens that concatenate back to `text`."""
+    tokens = []
+    start = 0
+    for i, char in enumerate(text):
+        if char in " \n" and i > start:
+            tokens.append(text[start:i])
+            start = i
+    tokens.append(text[start:])
+    return tokens
+
+
+_backend = FakeBackend()
+
+
+def fake_backend() -> FakeBackend:
+    """Process-wide backend shared by every Model(ModelName.FAKE)."""
+    return _backend
+
+
+def configure_fake_model(settings: FakeModelSettings) -> FakeBackend:
+    _backend.configure(settings)
+    return _backend
@@ -0,0 +1,125 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, Optional, Tuple
+import asyncio
+import math
+import threading
+
+if TYPE_CHECKING:
+    from utils.model import Model
+
+# What a LatencyTracker measures
+COMPLETION = "completion"
+FIRST_TOKEN = "first_token"
+
+
+class LatencyTracker:
+    """Rolling window of a model's most recent latencies, for percentiles measured online."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile of the window, None while it is empty."""
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        rank = max(1, math.ceil(q / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+
+_trackers: Dict[Tuple[str, str], LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def latency_tracker(model_name: str, kind: str) -> LatencyTracker:
+    """Process-wide tracker of `kind` (COMPLETION or FIRST_TOKEN) latencies for a model."""
+    key = (model_name, kind)
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = LatencyTracker()
+            _trackers[key] = tracker
+        return tracker
+
+
+@dataclass
+class HedgePolicy:
+    """
+    When a Model call is slow, send a duplicate request and keep whichever answers first.
+
+    A call that has not completed (streaming: produced its first token) by the
+    `percentile` of the model's recent latencies gets a duplicate, sent to
+    `alternate` if given. The loser is cancelled, which closes its HTTP request.
+    """
+
+    percentile: float = 95.0
+    # No hedging until this many latencies of the model have been seen
+    min_samples: int = 20
+    # Model to send the duplicate to, e.g. the same weights through another provider
+    alternate: Optional["Model"] = None
+    # Never hedge sooner than this many seconds after the request went out
+    min_delay: float = 0.0
+
+    def delay(self, tracker: LatencyTracker) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        if len(tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+
+class _HedgeCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def count(self, model_name: str, event: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(model_name, {"requests": 0, "fired": 0, "won": 0})
+            counts[event] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
+
+
+_counters = _HedgeCounters()
+
+
+def count_hedge(model_name: str, event: str) -> None:
+    """Count a hedged call ("requests"), a duplicate sent ("fired") or a duplicate that won ("won")."""
+    _counters.count(model_name, event)
+
+
+def hedge_stats() -> Dict[str, Dict[str, int]]:
+    """Per primary model: calls made with a HedgePolicy, duplicates sent and duplicates that won."""
+    return _counters.snapshot()
+
+
+async def first_successful(tasks: Iterable[asyncio.Future]) -> asyncio.Future:
+    """
+    The first of `tasks` to finish without an exception.
+
+    Raises the first exception seen if all of them fail.
+    """
+    pending = set(tasks)
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.cancelled():
+                error = error or asyncio.CancelledError()
+            elif task.exception() is not None:
+                error = error or task.exception()
+            else:
+                return task
+    raise error
@@ -1,14 +1,44 @@
-from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+import asyncio
+import contextvars
+import httpx
 import openai
-from dotenv import load_dotenv
-import os
 import json
+import queue
 import requests
+import threading
 import time
 import random
 from dataclasses import dataclass
-from typing import Optional, List, Any, Union, Dict, Tuple
+from typing import Optional, List, Any, Union, Dict, Tuple, Callable, NamedTuple, AsyncIterator, Iterator, Awaitable
+
+from utils.cache import ResponseCache, default_cache, make_cache_key
+from utils.cancellation import CancelToken
+from utils.clients import ClientPool, get_client_pool
+from utils.fake import FakeBackend, fake_backend
+from utils.hedging import (
+    COMPLETION,
+    FIRST_TOKEN,
+    HedgePolicy,
+    LatencyTracker,
+    count_hedge,
+    first_successful,
+    latency_tracker,
+)
+from utils.reasoning import join_reasoning
+from utils.replay import current_cassette
+from utils.routing import RouterSettings, get_router
+from utils.scheduler import Scheduler, current_priority, current_scheduler
+from utils.tracing import CallRecord, current_call, traced
+from utils.transcript import LogLevel, log
+from utils.rate_limit import (
+    ProviderRateLimitError,
+    ProviderServerError,
+    RateLimits,
+    estimate_tokens,
+    get_rate_limiter,
+    parse_retry_after,
+)
 
 
 class ModelName(Enum):
@@ -17,6 +47,9 @@ class ModelName(Enum):
     O3_MINI_LOW = "cline/o3-mini:low"
     DEEPSEEK = "deepseek-reasoner"
     DEEPSEEK_OPENROUTER = "deepseek/deepseek-r1"
+    # DeepSeek-R1 through whichever of its providers is healthiest
+    DEEPSEEK_R1 = "deepseek-r1"
+    FAKE = "fake"
 
 
 @dataclass
@@ -28,6 +61,10 @@ class ModelConfig:
         False  # Some models like DeepSeek do not handle system messages well
     )
     has_reasoning: bool = False
+    # Quota of the provider behind base_url/api_key_env; the first config seen wins
+    rate_limits: Optional[RateLimits] = None
+    # Set for a logical model: its requests are routed across these, see RoutedModel
+    backends: Optional[List[ModelName]] = None
 
 
 class ModelRegistry:
@@ -42,6 +79,11 @@ class ModelRegistry:
             base_url="https://router.requesty.ai/v1",
             api_key_env="ROUTER_API_KEY",
         ),
+        ModelName.O3_MINI_LOW: ModelConfig(
+            name=ModelName.O3_MINI_LOW,
+            base_url="https://router.requesty.ai/v1",
+            api_key_env="ROUTER_API_KEY",
+        ),
         ModelName.DEEPSEEK: ModelConfig(
             name=ModelName.DEEPSEEK,
             base_url="https://api.deepseek.com",
@@ -56,6 +98,21 @@ class ModelRegistry:
             has_reasoning=True,
             requires_conversation_fix=True,
         ),
+        ModelName.DEEPSEEK_R1: ModelConfig(
+            name=ModelName.DEEPSEEK_R1,
+            base_url="route://deepseek-r1",
+            api_key_env="",
+            has_reasoning=True,
+            requires_conversation_fix=True,
+            backends=[ModelName.DEEPSEEK, ModelName.DEEPSEEK_OPENROUTER],
+        ),
+        # Local simulator for load tests, see utils.fake.configure_fake_model
+        ModelName.FAKE: ModelConfig(
+            name=ModelName.FAKE,
+            base_url="fake://local",
+            api_key_env="FAKE_API_KEY",
+            rate_limits=RateLimits(max_in_flight=100_000),
+        ),
     }
 
     @classmethod
@@ -63,28 +120,466 @@ class ModelRegistry:
         return cls._registry.get(model_name)
 
 
+RETRYABLE_ERRORS = (
+    openai.APIError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    json.JSONDecodeError,
+    ProviderRateLimitError,
+    ProviderServerError,
+)
+
+RATE_LIMIT_ERRORS = (openai.RateLimitError, ProviderRateLimitError)
+
+# Sentinel returned by Model._decode_sse_line for the "[DONE]" event
+_SSE_DONE = object()
+
+
+def _apply_usage(record: CallRecord, usage: Dict[str, Any]) -> None:
+    record.prompt_tokens = usage.get("prompt_tokens")
+    record.completion_tokens = usage.get("completion_tokens")
+    record.usage_estimated = False
+    # OpenAI reports prompt-cache hits under prompt_tokens_details, DeepSeek as prompt_cache_hit_tokens
+    details = usage.get("prompt_tokens_details") or {}
+    cached = details.get("cached_tokens", usage.get("prompt_cache_hit_tokens"))
+    if cached is not None:
+        record.cached_prompt_tokens = cached
+
+
+class StreamDelta(NamedTuple):
+    content: str
+    reasoning: str
+
+
+# Called with each content delta in order; returning True stops the stream
+StopPredicate = Callable[[str], bool]
+
+
+def stop_on(*markers: str) -> StopPredicate:
+    """
+    Stop predicate that fires once any of `markers` has appeared in the content.
+
+    Only keeps a tail of the text seen so far, so a marker split across
+    chunks is still found and checking stays linear in the response length.
+    """
+    keep = max(len(marker) for marker in markers) - 1
+    tail = ""
+
+    def predicate(delta: str) -> bool:
+        nonlocal tail
+        window = tail + delta
+        tail = window[-keep:] if keep else ""
+        return any(marker in window for marker in markers)
+
+    return predicate
+
+
+class StreamBuffer:
+    """
+    Accumulates a streamed response in linear time, optionally keeping each
+    chunk's timing for cassettes.
+
+    Every delta is passed to `on_delta`; once `stop_when` returns True the
+    buffer cancels `cancel_token`, which closes the stream.
+    """
+
+    def __init__(
+        self,
+        record_events: bool = False,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+        stop_when: Optional[StopPredicate] = None,
+        cancel_token: Optional[CancelToken] = None,
+    ):
+        self._content: List[str] = []
+        self._reasoning: List[str] = []
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        # Token usage reported in the final chunk, if the provider sends one
+        self.usage: Optional[Dict[str, Any]] = None
+        self.events = [] if record_events else None
+        self.on_delta = on_delta
+        self.stop_when = stop_when
+        self.cancel_token = cancel_token
+        self.stopped = False
+
+    @property
+    def content(self) -> str:
+        return "".join(self._content)
+
+    @property
+    def reasoning(self) -> str:
+        return "".join(self._reasoning)
+
+    def add(self, content: str, reasoning: str) -> None:
+        if self.first_token_at is None and (content or reasoning):
+            self.first_token_at = time.monotonic()
+        if content:
+            self._content.append(content)
+        if reasoning:
+            self._reasoning.append(reasoning)
+        if self.events is not None:
+            self.events.append((time.monotonic() - self.started, content, reasoning))
+        if self.on_delta is not None:
+            self.on_delta(content, reasoning)
+        if self.stop_when is not None and content and not self.stopped and self.stop_when(content):
+            self.stopped = True
+            if self.cancel_token is not None:
+                self.cancel_token.cancel()
+
+    def apply(self, decoded: Tuple[str, str, Optional[Dict[str, Any]]]) -> None:
+        """Add a (content, reasoning, usage) tuple from Model._decode_chunk."""
+        content, reasoning, usage = decoded
+        if content or reasoning:
+            self.add(content, reasoning)
+        if usage:
+            self.usage = usage
+
+
 class Model:
-    def __init__(self, model_type: ModelName) -> None:
+    def __new__(cls, model_type: ModelName, *args, **kwargs):
+        # Logical models with several backends are served by a RoutedModel
+        if cls is Model and ModelRegistry.get_config(model_type).backends:
+            cls = RoutedModel
+        return super().__new__(cls)
+
+    def __init__(
+        self,
+        model_type: ModelName,
+        pool_size: Optional[int] = None,
+        cache: Optional[ResponseCache] = None,
+        hedge: Optional[HedgePolicy] = None,
+    ) -> None:
         self.model_name = model_type
         self.config = ModelRegistry.get_config(model_type)
         self.base_url = self.config.base_url
-        # Flag that can be set from outside to cancel streaming requests
-        self.cancel_stream = False
+        # Shared with every other Model on the same endpoint; size it to the
+        # largest fan-out you expect (defaults to the scheduler's worker count)
+        self.pool: ClientPool = get_client_pool(
+            self.config.base_url, self.config.api_key_env, pool_size
+        )
+        # Shared by every request to this provider, whatever fan-out it comes from
+        self.limiter = get_rate_limiter(
+            self.config.base_url, self.config.api_key_env, self.config.rate_limits
+        )
+        self.fake: Optional[FakeBackend] = (
+            fake_backend() if self.base_url.startswith("fake://") else None
+        )
+        # Opt-in response cache; falls back to the process-wide default (if any)
+        self._cache = cache
+        # Duplicate slow async calls, see utils.hedging.HedgePolicy
+        self.hedge = hedge
+
+    @property
+    def uses_openai_client(self) -> bool:
+        return (
+            self.fake is None
+            and "openrouter" not in self.base_url
+            and "deepseek" not in self.base_url
+        )
+
+    @property
+    def reasoning_key(self) -> str:
+        # OpenRouter calls the field "reasoning", DeepSeek "reasoning_content"
+        return "reasoning" if "openrouter" in self.base_url else "reasoning_content"
+
+    @property
+    def cache(self) -> Optional[ResponseCache]:
+        return self._cache if self._cache is not None else default_cache()
+
+    def _cache_key(self, conversation, use_cache: bool, sample_index: Optional[int]) -> Optional[str]:
+        if not use_cache or self.cache is None:
+            return None
+        return make_cache_key(
+            self.model_name.value,
+            conversation,
+            {"has_reasoning": self.config.has_reasoning},
+            sample_index,
+        )
+
+    @staticmethod
+    def _mark_cached() -> None:
+        record = current_call()
+        if record is not None:
+            record.metadata["cached"] = True
+
+    @staticmethod
+    def _record_usage(usage: Optional[Dict[str, Any]]) -> None:
+        """Attach provider-reported token usage to the current call's trace record."""
+        record = current_call()
+        if record is not None and usage:
+            _apply_usage(record, usage)
+
+    @staticmethod
+    def _record_attempt(attempts: int, conversation=None, response: Optional[str] = None,
+                        buffer: Optional["StreamBuffer"] = None) -> None:
+        """Update the current call's retry count, and once done its TTFT and (estimated) usage."""
+        record = current_call()
+        if record is None:
+            return
+        record.retries = attempts
+        if buffer is not None:
+            if buffer.first_token_at is not None:
+                record.time_to_first_token = buffer.first_token_at - record.started_monotonic
+            if buffer.usage:
+                _apply_usage(record, buffer.usage)
+        if response is not None and (record.prompt_tokens is None or record.usage_estimated):
+            # Cassettes, the fake model and some providers report no usage
+            record.prompt_tokens = estimate_tokens(conversation)
+            record.completion_tokens = len(response) // 4
+            record.usage_estimated = True
+
+    def _record_first_token(self, buffer: "StreamBuffer") -> None:
+        if buffer.first_token_at is not None and buffer.first_token_at >= buffer.started:
+            latency_tracker(self.model_name.value, FIRST_TOKEN).add(buffer.first_token_at - buffer.started)
+
+    @staticmethod
+    def _record_lost_primary(tracker: LatencyTracker, started: float) -> None:
+        """
+        Sample a primary that lost to its hedge at its elapsed time, a lower bound on its latency.
+
+        Otherwise only the duplicate's latency is seen for the slowest calls, and
+        the percentile (and with it the hedge delay) drifts down call by call.
+        """
+        tracker.add(time.monotonic() - started)
+
+    def _mark_hedge(self, backup_model: "Model", won: bool) -> None:
+        """Count a duplicate request, and note on the current call's record which model answered."""
+        count_hedge(self.model_name.value, "fired")
+        if won:
+            count_hedge(self.model_name.value, "won")
+        record = current_call()
+        if record is not None:
+            record.metadata["hedge_model"] = backup_model.model_name.value
+            record.metadata["hedge_won"] = won
+
+    def prewarm(self, connections: int = 1) -> None:
+        """Open keep-alive connections to this model's endpoint before the first request."""
+        self.pool.prewarm(connections, use_openai=self.uses_openai_client)
+
+    def _prepare(self, conversation):
+        return self.fix_conversation(conversation) if self.config.requires_conversation_fix else conversation
 
     def fix_conversation(self, conversation):
         if (
             self.config.requires_conversation_fix
             and conversation[0]["role"] == "system"
         ):
-            system_message = conversation.pop(0)
-            user_message = conversation.pop(0)
+            # Copy so that callers sharing one conversation across parallel
+            # requests never see it mutated underneath them
+            system_message, user_message, *rest = conversation
             new_message = {
                 "role": "user",
                 "content": system_message["content"] + "\n\n" + user_message["content"],
             }
-            conversation.insert(0, new_message)
+            conversation = [new_message] + rest
         return conversation
 
+    def _raw_request(self, conversation, stream: bool) -> Tuple[str, Dict[str, Any]]:
+        """URL and JSON payload for the raw HTTP (OpenRouter, DeepSeek) branches."""
+        payload = {"model": self.model_name.value, "messages": conversation}
+        if stream:
+            payload["stream_options"] = {"include_usage": True}
+        if "openrouter" in self.base_url:
+            payload["include_reasoning"] = self.config.has_reasoning
+            if stream:
+                payload["stream"] = True
+            return self.base_url, payload
+        payload["stream"] = stream
+        return f"{self.base_url}/chat/completions", payload
+
+    def _format_message(self, message: Dict[str, Any]) -> str:
+        content = message["content"]
+        reasoning = message.get(self.reasoning_key)
+        if self.config.has_reasoning and reasoning:
+            content = join_reasoning(reasoning, content)
+        return content
+
+    def _decode_sse_line(self, line: Union[str, bytes]):
+        """
+        Decode one server-sent-events line from a raw HTTP stream.
+
+        Returns:
+            None for lines to skip, _SSE_DONE at the end of the stream, or a
+            (content_delta, reasoning_delta, usage) tuple
+        """
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            return None
+        line = line[5:].strip()
+        if line == "[DONE]":
+            return _SSE_DONE
+        try:
+            chunk = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+        return self._decode_chunk(chunk)
+
+    def _decode_chunk(self, chunk: Dict[str, Any]):
+        """
+        Decode one chat.completion.chunk, whether it came from raw SSE or the OpenAI SDK.
+
+        Returns:
+            None for chunks without content or usage, or a
+            (content_delta, reasoning_delta, usage) tuple
+        """
+        usage = chunk.get("usage")
+        if not chunk.get("choices"):
+            return ("", "", usage) if usage else None
+        delta = chunk["choices"][0].get("delta") or {}
+        return delta.get("content") or "", delta.get(self.reasoning_key) or "", usage
+
+    @staticmethod
+    def _join_stream(response_text: str, reasoning_text: str) -> str:
+        return join_reasoning(reasoning_text, response_text)
+
+    def _check_status(self, response) -> None:
+        """raise_for_status, but surface 429s and 5xx as retryable provider errors."""
+        if response.status_code == 429:
+            raise ProviderRateLimitError(
+                f"Rate limited by {self.base_url}",
+                parse_retry_after(response.headers),
+            )
+        if response.status_code >= 500:
+            raise ProviderServerError(f"{response.status_code} from {self.base_url}")
+        response.raise_for_status()
+
+    def _send_once(self, conversation) -> str:
+        cassette = current_cassette()
+        if cassette is not None and cassette.replaying:
+            # A streamed recording keeps its reasoning apart; join it the way a live response is
+            events = list(cassette.replay(self.model_name.value, conversation))
+            return self._join_stream(
+                "".join(content for _, content, _ in events), "".join(reasoning for _, _, reasoning in events)
+            )
+        started = time.monotonic()
+        content = self._send_live(conversation)
+        latency_tracker(self.model_name.value, COMPLETION).add(time.monotonic() - started)
+        if cassette is not None and cassette.recording:
+            cassette.record(
+                self.model_name.value, conversation, False,
+                [(time.monotonic() - started, content, "")],
+            )
+        return content
+
+    async def _asend_once(self, conversation) -> str:
+        cassette = current_cassette()
+        if cassette is not None and cassette.replaying:
+            events = [event async for event in cassette.areplay(self.model_name.value, conversation)]
+            return self._join_stream(
+                "".join(content for _, content, _ in events), "".join(reasoning for _, _, reasoning in events)
+            )
+        started = time.monotonic()
+        content = await self._asend_live(conversation)
+        latency_tracker(self.model_name.value, COMPLETION).add(time.monotonic() - started)
+        if cassette is not None and cassette.recording:
+            await cassette.arecord(
+                self.model_name.value, conversation, False,
+                [(time.monotonic() - started, content, "")],
+            )
+        return content
+
+    def _send_live(self, conversation) -> str:
+        if self.fake is not None:
+            return self.fake.complete(conversation)
+        if self.uses_openai_client:
+            response = self.pool.openai_client().chat.completions.create(
+                model=self.model_name.value, messages=conversation
+            )
+            self._record_usage(response.usage.model_dump() if response.usage else None)
+            content = response.choices[0].message.content
+            if self.config.has_reasoning and hasattr(
+                response.choices[0].message, "reasoning_content"
+            ):
+                content = join_reasoning(response.choices[0].message.reasoning_content, content)
+            return content
+
+        url, payload = self._raw_request(conversation, stream=False)
+        response = self.pool.session().post(url, json=payload)
+        self._check_status(response)
+        data = response.json()
+        self._record_usage(data.get("usage"))
+        return self._format_message(data["choices"][0]["message"])
+
+    async def _asend_live(self, conversation) -> str:
+        if self.fake is not None:
+            return await self.fake.acomplete(conversation)
+        if self.uses_openai_client:
+            response = await self.pool.async_openai_client().chat.completions.create(
+                model=self.model_name.value, messages=conversation
+            )
+            self._record_usage(response.usage.model_dump() if response.usage else None)
+            content = response.choices[0].message.content
+            if self.config.has_reasoning and hasattr(
+                response.choices[0].message, "reasoning_content"
+            ):
+                content = join_reasoning(response.choices[0].message.reasoning_content, content)
+            return content
+
+        url, payload = self._raw_request(conversation, stream=False)
+        response = await self.pool.async_http().post(url, json=payload)
+        self._check_status(response)
+        data = response.json()
+        self._record_usage(data.get("usage"))
+        return self._format_message(data["choices"][0]["message"])
+
+    async def _aacquire(self, prompt_tokens: int) -> Scheduler:
+        """Take a scheduler slot (at the context's priority), then a limiter slot; returns the scheduler to release."""
+        scheduler = current_scheduler()
+        await scheduler.acquire(current_priority())
+        try:
+            await self.limiter.aacquire(prompt_tokens)
+        except BaseException:
+            scheduler.release()
+            raise
+        return scheduler
+
+    async def _aacquire_cancellable(
+        self, prompt_tokens: int, cancel_token: Optional[CancelToken]
+    ) -> Optional[Scheduler]:
+        """_aacquire that gives up once `cancel_token` is cancelled; returns None if it was."""
+        if cancel_token is None:
+            return await self._aacquire(prompt_tokens)
+
+        loop = asyncio.get_running_loop()
+        acquiring = asyncio.ensure_future(self._aacquire(prompt_tokens))
+        unregister = cancel_token.on_cancel(lambda: loop.call_soon_threadsafe(acquiring.cancel))
+        try:
+            await asyncio.wait({acquiring})
+        finally:
+            unregister()
+            if not acquiring.done():
+                # The caller itself was cancelled
+                acquiring.cancel()
+                await asyncio.gather(acquiring, return_exceptions=True)
+        if acquiring.cancelled():
+            return None
+        scheduler = acquiring.result()
+        if cancel_token.cancelled:
+            # The slots were granted just as the token fired; nothing will be sent on them
+            self.limiter.release()
+            scheduler.release()
+            return None
+        return scheduler
+
+    def _release_after_failure(self, error) -> Optional[float]:
+        """Hand the limiter slot back after a failed attempt; returns the provider's Retry-After."""
+        retry_after = None
+        rate_limited = isinstance(error, RATE_LIMIT_ERRORS)
+        if isinstance(error, ProviderRateLimitError):
+            retry_after = error.retry_after
+        elif isinstance(error, openai.RateLimitError):
+            retry_after = parse_retry_after(error.response.headers)
+        self.limiter.release(rate_limited=rate_limited)
+        if rate_limited:
+            self.limiter.on_rate_limited(retry_after)
+        return retry_after
+
+    @traced(streamed=False)
     def send_request(
         self,
         conversation,
@@ -92,127 +587,206 @@ class Model:
         max_retries=3,
         initial_delay=1,
         backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
     ):
         """
         Send a request to the model API with optional exponential backoff for retrying failed requests.
 
+        Every attempt goes through the provider's rate limiter; 429 responses
+        shrink the provider's concurrency and their Retry-After is honoured.
+
         Args:
             conversation: The conversation to send to the model
             use_backoff: Whether to use exponential backoff on retryable errors
             max_retries: Maximum number of retry attempts
             initial_delay: Initial delay in seconds before first retry
             backoff_factor: Factor by which to increase delay on each retry
+            use_cache: Whether to consult the response cache (if one is configured)
+            sample_index: Distinguishes repeated samples of the same conversation in the cache key
 
         Returns:
             The model's response content
         """
-        load_dotenv()
-        api_key = os.getenv(self.config.api_key_env)
-        client = openai.OpenAI(api_key=api_key, base_url=self.base_url)
-
         if self.config.requires_conversation_fix:
             conversation = self.fix_conversation(conversation)
 
-        retryable_errors = (
-            openai.APIError,
-            openai.APIConnectionError,
-            openai.RateLimitError,
-            requests.exceptions.Timeout,
-            requests.exceptions.ConnectionError,
-            json.JSONDecodeError,
-        )
+        cache_key = self._cache_key(conversation, use_cache, sample_index)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._mark_cached()
+                return cached
 
         attempts = 0
         delay = initial_delay
+        prompt_tokens = estimate_tokens(conversation)
 
         while True:
+            self.limiter.acquire(prompt_tokens)
+            released = False
+            completion_tokens = 0
             try:
-                # Special handling for OpenRouter
-                if "openrouter" in self.base_url:
-
-                    headers = {
-                        "Authorization": f"Bearer {os.getenv("OPENROUTER_API_KEY")}",
-                        "Content-Type": "application/json",
-                    }
-                    payload = {
-                        "model": self.model_name.value,
-                        "messages": conversation,
-                        "include_reasoning": self.config.has_reasoning,
-                    }
-
-                    response = requests.post(self.base_url, headers=headers, data=json.dumps(payload))
-                    reasoning_content = response.json()['choices'][0]['message']['reasoning']
-                    content = response.json()['choices'][0]['message']['content']
-
-                    content = f"<thinking>{reasoning_content}</thinking>\n\n{content}"
-                elif "deepseek" in self.base_url:
-                    # Direct API call to DeepSeek
-                    api_url = f"{self.base_url}/chat/completions"
-                    headers = {
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {os.getenv(self.config.api_key_env)}"
-                    }
-
-                    payload = {
-                        "model": self.model_name.value,
-                        "messages": conversation,
-                        "stream": False
-                    }
-
-                    response = requests.post(api_url, headers=headers, json=payload)
-                    response.raise_for_status()
-
-                    data = response.json()
-                    content = data['choices'][0]['message']['content']
-
-                    if self.config.has_reasoning and 'reasoning_content' in data['choices'][0]['message']:
-                        reasoning = data['choices'][0]['message']['reasoning_content']
-                        content = f"<thinking>{reasoning}</thinking>\n\n{content}"
+                content = self._send_once(conversation)
+                completion_tokens = len(content) // 4
+                self._record_attempt(attempts, conversation, content)
+                if cache_key is not None:
+                    self.cache.put(cache_key, content)
+                return content
 
-                else:
-                    # Standard OpenAI API handling
-                    response = client.chat.completions.create(
-                        model=self.model_name.value, messages=conversation
-                    )
+            except RETRYABLE_ERRORS as e:
+                retry_after = self._release_after_failure(e)
+                released = True
+                attempts += 1
+                sleep_time = self._next_backoff(e, attempts, max_retries, use_backoff, delay)
+                time.sleep(max(sleep_time, retry_after or 0))
+
+                # Increase delay for next retry
+                delay *= backoff_factor
 
-                    content = response.choices[0].message.content
-                    if self.config.has_reasoning and hasattr(
-                        response.choices[0].message, "reasoning_content"
-                    ):
-                        content = f"<thinking>{response.choices[0].message.reasoning_content}</thinking>\n\n{content}"
+            except Exception as e:
+                # For non-retryable errors, just raise immediately
+                log(LogLevel.ERROR, "request_error", f"Non-retryable error in API request: {str(e)}", model=self.model_name.value)
+                raise
 
-                return content
+            finally:
+                if not released:
+                    self.limiter.release(completion_tokens)
 
-            except retryable_errors as e:
-                attempts += 1
+    @traced(streamed=False)
+    async def asend_request(
+        self,
+        conversation,
+        use_backoff=True,
+        max_retries=3,
+        initial_delay=1,
+        backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
+    ):
+        """
+        Async counterpart of send_request; cancelling the task aborts the HTTP request.
 
-                # Log the error
-                print(
-                    f"API request failed (attempt {attempts}/{max_retries}): {str(e)}"
-                )
+        With a HedgePolicy, an attempt that outlives the policy's latency
+        percentile is duplicated and the first response wins.
+        """
+        raw_conversation = conversation
+        conversation = self._prepare(conversation)
 
-                # If we've reached max retries or backoff is disabled, raise the exception
-                if attempts >= max_retries or not use_backoff:
-                    print(
-                        f"Maximum retries reached, giving up after {attempts} attempts"
-                    )
-                    raise
+        cache_key = self._cache_key(conversation, use_cache, sample_index)
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                self._mark_cached()
+                return cached
 
-                # Calculate backoff delay with jitter (±20% randomness)
-                jitter = random.uniform(0.8, 1.2)
-                sleep_time = delay * jitter
+        attempts = 0
+        delay = initial_delay
+        prompt_tokens = estimate_tokens(conversation)
 
-                print(f"Retrying in {sleep_time:.2f} seconds...")
-                time.sleep(sleep_time)
+        while True:
+            scheduler = await self._aacquire(prompt_tokens)
+            released = False
+            completion_tokens = 0
+            try:
+                if self.hedge is None:
+                    content = await self._asend_once(conversation)
+                else:
+                    content = await self._asend_hedged(raw_conversation, conversation, prompt_tokens)
+                completion_tokens = len(content) // 4
+                self._record_attempt(attempts, conversation, content)
+                if cache_key is not None:
+                    await asyncio.to_thread(self.cache.put, cache_key, content)
+                return content
 
-                # Increase delay for next retry
-                delay *= backoff_factor
+            except RETRYABLE_ERRORS as e:
+                retry_after = self._release_after_failure(e)
+                released = True
+                attempts += 1
+                sleep_time = max(self._next_backoff(e, attempts, max_retries, use_backoff, delay), retry_after or 0)
 
             except Exception as e:
-                # For non-retryable errors, just raise immediately
-                print(f"Non-retryable error in API request: {str(e)}")
+                log(LogLevel.ERROR, "request_error", f"Non-retryable error in API request: {str(e)}", model=self.model_name.value)
                 raise
 
+            finally:
+                if not released:
+                    self.limiter.release(completion_tokens)
+                scheduler.release()
+
+            # Back off without holding a scheduler or limiter slot, so other calls can run meanwhile
+            await asyncio.sleep(sleep_time)
+            delay *= backoff_factor
+
+    async def _aduplicate(self, attempt: Awaitable, prompt_tokens: int):
+        """Run a hedge duplicate of this model under its own scheduler and limiter slots."""
+        scheduler = await self._aacquire(prompt_tokens)
+        released = False
+        try:
+            return await attempt
+        except RETRYABLE_ERRORS as e:
+            self._release_after_failure(e)
+            released = True
+            raise
+        finally:
+            if not released:
+                self.limiter.release()
+            scheduler.release()
+
+    async def _asend_hedged(self, raw_conversation, conversation, prompt_tokens: int) -> str:
+        """One non-streamed attempt, duplicated once it takes longer than the hedge percentile."""
+        count_hedge(self.model_name.value, "requests")
+        tracker = latency_tracker(self.model_name.value, COMPLETION)
+        delay = self.hedge.delay(tracker)
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self._asend_once(conversation))
+        tasks = [primary]
+        try:
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+            if delay is None or primary.done():
+                return await primary
+
+            backup_model = self.hedge.alternate or self
+            backup = asyncio.ensure_future(
+                backup_model._aduplicate(
+                    backup_model._asend_once(backup_model._prepare(raw_conversation)), prompt_tokens
+                )
+            )
+            tasks.append(backup)
+            winner = await first_successful(tasks)
+            self._mark_hedge(backup_model, winner is backup)
+            if not primary.done():
+                self._record_lost_primary(tracker, started)
+            return winner.result()
+        finally:
+            # Cancelling the loser aborts its HTTP request
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    def _next_backoff(error, attempts, max_retries, use_backoff, delay) -> float:
+        """Log a failed attempt and return how long to sleep, re-raising once retries are exhausted."""
+        # If we've reached max retries or backoff is disabled, raise the exception
+        if attempts >= max_retries or not use_backoff:
+            log(
+                LogLevel.WARNING, "request_failed",
+                f"API request failed (attempt {attempts}/{max_retries}), giving up: {str(error)}",
+                attempt=attempts, error=str(error),
+            )
+            raise error
+
+        # Calculate backoff delay with jitter (±20% randomness)
+        jitter = random.uniform(0.8, 1.2)
+        sleep_time = delay * jitter
+        log(
+            LogLevel.WARNING, "request_failed",
+            f"API request failed (attempt {attempts}/{max_retries}), retrying in {sleep_time:.2f}s: {str(error)}",
+            attempt=attempts, error=str(error), retry_in=sleep_time,
+        )
+        return sleep_time
+
     def send_request_times(
         self,
         conversation,
@@ -221,23 +795,284 @@ class Model:
         max_retries=3,
         initial_delay=1,
         backoff_factor=2,
+        use_cache=True,
     ):
-        """Send the same conversation request multiple times in parallel with backoff support"""
-        with ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(
-                    self.send_request,
-                    conversation,
-                    use_backoff,
-                    max_retries,
-                    initial_delay,
-                    backoff_factor,
+        """
+        Send the same conversation request multiple times in parallel with backoff support
+
+        Each request gets its own sample index, so a cached rerun reproduces all samples.
+        """
+        scheduler = current_scheduler()
+        futures = [
+            scheduler.submit(
+                self.send_request,
+                conversation,
+                use_backoff,
+                max_retries,
+                initial_delay,
+                backoff_factor,
+                use_cache,
+                i,
+                priority=current_priority(),
+            )
+            for i in range(num_requests)
+        ]
+        return [future.result() for future in futures]
+
+    async def asend_request_times(
+        self,
+        conversation,
+        num_requests,
+        use_backoff=True,
+        max_retries=3,
+        initial_delay=1,
+        backoff_factor=2,
+        use_cache=True,
+    ):
+        """Async counterpart of send_request_times, fanned out with asyncio.gather"""
+        return await asyncio.gather(
+            *(
+                self.asend_request(
+                    conversation, use_backoff, max_retries, initial_delay, backoff_factor,
+                    use_cache, i,
                 )
-                for _ in range(num_requests)
-            ]
-            results = [future.result() for future in futures]
-        return results
+                for i in range(num_requests)
+            )
+        )
+
+    def _stream_once(self, conversation, buffer: StreamBuffer, cancel_token: CancelToken) -> bool:
+        """
+        Stream one attempt into `buffer`, replaying or recording it if a cassette is active.
+
+        Returns:
+            False if the stream was stopped early through `cancel_token`
+        """
+        cassette = current_cassette()
+        if cassette is not None and cassette.replaying:
+            for _, content, reasoning in cassette.replay(self.model_name.value, conversation):
+                if cancel_token.cancelled:
+                    log(LogLevel.DEBUG, "stream_cancelled", "Streaming request canceled", model=self.model_name.value)
+                    return False
+                buffer.add(content, reasoning)
+            return True
+
+        buffer.started = time.monotonic()
+        try:
+            completed = self._stream_live(conversation, buffer, cancel_token)
+        finally:
+            self._record_first_token(buffer)
+        if completed and cassette is not None and cassette.recording:
+            cassette.record(self.model_name.value, conversation, True, buffer.events)
+        return completed
+
+    async def _astream_once(self, conversation, buffer: StreamBuffer) -> None:
+        cassette = current_cassette()
+        if cassette is not None and cassette.replaying:
+            async for _, content, reasoning in cassette.areplay(self.model_name.value, conversation):
+                buffer.add(content, reasoning)
+            return
+
+        buffer.started = time.monotonic()
+        try:
+            await self._astream_live(conversation, buffer)
+        finally:
+            self._record_first_token(buffer)
+        if cassette is not None and cassette.recording:
+            await cassette.arecord(self.model_name.value, conversation, True, buffer.events)
+
+    def _stream_live(self, conversation, buffer: StreamBuffer, cancel_token: CancelToken) -> bool:
+        if self.fake is not None:
+            completed = self.fake.stream(
+                conversation, lambda delta: buffer.add(delta, ""), lambda: cancel_token.cancelled
+            )
+            if not completed:
+                log(LogLevel.DEBUG, "stream_cancelled", "Streaming request canceled", model=self.model_name.value)
+            return completed
+        if self.uses_openai_client:
+            stream = self.pool.openai_client().chat.completions.create(
+                model=self.model_name.value,
+                messages=conversation,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            # Closing the response from the cancelling thread ends the read below at once
+            unregister = cancel_token.on_cancel(stream.close)
+            try:
+                with stream:
+                    for chunk in stream:
+                        if cancel_token.cancelled:
+                            break
+                        decoded = self._decode_chunk(chunk.model_dump())
+                        if decoded is not None:
+                            buffer.apply(decoded)
+            except Exception:
+                if not cancel_token.cancelled:
+                    raise
+            finally:
+                unregister()
+            if cancel_token.cancelled:
+                log(LogLevel.DEBUG, "stream_cancelled", "Streaming request canceled", model=self.model_name.value)
+                return False
+            return True
+
+        url, payload = self._raw_request(conversation, stream=True)
+        with self.pool.session().post(url, json=payload, stream=True) as response:
+            unregister = cancel_token.on_cancel(response.close)
+            try:
+                self._check_status(response)
+                for line in response.iter_lines():
+                    if cancel_token.cancelled:
+                        break
+                    decoded = self._decode_sse_line(line) if line else None
+                    if decoded is _SSE_DONE:
+                        break
+                    if decoded is not None:
+                        buffer.apply(decoded)
+            except Exception:
+                if not cancel_token.cancelled:
+                    raise
+            finally:
+                unregister()
+        if cancel_token.cancelled:
+            log(LogLevel.DEBUG, "stream_cancelled", "Streaming request canceled", model=self.model_name.value)
+            return False
+        return True
+
+    async def _astream_cancellable(
+        self, conversation, buffer: StreamBuffer, cancel_token: Optional[CancelToken]
+    ) -> bool:
+        """Run one streamed attempt; returns False if `cancel_token` stopped it."""
+        if cancel_token is None:
+            await self._astream_once(conversation, buffer)
+            return True
+
+        loop = asyncio.get_running_loop()
+        attempt = asyncio.ensure_future(self._astream_once(conversation, buffer))
+        unregister = cancel_token.on_cancel(lambda: loop.call_soon_threadsafe(attempt.cancel))
+        try:
+            await asyncio.wait({attempt})
+        finally:
+            unregister()
+            if not attempt.done():
+                # The caller itself was cancelled
+                attempt.cancel()
+                await asyncio.gather(attempt, return_exceptions=True)
+        if attempt.cancelled():
+            log(LogLevel.DEBUG, "stream_cancelled", "Streaming request canceled", model=self.model_name.value)
+            return False
+        attempt.result()
+        return True
+
+    async def _astream_hedged(
+        self,
+        raw_conversation,
+        conversation,
+        buffer: StreamBuffer,
+        call_token: Optional[CancelToken],
+        prompt_tokens: int,
+    ) -> bool:
+        """
+        One streamed attempt, duplicated if it has no first token by the hedge percentile.
 
+        Each stream fills its own buffer; the first to produce a token claims
+        `buffer` (and with it on_delta and stop_when), and the other is cancelled.
+        """
+        count_hedge(self.model_name.value, "requests")
+        tracker = latency_tracker(self.model_name.value, FIRST_TOKEN)
+        delay = self.hedge.delay(tracker)
+        started = time.monotonic()
+        claimed = asyncio.Event()
+        attempts: Dict[asyncio.Future, Tuple[StreamBuffer, CancelToken]] = {}
+        winner: List[asyncio.Future] = []
+
+        def start(model: "Model", attempt_conversation, duplicate: bool) -> asyncio.Future:
+            token = call_token.child() if call_token is not None else CancelToken()
+            attempt_buffer = StreamBuffer(record_events=buffer.events is not None)
+            coro = model._astream_cancellable(attempt_conversation, attempt_buffer, token)
+            task = asyncio.ensure_future(model._aduplicate(coro, prompt_tokens) if duplicate else coro)
+
+            def forward(content: str, reasoning: str) -> None:
+                if not winner:
+                    winner.append(task)
+                    claimed.set()
+                    for other, (_, other_token) in attempts.items():
+                        if other is not task:
+                            other_token.cancel()
+                if winner[0] is task:
+                    buffer.add(content, reasoning)
+
+            attempt_buffer.on_delta = forward
+            attempts[task] = (attempt_buffer, token)
+            return task
+
+        primary = start(self, conversation, duplicate=False)
+        waiter = asyncio.ensure_future(claimed.wait())
+        try:
+            if delay is not None:
+                await asyncio.wait({primary, waiter}, timeout=delay)
+            if delay is None or claimed.is_set() or primary.done():
+                task = primary
+            else:
+                backup_model = self.hedge.alternate or self
+                backup = start(backup_model, backup_model._prepare(raw_conversation), duplicate=True)
+                pending = {primary, backup}
+                # Either stream's first token decides; failing that, the first to finish cleanly
+                while not claimed.is_set():
+                    await asyncio.wait(pending | {waiter}, return_when=asyncio.FIRST_COMPLETED)
+                    finished = {t for t in pending if t.done()}
+                    successful = [t for t in finished if not t.cancelled() and t.exception() is None]
+                    if claimed.is_set() or successful:
+                        break
+                    pending -= finished
+                    if not pending:
+                        break
+                task = winner[0] if winner else (successful[0] if successful else primary)
+                self._mark_hedge(backup_model, task is backup)
+                if task is backup and attempts[primary][0].first_token_at is None:
+                    self._record_lost_primary(tracker, started)
+            completed = await task
+            buffer.usage = attempts[task][0].usage
+            return completed
+        finally:
+            waiter.cancel()
+            for attempt, (_, token) in attempts.items():
+                if not attempt.done():
+                    token.cancel()
+                    attempt.cancel()
+            await asyncio.gather(waiter, *attempts, return_exceptions=True)
+
+    async def _astream_live(self, conversation, buffer: StreamBuffer) -> None:
+        if self.fake is not None:
+            await self.fake.astream(conversation, lambda delta: buffer.add(delta, ""))
+            return
+        if self.uses_openai_client:
+            stream = await self.pool.async_openai_client().chat.completions.create(
+                model=self.model_name.value,
+                messages=conversation,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async with stream:
+                async for chunk in stream:
+                    decoded = self._decode_chunk(chunk.model_dump())
+                    if decoded is not None:
+                        buffer.apply(decoded)
+            return
+
+        url, payload = self._raw_request(conversation, stream=True)
+        async with self.pool.async_http().stream("POST", url, json=payload) as response:
+            if response.status_code == 429:
+                await response.aread()
+            self._check_status(response)
+
+            async for line in response.aiter_lines():
+                decoded = self._decode_sse_line(line) if line else None
+                if decoded is _SSE_DONE:
+                    break
+                if decoded is not None:
+                    buffer.apply(decoded)
+
+    @traced(streamed=True)
     def send_request_streaming(
         self,
         conversation,
@@ -245,186 +1080,553 @@ class Model:
         max_retries=3,
         initial_delay=1,
         backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
+        cancel_token: Optional[CancelToken] = None,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+        stop_when: Optional[StopPredicate] = None,
     ):
         """
         Send a request in streaming mode that can be canceled mid-generation
         
-        Returns the response so far if canceled, or the complete response if not canceled
-        """
-        load_dotenv()
-        api_key = os.getenv(self.config.api_key_env)
+        Returns the response so far if canceled, or the complete response if not canceled.
+        Only rate-limit rejections (which arrive before any output) are retried,
+        and only complete responses are written to the cache.
 
+        Args:
+            cancel_token: Cancelling it (from any thread) closes this request's
+                stream immediately; other requests on this Model are unaffected
+            on_delta: Called with each (content, reasoning) delta as it arrives
+                (once with the whole response on a cache hit)
+            stop_when: Called with each content delta; once it returns True the
+                stream is closed and the partial response returned, e.g.
+                stop_on("SOLUTION INCORRECT")
+        """
         if self.config.requires_conversation_fix:
             conversation = self.fix_conversation(conversation)
 
-        # Reset cancel flag before starting
-        self.cancel_stream = False
-
-        if "openrouter" in self.base_url:
-            headers = {
-                "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
-                "Content-Type": "application/json",
-            }
-            payload = {
-                "model": self.model_name.value,
-                "messages": conversation,
-                "include_reasoning": self.config.has_reasoning,
-                "stream": True,
-            }
-
-            response_text = ""
-            reasoning_text = ""
-
-            try:
-                with requests.post(self.base_url, headers=headers, json=payload, stream=True) as response:
-                    response.raise_for_status()
-
-                    for line in response.iter_lines():
-                        if self.cancel_stream:
-                            print("Streaming request canceled")
-                            break
-
-                        if line:
-                            line = line.decode('utf-8')
-                            if line.startswith('data:'):
-                                line = line[5:].strip()
-                                if line == "[DONE]":
-                                    break
-
-                                try:
-                                    chunk = json.loads(line)
-                                    delta = chunk['choices'][0].get('delta', {})
-
-                                    if 'content' in delta and delta['content'] is not None:
-                                        response_text += delta['content']
-                                        # print(delta['content'], end="") #####
-                                    if 'reasoning' in delta and delta['reasoning'] is not None:
-                                        reasoning_text += delta['reasoning']
-                                        # print(delta['reasoning'], end="") #####
-                                except json.JSONDecodeError:
-                                    continue
-
-                if reasoning_text:
-                    return f"<thinking>{reasoning_text}</thinking>\n\n{response_text}"
-                return response_text
+        cache_key = self._cache_key(conversation, use_cache, sample_index)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._mark_cached()
+                if on_delta is not None:
+                    on_delta(cached, "")
+                return cached
+
+        # Own token, so stop_when only ends this call; the caller's token is linked to it
+        call_token = CancelToken()
+        unlink = cancel_token.on_cancel(call_token.cancel) if cancel_token is not None else None
+        cassette = current_cassette()
+        buffer = StreamBuffer(
+            record_events=cassette is not None and cassette.recording,
+            on_delta=on_delta,
+            stop_when=stop_when,
+            cancel_token=call_token,
+        )
+        attempts = 0
+        delay = initial_delay
+        prompt_tokens = estimate_tokens(conversation)
+
+        try:
+            while True:
+                if call_token.cancelled:
+                    return self._join_stream(buffer.content, buffer.reasoning)
+                self.limiter.acquire(prompt_tokens)
+                released = False
+                try:
+                    completed = self._stream_once(conversation, buffer, call_token)
+                    response = self._join_stream(buffer.content, buffer.reasoning)
+                    if completed and cache_key is not None:
+                        self.cache.put(cache_key, response)
+                    return response
+
+                except RATE_LIMIT_ERRORS as e:
+                    retry_after = self._release_after_failure(e)
+                    released = True
+                    attempts += 1
+                    try:
+                        sleep_time = self._next_backoff(e, attempts, max_retries, use_backoff, delay)
+                    except RATE_LIMIT_ERRORS:
+                        return f"[Error: rate limited: {e}]"
+                    time.sleep(max(sleep_time, retry_after or 0))
+                    delay *= backoff_factor
+
+                except Exception as e:
+                    log(LogLevel.WARNING, "stream_error", f"Error during streaming: {e}", model=self.model_name.value)
+                    # Return what we have so far if there's any content
+                    if not buffer.content:
+                        return f"[Error: {e}]"
+                    return self._join_stream(buffer.content, buffer.reasoning)
+
+                finally:
+                    self._record_attempt(attempts, conversation, buffer.content + buffer.reasoning, buffer)
+                    if not released:
+                        self.limiter.release(len(buffer.content) // 4)
+        finally:
+            if unlink is not None:
+                unlink()
+
+    @traced(streamed=True)
+    async def asend_request_streaming(
+        self,
+        conversation,
+        use_backoff=True,
+        max_retries=3,
+        initial_delay=1,
+        backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
+        cancel_token: Optional[CancelToken] = None,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+        stop_when: Optional[StopPredicate] = None,
+    ):
+        """
+        Async counterpart of send_request_streaming.
 
-            except Exception as e:
-                print(f"Error during streaming: {e}")
-                # Return what we have so far if there's any content
-                if reasoning_text:
-                    return f"<thinking>{reasoning_text}</thinking>\n\n{response_text}" if response_text else f"[Error: {e}]"
-                return response_text if response_text else f"[Error: {e}]"
-
-        elif "deepseek" in self.base_url:
-            api_url = f"{self.base_url}/chat/completions"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {os.getenv(self.config.api_key_env)}"
-            }
+        Cancelling `cancel_token` (or `stop_when` firing) closes the underlying HTTP
+        stream immediately and returns the partial response. Cancelling the awaiting
+        task instead also closes the stream, but raises asyncio.CancelledError in the caller.
+        With a HedgePolicy, an attempt without a first token by the policy's latency
+        percentile is duplicated; the first stream to produce a token is the one kept.
+        """
+        raw_conversation = conversation
+        conversation = self._prepare(conversation)
+
+        cache_key = self._cache_key(conversation, use_cache, sample_index)
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                self._mark_cached()
+                if on_delta is not None:
+                    on_delta(cached, "")
+                return cached
+
+        # Without a token or stop predicate the stream runs in the caller's task
+        call_token = CancelToken() if cancel_token is not None or stop_when is not None else None
+        unlink = cancel_token.on_cancel(call_token.cancel) if cancel_token is not None else None
+        cassette = current_cassette()
+        buffer = StreamBuffer(
+            record_events=cassette is not None and cassette.recording,
+            on_delta=on_delta,
+            stop_when=stop_when,
+            cancel_token=call_token,
+        )
+        attempts = 0
+        delay = initial_delay
+        prompt_tokens = estimate_tokens(conversation)
+
+        try:
+            while True:
+                # Stop waiting for a slot as soon as the call is cancelled, without sending anything
+                scheduler = await self._aacquire_cancellable(prompt_tokens, call_token)
+                if scheduler is None:
+                    return self._join_stream(buffer.content, buffer.reasoning)
+                released = False
+                try:
+                    if self.hedge is None:
+                        completed = await self._astream_cancellable(conversation, buffer, call_token)
+                    else:
+                        completed = await self._astream_hedged(
+                            raw_conversation, conversation, buffer, call_token, prompt_tokens
+                        )
+                    response = self._join_stream(buffer.content, buffer.reasoning)
+                    if completed and cache_key is not None:
+                        await asyncio.to_thread(self.cache.put, cache_key, response)
+                    return response
+
+                except RATE_LIMIT_ERRORS as e:
+                    retry_after = self._release_after_failure(e)
+                    released = True
+                    attempts += 1
+                    try:
+                        sleep_time = self._next_backoff(e, attempts, max_retries, use_backoff, delay)
+                    except RATE_LIMIT_ERRORS:
+                        return f"[Error: rate limited: {e}]"
+                    sleep_time = max(sleep_time, retry_after or 0)
+
+                except Exception as e:
+                    log(LogLevel.WARNING, "stream_error", f"Error during streaming: {e}", model=self.model_name.value)
+                    if not buffer.content:
+                        return f"[Error: {e}]"
+                    return self._join_stream(buffer.content, buffer.reasoning)
+
+                finally:
+                    self._record_attempt(attempts, conversation, buffer.content + buffer.reasoning, buffer)
+                    if not released:
+                        self.limiter.release(len(buffer.content) // 4)
+                    scheduler.release()
+
+                # Back off without holding a scheduler or limiter slot, so other calls can run meanwhile
+                await asyncio.sleep(sleep_time)
+                delay *= backoff_factor
+        finally:
+            if unlink is not None:
+                unlink()
 
-            payload = {
-                "model": self.model_name.value,
-                "messages": conversation,
-                "stream": True
-            }
+    def stream_deltas(
+        self,
+        conversation,
+        stop_when: Optional[StopPredicate] = None,
+        cancel_token: Optional[CancelToken] = None,
+        **kwargs,
+    ) -> Iterator[StreamDelta]:
+        """
+        Yield the (content, reasoning) deltas of a streamed request as they arrive.
 
-            response_text = ""
-            reasoning_text = ""
+        The request runs through send_request_streaming on a worker thread;
+        leaving the loop early closes its stream. Extra keyword arguments are
+        passed on to send_request_streaming.
+        """
+        token = CancelToken()
+        unlink = cancel_token.on_cancel(token.cancel) if cancel_token is not None else None
+        deltas: "queue.Queue[Optional[StreamDelta]]" = queue.Queue()
 
+        def worker():
             try:
-                with requests.post(api_url, headers=headers, json=payload, stream=True) as response:
-                    response.raise_for_status()
+                self.send_request_streaming(
+                    conversation,
+                    cancel_token=token,
+                    on_delta=lambda content, reasoning: deltas.put(StreamDelta(content, reasoning)),
+                    stop_when=stop_when,
+                    **kwargs,
+                )
+            finally:
+                deltas.put(None)
+
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(worker,), daemon=True
+        ).start()
+        try:
+            while True:
+                delta = deltas.get()
+                if delta is None:
+                    return
+                yield delta
+        finally:
+            token.cancel()
+            if unlink is not None:
+                unlink()
+
+    async def astream_deltas(
+        self,
+        conversation,
+        stop_when: Optional[StopPredicate] = None,
+        cancel_token: Optional[CancelToken] = None,
+        **kwargs,
+    ) -> AsyncIterator[StreamDelta]:
+        """Async counterpart of stream_deltas; leaving the loop early cancels the request."""
+        deltas: "asyncio.Queue[Optional[StreamDelta]]" = asyncio.Queue()
+        request = asyncio.ensure_future(
+            self.asend_request_streaming(
+                conversation,
+                cancel_token=cancel_token,
+                on_delta=lambda content, reasoning: deltas.put_nowait(StreamDelta(content, reasoning)),
+                stop_when=stop_when,
+                **kwargs,
+            )
+        )
+        request.add_done_callback(lambda _: deltas.put_nowait(None))
+        try:
+            while True:
+                delta = await deltas.get()
+                if delta is None:
+                    break
+                yield delta
+            request.result()
+        finally:
+            if not request.done():
+                request.cancel()
+                await asyncio.gather(request, return_exceptions=True)
 
-                    for line in response.iter_lines():
-                        if self.cancel_stream:
-                            print("Streaming request canceled")
-                            break
+    def send_request_parallel(
+        self,
+        conversations,
+        use_backoff=True,
+        max_retries=3,
+        initial_delay=1,
+        backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
+    ):
+        """Send different conversations in parallel with backoff support"""
+        scheduler = current_scheduler()
+        futures = [
+            scheduler.submit(
+                self.send_request,
+                conversation,
+                use_backoff,
+                max_retries,
+                initial_delay,
+                backoff_factor,
+                use_cache,
+                sample_index,
+                priority=current_priority(),
+            )
+            for conversation in conversations
+        ]
+        return [future.result() for future in futures]
+
+    async def asend_request_parallel(
+        self,
+        conversations,
+        use_backoff=True,
+        max_retries=3,
+        initial_delay=1,
+        backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
+    ):
+        """Async counterpart of send_request_parallel, fanned out with asyncio.gather"""
+        return await asyncio.gather(
+            *(
+                self.asend_request(
+                    conversation, use_backoff, max_retries, initial_delay, backoff_factor,
+                    use_cache, sample_index,
+                )
+                for conversation in conversations
+            )
+        )
 
-                        if line:
-                            line = line.decode('utf-8')
-                            if line.startswith('data:'):
-                                line = line[5:].strip()
-                                if line == "[DONE]":
-                                    break
-
-                                try:
-                                    chunk = json.loads(line)
-                                    delta = chunk['choices'][0].get('delta', {})
-
-                                    if 'content' in delta and delta['content'] is not None:
-                                        response_text += delta['content']
-                                        # print(delta['content'], end="") #####
-                                    if 'reasoning_content' in delta and delta['reasoning_content'] is not None:
-                                        reasoning_text += delta['reasoning_content']
-                                        # print(delta['reasoning_content'], end="") #####
-                                except json.JSONDecodeError:
-                                    continue
-
-                if reasoning_text:
-                    return f"<thinking>{reasoning_text}</thinking>\n\n{response_text}"
-                return response_text
 
-            except Exception as e:
-                print(f"Error during streaming: {e}")
-                # Return what we have so far if there's any content
-                if reasoning_text:
-                    return f"<thinking>{reasoning_text}</thinking>\n\n{response_text}" if response_text else f"[Error: {e}]"
-                return response_text if response_text else f"[Error: {e}]"
-
-        else:
-            # Standard OpenAI streaming
-            client = openai.OpenAI(api_key=api_key, base_url=self.base_url)
-            response_text = ""
-            reasoning_text = ""
+class RoutedModel(Model):
+    """
+    A logical model served by several backends (ModelConfig.backends), e.g.
+    DeepSeek-R1 through api.deepseek.com and OpenRouter. Model(name) returns
+    one for such names.
 
-            try:
-                stream = client.chat.completions.create(
-                    model=self.model_name.value, 
-                    messages=conversation,
-                    stream=True
-                )
+    Each request goes to the fastest backend whose circuit breaker is closed.
+    A failed attempt fails over to the next backend at once instead of backing
+    off on the same endpoint; backoff only starts once every available backend
+    has failed the request. A backend that keeps failing gets no traffic until
+    its cooldown has passed and a probe request succeeds.
+    """
 
-                for chunk in stream:
-                    if self.cancel_stream:
-                        stream.close()
-                        print("Streaming request canceled")
-                        break
+    def __init__(
+        self,
+        model_type: ModelName,
+        pool_size: Optional[int] = None,
+        cache: Optional[ResponseCache] = None,
+        hedge: Optional[HedgePolicy] = None,
+        router_settings: Optional[RouterSettings] = None,
+    ) -> None:
+        super().__init__(model_type, pool_size, cache, hedge)
+        self.backends = [Model(name, pool_size, cache, hedge) for name in self.config.backends]
+        # Process-wide, so every instance of the logical model shares backend health
+        self.router = get_router(
+            model_type.value, [backend.model_name.value for backend in self.backends], router_settings
+        )
 
-                    if chunk.choices[0].delta.content is not None:
-                        response_text += chunk.choices[0].delta.content
+    def prewarm(self, connections: int = 1) -> None:
+        for backend in self.backends:
+            backend.prewarm(connections)
 
-                    # OpenAI doesn't typically stream reasoning but adding for completeness
-                    if hasattr(chunk.choices[0].delta, "reasoning_content") and chunk.choices[0].delta.reasoning_content is not None:
-                        reasoning_text += chunk.choices[0].delta.reasoning_content
+    def _route(self, call, kind, use_backoff, max_retries, initial_delay, backoff_factor, is_failure=None):
+        attempts = 0
+        delay = initial_delay
+        failed: set = set()
+        last_error = None
+        while True:
+            index = self.router.choose(kind, exclude=failed)
+            if index is None:
+                if last_error is None:
+                    last_error = ProviderServerError(f"Every backend of {self.model_name.value} is tripped")
+                attempts += 1
+                sleep_time = self._next_backoff(last_error, attempts, max_retries, use_backoff, delay)
+                time.sleep(max(sleep_time, self.router.retry_in()))
+                delay *= backoff_factor
+                failed.clear()
+                continue
+            try:
+                response = call(self.backends[index])
+            except RETRYABLE_ERRORS as e:
+                self.router.failure(index, rate_limited=isinstance(e, RATE_LIMIT_ERRORS))
+                failed.add(index)
+                last_error = e
+                continue
+            except BaseException:
+                self.router.abandon(index)
+                raise
+            if is_failure is not None and is_failure(response):
+                rate_limited = self._stream_rate_limited(response)
+                self.router.failure(index, rate_limited=rate_limited)
+                failed.add(index)
+                last_error = ProviderRateLimitError(response) if rate_limited else ProviderServerError(response)
+                continue
+            self.router.success(index)
+            return response
+
+    async def _aroute(self, call, kind, use_backoff, max_retries, initial_delay, backoff_factor, is_failure=None):
+        attempts = 0
+        delay = initial_delay
+        failed: set = set()
+        last_error = None
+        while True:
+            index = self.router.choose(kind, exclude=failed)
+            if index is None:
+                if last_error is None:
+                    last_error = ProviderServerError(f"Every backend of {self.model_name.value} is tripped")
+                attempts += 1
+                sleep_time = self._next_backoff(last_error, attempts, max_retries, use_backoff, delay)
+                await asyncio.sleep(max(sleep_time, self.router.retry_in()))
+                delay *= backoff_factor
+                failed.clear()
+                continue
+            try:
+                response = await call(self.backends[index])
+            except RETRYABLE_ERRORS as e:
+                self.router.failure(index, rate_limited=isinstance(e, RATE_LIMIT_ERRORS))
+                failed.add(index)
+                last_error = e
+                continue
+            except BaseException:
+                self.router.abandon(index)
+                raise
+            if is_failure is not None and is_failure(response):
+                rate_limited = self._stream_rate_limited(response)
+                self.router.failure(index, rate_limited=rate_limited)
+                failed.add(index)
+                last_error = ProviderRateLimitError(response) if rate_limited else ProviderServerError(response)
+                continue
+            self.router.success(index)
+            return response
+
+    @staticmethod
+    def _stream_failed(response: str) -> bool:
+        # Streaming calls report failures in-band instead of raising
+        return response.startswith("[Error:")
+
+    @staticmethod
+    def _stream_rate_limited(response: str) -> bool:
+        return response.startswith("[Error: rate limited:")
 
-                if reasoning_text:
-                    return f"<thinking>{reasoning_text}</thinking>\n\n{response_text}"
-                return response_text
+    def send_request(
+        self,
+        conversation,
+        use_backoff=True,
+        max_retries=3,
+        initial_delay=1,
+        backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
+    ):
+        return self._route(
+            lambda backend: backend.send_request(
+                conversation, use_backoff=False, use_cache=use_cache, sample_index=sample_index
+            ),
+            COMPLETION, use_backoff, max_retries, initial_delay, backoff_factor,
+        )
 
-            except Exception as e:
-                print(f"Error during streaming: {e}")
-                return response_text if response_text else f"[Error: {e}]"
+    async def asend_request(
+        self,
+        conversation,
+        use_backoff=True,
+        max_retries=3,
+        initial_delay=1,
+        backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
+    ):
+        return await self._aroute(
+            lambda backend: backend.asend_request(
+                conversation, use_backoff=False, use_cache=use_cache, sample_index=sample_index
+            ),
+            COMPLETION, use_backoff, max_retries, initial_delay, backoff_factor,
+        )
 
-    def send_request_parallel(
+    def send_request_streaming(
         self,
-        conversations,
+        conversation,
         use_backoff=True,
         max_retries=3,
         initial_delay=1,
         backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
+        cancel_token: Optional[CancelToken] = None,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+        stop_when: Optional[StopPredicate] = None,
     ):
-        """Send different conversations in parallel with backoff support"""
-        with ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(
-                    self.send_request,
-                    conversation,
-                    use_backoff,
-                    max_retries,
-                    initial_delay,
-                    backoff_factor,
-                )
-                for conversation in conversations
-            ]
-            results = [future.result() for future in futures]
-        return results
+        try:
+            return self._route(
+                lambda backend: _RoutedStream(on_delta, stop_when).send(
+                    backend, conversation, use_cache=use_cache, sample_index=sample_index, cancel_token=cancel_token,
+                ),
+                FIRST_TOKEN, use_backoff, max_retries, initial_delay, backoff_factor,
+                is_failure=self._stream_failed,
+            )
+        except RETRYABLE_ERRORS as e:
+            return str(e) if self._stream_failed(str(e)) else f"[Error: {e}]"
+
+    async def asend_request_streaming(
+        self,
+        conversation,
+        use_backoff=True,
+        max_retries=3,
+        initial_delay=1,
+        backoff_factor=2,
+        use_cache=True,
+        sample_index=None,
+        cancel_token: Optional[CancelToken] = None,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+        stop_when: Optional[StopPredicate] = None,
+    ):
+        try:
+            return await self._aroute(
+                lambda backend: _RoutedStream(on_delta, stop_when).asend(
+                    backend, conversation, use_cache=use_cache, sample_index=sample_index, cancel_token=cancel_token,
+                ),
+                FIRST_TOKEN, use_backoff, max_retries, initial_delay, backoff_factor,
+                is_failure=self._stream_failed,
+            )
+        except RETRYABLE_ERRORS as e:
+            return str(e) if self._stream_failed(str(e)) else f"[Error: {e}]"
+
+
+class _RoutedStream:
+    """
+    One backend attempt of a RoutedModel streaming request.
+
+    Every attempt gets its own instance, so the caller's `on_delta` and
+    `stop_when` only see the stream that is returned. Deltas are held back
+    until the attempt produces content: a stream that fails before that is
+    retried on the next backend and its deltas are dropped. A stream with
+    content is returned even if it breaks off later, so from its first
+    content delta on everything is forwarded as it arrives.
+    """
+
+    def __init__(self, on_delta: Optional[Callable[[str, str], None]], stop_when: Optional[StopPredicate]):
+        self.on_delta = on_delta
+        self.stop_when = stop_when
+        self.pending: List[Tuple[str, str]] = []
+        self.committed = False
+
+    def forward(self, content: str, reasoning: str) -> None:
+        if not self.committed:
+            if not content:
+                self.pending.append((content, reasoning))
+                return
+            self.committed = True
+            if self.on_delta is not None:
+                for held in self.pending:
+                    self.on_delta(*held)
+            self.pending = []
+        if self.on_delta is not None:
+            self.on_delta(content, reasoning)
+
+    def stop(self, content: str) -> bool:
+        # Content deltas reach forward() first, so only the committed stream gets here
+        return self.committed and self.stop_when is not None and self.stop_when(content)
+
+    def _options(self) -> Dict[str, Any]:
+        return {
+            "use_backoff": False,
+            "on_delta": self.forward,
+            "stop_when": self.stop if self.stop_when is not None else None,
+        }
+
+    def send(self, backend: Model, conversation, **kwargs) -> str:
+        return backend.send_request_streaming(conversation, **kwargs, **self._options())
+
+    async def asend(self, backend: Model, conversation, **kwargs) -> str:
+        return await backend.asend_request_streaming(conversation, **kwargs, **self._options())
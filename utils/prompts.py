@@ -41,6 +41,21 @@ class Prompts(Enum):
         Ensure the summary is easy to understand to help the Reasoner avoid past mistakes and explore new approaches.
         """,
     }
+    # Map-reduce condensation: each failed attempt is condensed on its own, then the reports are merged
+    CONDENSE_ATTEMPT_PROMPT = {
+        "role": "system",
+        "content": """You are the Condenser Agent in a system solving challenging math olympiad problems. You are given one failed attempt by the Reasoner together with the Verifier's feedback on it. Condense it into a short report of at most 300-500 words.
+        State the strategy the attempt used and its key steps. Identify exactly where and why the Verifier found it to fail. Extract any steps or lemmas that were correct and could be reused, and say whether the approach looks salvageable or like a dead end.
+        Do not attempt to solve the problem yourself.
+        """,
+    }
+    MERGE_CONDENSED_ATTEMPTS_PROMPT = {
+        "role": "system",
+        "content": """You are the Condenser Agent in a system solving challenging math olympiad problems. You are given short reports, each condensing one failed attempt by the Reasoner and the Verifier's feedback on it. Merge them into a single clear, actionable summary report of up to 1000-2000 words.
+        List the approaches that have been tried, merging attempts that share a strategy. Identify the errors, pitfalls, and recurring issues noted by the Verifier. Extract key insights and lessons learned from both the successful partial steps and the failures. Highlight any promising ideas that could be refined, while clearly marking strategies that appear to be dead ends.
+        Ensure the summary is easy to understand to help the Reasoner avoid past mistakes and explore new approaches.
+        """,
+    }
     REASONER_CONDENSED_DISCUSSION_PROMPT = {
         "role": "system",
         "content": """You are an expert math olympiad problem solver. Your task is to solve challenging math olympiad problems with complete, detailed, and rigorous proofs. Write your solution in a style typical for math olympiad proofs: clear, logically structured, and succinct. Use standard techniques, provide full justifications, and be creative when necessary.
@@ -64,29 +79,28 @@ class Prompts(Enum):
         Segment 3: Hence, the result follows.
         """
     }
-    PROOF_SEGMENT_VERIFIER_INITIAL_SYSTEM_PROMPT = {
+    # DeepCheck prompts: every check sends the same system prompt and problem, then the
+    # segments up to the one it checks and a short task, so checks share a cacheable prefix
+    PROOF_SEGMENT_CHECK_SYSTEM_PROMPT = {
         "role": "system",
-        "content": """You are an expert in verifying math olympiad proofs. You are provided with a problem statement and the first segment of a proof. Note that this segment is only a part of the full solution; your task is solely to verify its internal logical consistency, rigor, and correctness, not to judge whether it fully meets the problem's goal.
-        Check the provided segment for any errors, gaps, or unjustified assumptions. If the reasoning in this segment is sound on its own, end your output with "SEGMENT CORRECT" verbatim. If you find issues, clearly explain where and why the reasoning fails, and end your output with "SEGMENT INCORRECT" verbatim. Use precise mathematical language and appropriate feedback for a math olympiad context.
+        "content": """You are an expert in verifying math olympiad proofs. You are provided with a problem statement and segments of a proof, followed by one task. Perform only that task.
+        When asked to verify a segment, assume that every segment before it is fully correct and complete, and ignore the segments after it. Check the segment for logical consistency, rigor and correctness, and for its clear connection to the earlier segments and the problem's conditions (even if those conditions are not explicitly restated). Do not worry if the segment doesn't meet the goal of the problem; later segments may complete the proof. If the segment is valid, end your output with "SEGMENT CORRECT" verbatim. If you find any error or gap, explain precisely where and why the reasoning fails, and end your output with "SEGMENT INCORRECT" verbatim.
+        When asked whether the proof achieves its goal, assume that each segment is internally correct and evaluate whether the proof as a whole fully addresses the problem's requirements without overlooking any critical cases or conditions. If it conclusively solves the problem, end your output with "SOLUTION CORRECT" verbatim. Otherwise, clearly explain why and end your output with "SOLUTION INCORRECT" verbatim.
         Some Tips: Be suspicious of vague assertions such as “it can be shown” or “a more in-depth analysis will reveal” unless you can substantiate the claim.
         Be wary of arguments that address only special cases without establishing the general result. It is acceptable to invoke well-known theorems or results as long as their application is justified in context.
-        Do not worry if this doesn't meet the goal of the problem. There could be more segments to come that will complete the proof.
+        Use precise mathematical language and feedback appropriate for a math olympiad context.
         """,
     }
-    PROOF_SEGMENT_VERIFIER_SYSTEMP_PROMPT = {
-        "role": "system",
-        "content": """You are an expert in verifying math olympiad proofs. When given segments 1 to n and a subsequent segment (segment n+1), assume that segments 1 to n are fully correct and complete. 
-        Your task is to determine whether segment n+1 logically and rigorously follows from the previously verified segments and the conditions provided in the problem statement (even if those conditions are not explicitly restated in segments 1 to n).
-        Check segment n+1 for logical consistency, correctness, and its clear connection to the earlier parts and the problem’s conditions. Provide feedback in a style appropriate for math olympiad discussions. 
-        If segment n+1 is valid, end your output with "SEGMENT CORRECT" verbatim. If you find any error or gap in the reasoning, explain precisely where the reasoning fails and why, and then end your output with "SEGMENT INCORRECT" verbatim. 
-        Some Tips: Be suspicious of vague assertions such as “it can be shown” or “a more in-depth analysis will reveal” unless you can substantiate the claim. 
-        Be wary of arguments that address only special cases without establishing the general result. It is acceptable to invoke well-known theorems or results as long as their application is justified in context.  
-        Use this approach when verifying segment n+1 under the assumption that segments 1 to n are correct. Do not worry if the segment n+1 doesn't meet the goal of the problem. There could be more segments to come that will complete the proof.
-        """
+    PROOF_SEGMENT_CHECK_FIRST_SEGMENT_TASK = {
+        "role": "user",
+        "content": """Task: Verify Segment 1 on its own.""",
+    }
+    # Formatted with the 1-based index of the segment to verify
+    PROOF_SEGMENT_CHECK_NEXT_SEGMENT_TASK = {
+        "role": "user",
+        "content": """Task: Assume that Segments 1 to {previous} are correct and determine whether Segment {index} logically follows from them.""",
+    }
+    PROOF_SEGMENT_CHECK_GOAL_TASK = {
+        "role": "user",
+        "content": """Task: Determine whether the proof as a whole achieves the goal of the problem.""",
     }
-    PROOF_ACHEIVES_GOAL_SYSTEM_PROMPT = {
-        "role": "system",
-        "content": """You are an expert in verifying math olympiad proofs. You are provided with the problem statement and all segments of a proof. Assume that each segment is internally correct. Your sole task is to evaluate whether, as a whole, the proof successfully achieves the goal stated in the problem.
-        Examine the overall reasoning to ensure that the solution fully addresses the problem's requirements without overlooking any critical cases or conditions. If the complete proof conclusively solves the problem, end your output with "SOLUTION CORRECT" verbatim. If you determine that the proof fails to meet the problem's goal or contains gaps in addressing the problem, clearly explain why and end your output with "SOLUTION INCORRECT" verbatim.
-        """
-    }
\ No newline at end of file
@@ -0,0 +1,236 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import threading
+import time
+
+
+@dataclass
+class RateLimits:
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    max_in_flight: int = int(os.getenv("MODEL_MAX_IN_FLIGHT", 64))
+    # Concurrency never backs off below this many in-flight requests
+    min_in_flight: int = 1
+
+
+class ProviderRateLimitError(Exception):
+    """Raised by the raw HTTP branches when a provider answers 429."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProviderServerError(Exception):
+    """Raised by the raw HTTP branches when a provider answers with a 5xx status."""
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Seconds to wait according to a Retry-After (or retry-after-ms) header, if any."""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class _Bucket:
+    """Token bucket refilled continuously at `per_minute` / 60 units per second."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A single request larger than the bucket may go once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+
+class ProviderRateLimiter:
+    """
+    Process-wide governor for one provider (base URL + API key).
+
+    Enforces requests-per-minute, tokens-per-minute and a max-in-flight limit
+    for both threads and asyncio tasks. The in-flight limit adapts AIMD-style:
+    it is halved when the provider answers 429 and grows back by roughly one
+    request per round of successful completions. A Retry-After from the
+    provider pauses every new request until it has elapsed.
+    """
+
+    def __init__(self, name: str, limits: RateLimits):
+        self.name = name
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self.rate_limited_count = 0
+        self.configure(limits)
+
+    def configure(self, limits: RateLimits) -> None:
+        """Apply new limits in place; requests already in flight are unaffected."""
+        with self._condition:
+            self.limits = limits
+            self._requests = _Bucket(limits.requests_per_minute) if limits.requests_per_minute else None
+            self._tokens = _Bucket(limits.tokens_per_minute) if limits.tokens_per_minute else None
+            self.concurrency_limit = float(limits.max_in_flight)
+            self._wake()
+
+    def _try_acquire(self, tokens: int) -> Optional[float]:
+        """
+        Returns:
+            0 if a slot was taken, seconds to wait if rate-bound, or None if
+            the request has to wait for another one to finish
+        """
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.concurrency_limit):
+            return None
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1, now))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        if self._requests is not None:
+            self._requests.take(1)
+        if self._tokens is not None:
+            self._tokens.take(tokens)
+        self.in_flight += 1
+        return 0.0
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Block the calling thread until the request may be sent."""
+        with self._condition:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    return
+                self._condition.wait(timeout=wait)
+
+    async def aacquire(self, tokens: int = 0) -> None:
+        """Wait without blocking the event loop until the request may be sent."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    return
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            try:
+                await asyncio.wait_for(future, timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    if (loop, future) in self._async_waiters:
+                        self._async_waiters.remove((loop, future))
+
+    def release(self, tokens_adjustment: int = 0, rate_limited: bool = False) -> None:
+        """
+        Return an in-flight slot.
+
+        Args:
+            tokens_adjustment: Actual minus estimated tokens, charged to the TPM bucket
+            rate_limited: Whether the provider rejected the request with a 429
+        """
+        with self._condition:
+            self.in_flight = max(0, self.in_flight - 1)
+            if self._tokens is not None and tokens_adjustment:
+                self._tokens.take(tokens_adjustment)
+            if not rate_limited:
+                # Additive increase: about +1 per concurrency_limit successes
+                self.concurrency_limit = min(
+                    float(self.limits.max_in_flight),
+                    self.concurrency_limit + 1.0 / max(self.concurrency_limit, 1.0),
+                )
+            self._wake()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """Record a 429: halve concurrency (at most once per second) and honour Retry-After."""
+        with self._condition:
+            now = time.monotonic()
+            self.rate_limited_count += 1
+            if now - self._last_decrease >= 1.0:
+                self.concurrency_limit = max(
+                    float(self.limits.min_in_flight), self.concurrency_limit / 2
+                )
+                self._last_decrease = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            self._wake()
+
+    def _wake(self) -> None:
+        self._condition.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "concurrency_limit": self.concurrency_limit,
+                "rate_limited": self.rate_limited_count,
+            }
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def estimate_tokens(conversation) -> int:
+    """Rough prompt size (4 characters per token) used for TPM accounting before usage is known."""
+    return sum(len(message.get("content") or "") for message in conversation) // 4
+
+
+_limiters: Dict[Tuple[str, str], ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(base_url: str, api_key_env: str, limits: Optional[RateLimits] = None) -> ProviderRateLimiter:
+    """Return the process-wide limiter for a provider, creating it with `limits` on first use."""
+    key = (base_url, api_key_env)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = ProviderRateLimiter(base_url, limits or RateLimits())
+            _limiters[key] = limiter
+        return limiter
+
+
+def set_rate_limits(base_url: str, api_key_env: str, limits: RateLimits) -> ProviderRateLimiter:
+    """Replace the limits for a provider, e.g. after looking up the account's quota."""
+    limiter = get_rate_limiter(base_url, api_key_env, limits)
+    limiter.configure(limits)
+    return limiter
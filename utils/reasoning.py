@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import NamedTuple, Optional
+import re
+import threading
+
+THINKING_OPEN = "<thinking>"
+THINKING_CLOSE = "</thinking>"
+
+# Headings reasoners put in front of their final answer, e.g. "**Final Answer:**" or "## Conclusion"
+FINAL_ANSWER_HEADING = re.compile(
+    r"^[#*\s]*(final answer|answer|conclusion)\b", re.IGNORECASE | re.MULTILINE
+)
+
+
+class ReasonedResponse(NamedTuple):
+    reasoning: str
+    content: str
+
+
+def join_reasoning(reasoning: str, content: str) -> str:
+    """The single-string form Model returns for reasoning models: thinking first, then the response."""
+    if not reasoning:
+        return content
+    return f"{THINKING_OPEN}{reasoning}{THINKING_CLOSE}\n\n{content}"
+
+
+def split_reasoning(response: str) -> ReasonedResponse:
+    """Inverse of join_reasoning; a response without thinking has empty reasoning."""
+    if not response.startswith(THINKING_OPEN):
+        return ReasonedResponse("", response)
+    end = response.find(THINKING_CLOSE)
+    if end == -1:
+        # Cut off (e.g. cancelled) while still thinking
+        return ReasonedResponse(response[len(THINKING_OPEN):], "")
+    return ReasonedResponse(
+        response[len(THINKING_OPEN):end], response[end + len(THINKING_CLOSE):].lstrip("\n")
+    )
+
+
+def final_answer(content: str) -> str:
+    """
+    The last final-answer section of a response: from its last "Final Answer" /
+    "Answer" / "Conclusion" heading, else the paragraph with the last \\boxed{}.
+    The whole content when neither is there.
+    """
+    headings = list(FINAL_ANSWER_HEADING.finditer(content))
+    if headings:
+        return content[headings[-1].start():].strip()
+    boxed = content.rfind("\\boxed")
+    if boxed != -1:
+        start = content.rfind("\n\n", 0, boxed)
+        end = content.find("\n\n", boxed)
+        return content[start + 2 if start != -1 else 0:end if end != -1 else len(content)].strip()
+    return content
+
+
+class ReasoningPolicy(Enum):
+    """What verifiers, the proof divider and the condenser see of a response with reasoning."""
+
+    KEEP = "keep"  # The whole response, thinking included
+    DROP = "drop"  # The response without its thinking
+    TRUNCATE = "truncate"  # The last max_reasoning_tokens of the thinking, then the response
+    ANSWER_ONLY = "answer_only"  # Only the final-answer section of the response, see final_answer
+
+
+class ReasoningAccount:
+    """Prompt tokens a ReasoningPolicy kept out of downstream stages while solving one problem."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tokens_saved = 0
+
+    def add(self, original: str, passed: str, uses: int = 1) -> None:
+        # 4 characters per token, as in utils.rate_limit.estimate_tokens
+        saved = (len(original) - len(passed)) // 4 * uses
+        with self._lock:
+            self.tokens_saved += saved
+
+
+_current_account: ContextVar[Optional[ReasoningAccount]] = ContextVar("current_reasoning_account", default=None)
+
+
+def current_reasoning_account() -> Optional[ReasoningAccount]:
+    return _current_account.get()
+
+
+@contextmanager
+def use_reasoning_account(account: Optional[ReasoningAccount]):
+    """Charge the savings of downstream_text calls in this context to `account`."""
+    token = _current_account.set(account)
+    try:
+        yield account
+    finally:
+        _current_account.reset(token)
+
+
+def downstream_text(
+    response: str, policy: ReasoningPolicy, max_reasoning_tokens: int = 2000, uses: int = 1
+) -> str:
+    """
+    `response` as it should appear in the prompts of later stages under `policy`.
+
+    `uses` is how many prompts the text goes into (e.g. one per verifier pass);
+    the tokens it saves are charged that many times to the current ReasoningAccount.
+    """
+    if policy == ReasoningPolicy.KEEP:
+        return response
+    reasoning, content = split_reasoning(response)
+    if policy == ReasoningPolicy.DROP:
+        passed = content
+    elif policy == ReasoningPolicy.TRUNCATE:
+        max_chars = max_reasoning_tokens * 4
+        if len(reasoning) > max_chars:
+            omitted = (len(reasoning) - max_chars) // 4
+            reasoning = f"[... {omitted} tokens of reasoning omitted ...]\n{reasoning[-max_chars:]}"
+        passed = join_reasoning(reasoning, content)
+    else:
+        passed = final_answer(content)
+    account = current_reasoning_account()
+    if account is not None:
+        account.add(response, passed, uses)
+    return passed
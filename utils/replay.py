@@ -0,0 +1,152 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import os
+import threading
+import time
+
+from utils.cache import make_cache_key
+
+# (seconds since the request was sent, content delta, reasoning delta)
+StreamEvent = Tuple[float, str, str]
+
+
+class ReplayMode(Enum):
+    OFF = "off"
+    RECORD = "record"
+    REPLAY = "replay"
+
+
+class CassetteMissError(KeyError):
+    """A replayed request has no (remaining) recording in the cassette."""
+
+
+class Cassette:
+    """
+    Recorded model traffic for offline, deterministic runs.
+
+    In RECORD mode every request/response that goes through Model is appended
+    to a JSONL file, including each streamed chunk and its arrival time. In
+    REPLAY mode responses are served from that file without touching the
+    network, sleeping the recorded latencies divided by `speed` (0 disables
+    sleeping). Identical requests are replayed in the order they were recorded.
+
+    vcrpy works at the HTTP layer and stores a streamed body as one blob, so it
+    cannot reproduce chunk timing; this records at the Model layer instead.
+    """
+
+    def __init__(self, path: str, mode: ReplayMode = ReplayMode.REPLAY, speed: float = 1.0):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._occurrences: Dict[str, int] = defaultdict(int)
+        self._recordings: Dict[str, Deque[List[StreamEvent]]] = defaultdict(deque)
+        if mode == ReplayMode.REPLAY:
+            self._load()
+        elif mode == ReplayMode.RECORD and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == ReplayMode.RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == ReplayMode.REPLAY
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._recordings[entry["key"]].append(
+                        [tuple(event) for event in entry["events"]]
+                    )
+
+    @staticmethod
+    def request_key(model_name: str, conversation: List[Dict[str, Any]]) -> str:
+        return make_cache_key(model_name, conversation)
+
+    def record(self, model_name: str, conversation, stream: bool, events: List[StreamEvent]) -> None:
+        key = self.request_key(model_name, conversation)
+        entry = {"key": key, "model": model_name, "stream": stream, "events": events}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    async def arecord(self, model_name: str, conversation, stream: bool, events: List[StreamEvent]) -> None:
+        """Async counterpart of record; the file is written off the event loop."""
+        await asyncio.to_thread(self.record, model_name, conversation, stream, events)
+
+    def _next(self, model_name: str, conversation) -> List[StreamEvent]:
+        key = self.request_key(model_name, conversation)
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if not recordings:
+                raise CassetteMissError(
+                    f"No recording left for {model_name} request {key[:12]} in {self.path}"
+                )
+            return recordings.popleft()
+
+    def _delay(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed else 0.0
+
+    def replay(self, model_name: str, conversation) -> Iterator[StreamEvent]:
+        """Yield recorded chunks, sleeping between them to reproduce the recorded timing."""
+        elapsed = 0.0
+        for offset, content, reasoning in self._next(model_name, conversation):
+            delay = self._delay(offset - elapsed)
+            if delay > 0:
+                time.sleep(delay)
+            elapsed = offset
+            yield offset, content, reasoning
+
+    async def areplay(self, model_name: str, conversation):
+        """Async counterpart of replay."""
+        elapsed = 0.0
+        for offset, content, reasoning in self._next(model_name, conversation):
+            delay = self._delay(offset - elapsed)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elapsed = offset
+            yield offset, content, reasoning
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def _env_cassette() -> Optional[Cassette]:
+    """Cassette selected through MODEL_REPLAY_MODE, MODEL_CASSETTE and MODEL_REPLAY_SPEED."""
+    mode = ReplayMode(os.getenv("MODEL_REPLAY_MODE", "off").lower())
+    if mode == ReplayMode.OFF:
+        return None
+    path = os.getenv("MODEL_CASSETTE", os.path.join("cassettes", "default.jsonl"))
+    with _cassettes_lock:
+        cassette = _cassettes.get(path)
+        if cassette is None:
+            cassette = Cassette(path, mode, float(os.getenv("MODEL_REPLAY_SPEED", 1.0)))
+            _cassettes[path] = cassette
+        return cassette
+
+
+_current_cassette: ContextVar[Optional[Cassette]] = ContextVar("current_cassette", default=None)
+
+
+def current_cassette() -> Optional[Cassette]:
+    return _current_cassette.get() or _env_cassette()
+
+
+@contextmanager
+def use_cassette(cassette: Optional[Cassette]):
+    """Record or replay every Model request made in this context (tasks created inside inherit it)."""
+    token = _current_cassette.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _current_cassette.reset(token)
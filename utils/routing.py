@@ -0,0 +1,187 @@
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Deque, Dict, List, Optional, Tuple
+import threading
+import time
+
+from utils.hedging import latency_tracker
+from utils.transcript import LogLevel, log
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"  # Taking traffic
+    OPEN = "open"  # Tripped; no traffic until the cooldown has passed
+    HALF_OPEN = "half open"  # Cooldown over; one probe request decides
+
+
+@dataclass
+class RouterSettings:
+    # Consecutive failures that trip a backend's breaker
+    failure_threshold: int = 3
+    # Seconds a tripped backend gets no traffic; doubles each time a probe fails
+    cooldown: float = 30.0
+    max_cooldown: float = 600.0
+    # Outcomes kept per backend for its error and 429 rates
+    window: int = 50
+    # Outcomes older than this many seconds no longer count, so a backend that
+    # lost its traffic to errors is not penalised forever
+    horizon: float = 120.0
+
+
+class BackendHealth:
+    """Rolling error and 429 rates plus a circuit breaker for one backend of a route."""
+
+    def __init__(self, name: str, settings: RouterSettings):
+        self.name = name
+        self.settings = settings
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = settings.cooldown
+        self.open_until = 0.0
+        self.probing = False
+        # (finished at, failed, rate_limited) per recent request
+        self.outcomes: Deque[Tuple[float, bool, bool]] = deque(maxlen=settings.window)
+
+    def _recent(self) -> List[Tuple[float, bool, bool]]:
+        since = time.monotonic() - self.settings.horizon
+        return [outcome for outcome in self.outcomes if outcome[0] >= since]
+
+    @property
+    def error_rate(self) -> float:
+        recent = self._recent()
+        if not recent:
+            return 0.0
+        return sum(1 for _, failed, _ in recent if failed) / len(recent)
+
+    @property
+    def rate_limited_rate(self) -> float:
+        recent = self._recent()
+        if not recent:
+            return 0.0
+        return sum(1 for _, _, rate_limited in recent if rate_limited) / len(recent)
+
+    def available(self, now: float) -> bool:
+        if self.state == BreakerState.OPEN and now >= self.open_until:
+            self.state = BreakerState.HALF_OPEN
+        if self.state == BreakerState.HALF_OPEN:
+            return not self.probing
+        return self.state == BreakerState.CLOSED
+
+    def score(self, kind: str) -> float:
+        """Lower is better: median latency (plus a second), inflated by recent errors and 429s."""
+        median = latency_tracker(self.name, kind).percentile(50)
+        # Backends without samples yet look fast, so they get tried and measured
+        latency = median if median is not None else 0.0
+        return (latency + 1.0) * (1 + 2 * self.error_rate + 4 * self.rate_limited_rate)
+
+    def success(self) -> None:
+        self.outcomes.append((time.monotonic(), False, False))
+        self.consecutive_failures = 0
+        self.probing = False
+        if self.state != BreakerState.CLOSED:
+            log(LogLevel.INFO, "breaker_closed", f"Backend {self.name} recovered, closing its circuit breaker", backend=self.name)
+            self.state = BreakerState.CLOSED
+            self.cooldown = self.settings.cooldown
+
+    def failure(self, rate_limited: bool, now: float) -> None:
+        self.outcomes.append((now, True, rate_limited))
+        was_probe, self.probing = self.probing, False
+        # A 429 means busy rather than broken: it steers traffic away through score(), but never trips the breaker
+        if rate_limited:
+            return
+        self.consecutive_failures += 1
+        if was_probe or self.state == BreakerState.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.settings.max_cooldown)
+            self._trip(now)
+        elif self.state == BreakerState.CLOSED and self.consecutive_failures >= self.settings.failure_threshold:
+            self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        log(
+            LogLevel.WARNING, "breaker_opened",
+            f"Backend {self.name} keeps failing, opening its circuit breaker for {self.cooldown:.0f}s",
+            backend=self.name, cooldown=self.cooldown,
+        )
+        self.state = BreakerState.OPEN
+        self.open_until = now + self.cooldown
+
+
+class Router:
+    """
+    Picks a backend for each request of a logical model: the fastest one
+    whose circuit breaker lets traffic through.
+
+    Shared process-wide per route (see get_router), so every caller of the
+    logical model sees the same health.
+    """
+
+    def __init__(self, name: str, backends: List[str], settings: Optional[RouterSettings] = None):
+        self.name = name
+        self.settings = settings or RouterSettings()
+        self.backends = [BackendHealth(backend, self.settings) for backend in backends]
+        self._lock = threading.Lock()
+
+    def choose(self, kind: str, exclude: Optional[set] = None) -> Optional[int]:
+        """
+        Index of the backend to use next, skipping `exclude`d indices; None if
+        every remaining backend is tripped.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                i for i, backend in enumerate(self.backends)
+                if (exclude is None or i not in exclude) and backend.available(now)
+            ]
+            if not candidates:
+                return None
+            # Ties keep the configured order
+            index = min(candidates, key=lambda i: (self.backends[i].score(kind), i))
+            if self.backends[index].state == BreakerState.HALF_OPEN:
+                self.backends[index].probing = True
+            return index
+
+    def retry_in(self) -> float:
+        """Seconds until the first tripped backend may be probed again."""
+        now = time.monotonic()
+        with self._lock:
+            return max(0.0, min(backend.open_until for backend in self.backends) - now)
+
+    def success(self, index: int) -> None:
+        with self._lock:
+            self.backends[index].success()
+
+    def failure(self, index: int, rate_limited: bool = False) -> None:
+        with self._lock:
+            self.backends[index].failure(rate_limited, time.monotonic())
+
+    def abandon(self, index: int) -> None:
+        """The request sent to `index` ended without a verdict (e.g. it was cancelled)."""
+        with self._lock:
+            self.backends[index].probing = False
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            return {
+                backend.name: {
+                    "state": backend.state.value,
+                    "error_rate": backend.error_rate,
+                    "rate_limited_rate": backend.rate_limited_rate,
+                    "consecutive_failures": backend.consecutive_failures,
+                }
+                for backend in self.backends
+            }
+
+
+_routers: Dict[str, Router] = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(name: str, backends: List[str], settings: Optional[RouterSettings] = None) -> Router:
+    """Return the process-wide router of a logical model, creating it on first use."""
+    with _routers_lock:
+        router = _routers.get(name)
+        if router is None:
+            router = Router(name, backends, settings)
+            _routers[name] = router
+        return router
@@ -0,0 +1,318 @@
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Callable, Dict, List, Optional
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+
+# Async Model calls in flight per scheduler; bounded by default so priorities apply
+DEFAULT_MAX_CONCURRENT = 64
+
+
+class Priority(IntEnum):
+    """Lower values are served first when the scheduler is saturated."""
+
+    CRITICAL = 0  # Last checks before a solution is accepted
+    HIGH = 1  # DeepCheck
+    NORMAL = 2
+    LOW = 3  # Fresh reasoning
+
+
+class _Entry:
+    """A queued unit of work (sync) or a waiting task (async), ordered by priority then arrival."""
+
+    __slots__ = ("priority", "seq", "payload", "granted")
+
+    def __init__(self, priority: Priority, seq: int, payload):
+        self.priority = priority
+        self.seq = seq
+        self.payload = payload
+        self.granted = False
+
+    def __lt__(self, other: "_Entry") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Scheduler:
+    """
+    One bounded, priority-ordered place for all fan-out of a process (or solver).
+
+    Blocking work submitted with submit() runs on at most `max_workers`
+    threads shared by every Model and solver, instead of a new
+    ThreadPoolExecutor per call. A worker waiting on the result of work it
+    submitted gives up its place meanwhile (and waits for a free one before
+    carrying on), so nested fan-out runs in parallel and cannot deadlock the
+    pool; threads started to fill such places exit once they are surplus. Async Model calls take a slot() first, which
+    caps them at `max_concurrent`. When either is saturated, higher-priority
+    work goes first; with max_concurrent=None async calls are never queued, so
+    their priorities have no effect.
+    """
+
+    def __init__(self, max_workers: int = 32, max_concurrent: Optional[int] = DEFAULT_MAX_CONCURRENT):
+        self.max_workers = max_workers
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._local = threading.local()
+        # Blocking work
+        self._queue: List[_Entry] = []
+        self._work_available = threading.Condition(self._lock)
+        self._workers: List[threading.Thread] = []
+        self._worker_ids = itertools.count()
+        self._idle_workers = 0
+        # Workers blocked on the result of work they submitted; they don't count against max_workers
+        self._blocked = 0
+        # Blocked workers whose result is in, waiting for a place to carry on; they go before queued work
+        self._resuming = 0
+        self._place_available = threading.Condition(self._lock)
+        self._running = 0
+        self._completed = 0
+        # Async slots
+        self._waiters: List[_Entry] = []
+        self._active = 0
+
+    def submit(self, fn: Callable, *args, priority: Priority = Priority.NORMAL, **kwargs) -> Future:
+        """Run `fn` on a shared worker in a copy of the caller's context."""
+        future: Future = _SchedulerFuture(self)
+        context = contextvars.copy_context()
+        with self._lock:
+            heapq.heappush(
+                self._queue, _Entry(priority, next(self._seq), (future, context, fn, args, kwargs))
+            )
+            if not self._spawn_worker():
+                self._work_available.notify()
+        return future
+
+    def _spawn_worker(self) -> bool:
+        """Start a worker if none is idle and there is room; call with the lock held."""
+        if self._idle_workers or len(self._workers) - self._blocked >= self.max_workers:
+            return False
+        worker = threading.Thread(
+            target=self._work, name=f"scheduler-worker-{next(self._worker_ids)}", daemon=True
+        )
+        self._workers.append(worker)
+        worker.start()
+        return True
+
+    def _block(self) -> bool:
+        """The calling thread is about to wait on a submitted future; frees its place if it is a worker."""
+        if not getattr(self._local, "worker", False):
+            return False
+        with self._lock:
+            self._blocked += 1
+            if self._resuming:
+                self._place_available.notify()
+            elif self._queue and not self._spawn_worker():
+                self._work_available.notify()
+        return True
+
+    def _unblock(self) -> None:
+        with self._lock:
+            self._resuming += 1
+            while not self._has_place():
+                self._place_available.wait()
+            self._resuming -= 1
+            self._blocked -= 1
+            # Threads started while this one was blocked may now be surplus
+            self._work_available.notify_all()
+
+    def _has_place(self) -> bool:
+        """Whether fewer than max_workers workers are running unblocked; call with the lock held."""
+        return self._running - self._blocked < self.max_workers
+
+    def map(self, fn: Callable, items, priority: Priority = Priority.NORMAL) -> list:
+        """submit() `fn` for every item and return the results in order."""
+        futures = [self.submit(fn, item, priority=priority) for item in items]
+        return [future.result() for future in futures]
+
+    def _work(self) -> None:
+        self._local.worker = True
+        while True:
+            with self._lock:
+                while not self._queue or self._resuming or not self._has_place():
+                    if len(self._workers) > self.max_workers + self._blocked:
+                        self._workers.remove(threading.current_thread())
+                        return
+                    self._idle_workers += 1
+                    self._work_available.wait()
+                    self._idle_workers -= 1
+                entry = heapq.heappop(self._queue)
+                self._running += 1
+            future, context, fn, args, kwargs = entry.payload
+            try:
+                _run(future, context, fn, args, kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    # A place is free: resumed workers get it first, then queued work
+                    if self._resuming:
+                        self._place_available.notify()
+                    elif self._queue:
+                        self._work_available.notify()
+
+    async def acquire(self, priority: Priority = Priority.NORMAL) -> None:
+        """Wait for an async slot; every acquire() must be paired with release()."""
+        if self.max_concurrent is None:
+            return
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                return
+            entry = _Entry(priority, next(self._seq), (loop, loop.create_future()))
+            heapq.heappush(self._waiters, entry)
+        try:
+            await entry.payload[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = entry.granted
+                if not granted:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+            if granted:
+                # The slot was handed over just as we were cancelled; pass it on
+                self.release()
+            raise
+
+    def release(self) -> None:
+        if self.max_concurrent is None:
+            return
+        with self._lock:
+            if self._waiters:
+                # Hand the slot straight to the next waiter
+                entry = heapq.heappop(self._waiters)
+                entry.granted = True
+                loop, future = entry.payload
+                loop.call_soon_threadsafe(_resolve, future)
+                return
+            self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.NORMAL):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, object]:
+        """Queue depths per priority plus worker and slot usage."""
+        with self._lock:
+            return {
+                "workers": len(self._workers),
+                "running": self._running,
+                "blocked": self._blocked,
+                "completed": self._completed,
+                "queued": _depths(self._queue),
+                "active_async": self._active,
+                "queued_async": _depths(self._waiters),
+            }
+
+
+class _SchedulerFuture(Future):
+    """Future of submitted work; a worker waiting on it frees its place in the pool meanwhile."""
+
+    def __init__(self, scheduler: Scheduler):
+        super().__init__()
+        self._scheduler = scheduler
+
+    def result(self, timeout: Optional[float] = None):
+        if self.done() or not self._scheduler._block():
+            return super().result(timeout)
+        try:
+            return super().result(timeout)
+        finally:
+            self._scheduler._unblock()
+
+    def exception(self, timeout: Optional[float] = None):
+        if self.done() or not self._scheduler._block():
+            return super().exception(timeout)
+        try:
+            return super().exception(timeout)
+        finally:
+            self._scheduler._unblock()
+
+
+def _run(future: Future, context: contextvars.Context, fn, args, kwargs) -> None:
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        result = context.run(fn, *args, **kwargs)
+    except BaseException as e:
+        future.set_exception(e)
+    else:
+        future.set_result(result)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _depths(entries: List[_Entry]) -> Dict[str, int]:
+    depths = {priority.name: 0 for priority in Priority}
+    for entry in entries:
+        depths[entry.priority.name] += 1
+    return depths
+
+
+_default_scheduler: Optional[Scheduler] = None
+_default_scheduler_lock = threading.Lock()
+
+
+def default_scheduler() -> Scheduler:
+    """
+    Scheduler used outside of any use_scheduler() block.
+
+    Sized by MODEL_MAX_WORKERS (default 32 threads) and
+    MODEL_MAX_CONCURRENT_REQUESTS (async slots, default 64; "none" lifts the
+    cap, and with it the effect of async priorities).
+    """
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_scheduler_lock:
+            if _default_scheduler is None:
+                max_concurrent = os.getenv("MODEL_MAX_CONCURRENT_REQUESTS", str(DEFAULT_MAX_CONCURRENT))
+                _default_scheduler = Scheduler(
+                    max_workers=int(os.getenv("MODEL_MAX_WORKERS", 32)),
+                    max_concurrent=None if max_concurrent.lower() == "none" else int(max_concurrent),
+                )
+    return _default_scheduler
+
+
+_current_scheduler: ContextVar[Optional[Scheduler]] = ContextVar("current_scheduler", default=None)
+_current_priority: ContextVar[Priority] = ContextVar("current_priority", default=Priority.NORMAL)
+
+
+def current_scheduler() -> Scheduler:
+    return _current_scheduler.get() or default_scheduler()
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+@contextmanager
+def use_scheduler(scheduler: Optional[Scheduler]):
+    """Route the fan-out and Model calls made in this context through `scheduler` (None: the default)."""
+    token = _current_scheduler.set(scheduler)
+    try:
+        yield scheduler
+    finally:
+        _current_scheduler.reset(token)
+
+
+@contextmanager
+def priority(level: Priority):
+    """Priority of the Model calls and submitted work started in this context."""
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
@@ -0,0 +1,161 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import functools
+import inspect
+import threading
+import time
+
+
+@dataclass
+class CallRecord:
+    """One logical Model call (including its retries)."""
+
+    model: str
+    started_at: datetime
+    streamed: bool
+    # Label of the solver stage that made the call, see step()
+    step_type: Optional[str] = None
+    duration: float = 0.0
+    time_to_first_token: Optional[float] = None
+    retries: int = 0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # Prompt tokens the provider served from its prompt cache, if it reports them
+    cached_prompt_tokens: Optional[int] = None
+    # Whether token counts were estimated from text length instead of reported usage
+    usage_estimated: bool = False
+    response: Optional[str] = None
+    error: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    started_monotonic: float = field(default_factory=time.monotonic, repr=False)
+
+
+class CallTrace:
+    """Thread-safe collection of the calls made while it is active; nested traces also report to their parent."""
+
+    def __init__(
+        self,
+        parent: Optional["CallTrace"] = None,
+        on_record: Optional[Callable[[CallRecord], None]] = None,
+    ):
+        self._lock = threading.Lock()
+        self.parent = parent
+        self.on_record = on_record
+        self.calls: List[CallRecord] = []
+
+    def add(self, record: CallRecord) -> None:
+        with self._lock:
+            self.calls.append(record)
+        if self.on_record is not None:
+            self.on_record(record)
+        if self.parent is not None:
+            self.parent.add(record)
+
+    def durations(self) -> List[float]:
+        with self._lock:
+            return [call.duration for call in self.calls]
+
+
+_current_trace: ContextVar[Optional[CallTrace]] = ContextVar("current_trace", default=None)
+_current_call: ContextVar[Optional[CallRecord]] = ContextVar("current_call", default=None)
+_current_step: ContextVar[Optional[str]] = ContextVar("current_step", default=None)
+
+
+def current_trace() -> Optional[CallTrace]:
+    return _current_trace.get()
+
+
+def current_call() -> Optional[CallRecord]:
+    """The record of the Model call running in this context, for annotating it from inside."""
+    return _current_call.get()
+
+
+@contextmanager
+def trace_calls(on_record: Optional[Callable[[CallRecord], None]] = None) -> Iterator[CallTrace]:
+    """
+    Collect a CallRecord for every Model call made in this context (and tasks started from it).
+
+    `on_record` is called with each record once its call has finished.
+    """
+    trace = CallTrace(parent=_current_trace.get(), on_record=on_record)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def step(step_type: str):
+    """Label the Model calls made in this context with the solver stage they belong to."""
+    token = _current_step.set(step_type)
+    try:
+        yield
+    finally:
+        _current_step.reset(token)
+
+
+def traced(streamed: bool):
+    """Record the decorated Model method (sync or async) into the active trace, if any."""
+
+    def decorator(method):
+        def start(model) -> Optional[CallRecord]:
+            if _current_trace.get() is None:
+                return None
+            return CallRecord(
+                model=model.model_name.value,
+                started_at=datetime.now(),
+                streamed=streamed,
+                step_type=_current_step.get(),
+            )
+
+        def finish(record: CallRecord, started: float, response=None, error=None) -> None:
+            record.duration = time.monotonic() - started
+            record.response = response
+            if error is not None:
+                record.error = f"{type(error).__name__}: {error}"
+            _current_trace.get().add(record)
+
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                record = start(self)
+                if record is None:
+                    return await method(self, *args, **kwargs)
+                started = time.monotonic()
+                token = _current_call.set(record)
+                try:
+                    response = await method(self, *args, **kwargs)
+                except BaseException as e:
+                    finish(record, started, error=e)
+                    raise
+                finally:
+                    _current_call.reset(token)
+                finish(record, started, response)
+                return response
+
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            record = start(self)
+            if record is None:
+                return method(self, *args, **kwargs)
+            started = time.monotonic()
+            token = _current_call.set(record)
+            try:
+                response = method(self, *args, **kwargs)
+            except BaseException as e:
+                finish(record, started, error=e)
+                raise
+            finally:
+                _current_call.reset(token)
+            finish(record, started, response)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,238 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Dict, Optional
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+import uuid
+
+
+class LogLevel(IntEnum):
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+
+
+@dataclass
+class TranscriptSettings:
+    # JSONL file records are appended to; None keeps them off disk (the echo still works).
+    # Set explicitly (or through TRANSCRIPT_PATH) so runs don't write into whatever directory they start in
+    path: Optional[str] = None
+    level: LogLevel = LogLevel.INFO
+    # Records at or above this level also have their message printed; None prints nothing
+    echo_level: Optional[LogLevel] = LogLevel.INFO
+    # Start a new file once the current one would grow past this, keeping `backup_count` old ones
+    max_bytes: int = 64 * 1024 * 1024
+    backup_count: int = 5
+    # gzip the files rotated out
+    compress: bool = False
+    # Records waiting for the writer thread; once it is full, new records are dropped instead of blocking
+    queue_size: int = 10_000
+
+    @classmethod
+    def from_env(cls) -> "TranscriptSettings":
+        """TRANSCRIPT_PATH (empty for no file), TRANSCRIPT_LEVEL and TRANSCRIPT_ECHO_LEVEL (level names or "none")."""
+        settings = cls()
+        if "TRANSCRIPT_PATH" in os.environ:
+            settings.path = os.environ["TRANSCRIPT_PATH"] or None
+        if "TRANSCRIPT_LEVEL" in os.environ:
+            settings.level = LogLevel[os.environ["TRANSCRIPT_LEVEL"].upper()]
+        if "TRANSCRIPT_ECHO_LEVEL" in os.environ:
+            echo = os.environ["TRANSCRIPT_ECHO_LEVEL"].upper()
+            settings.echo_level = None if echo == "NONE" else LogLevel[echo]
+        return settings
+
+
+_run_id: ContextVar[Optional[str]] = ContextVar("transcript_run_id", default=None)
+_problem_id: ContextVar[Optional[str]] = ContextVar("transcript_problem_id", default=None)
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def current_run_id() -> Optional[str]:
+    return _run_id.get()
+
+
+def current_problem_id() -> Optional[str]:
+    return _problem_id.get()
+
+
+@contextmanager
+def transcript_ids(run_id: Optional[str] = None, problem_id: Optional[str] = None):
+    """Tag the records logged in this context (and tasks started from it) with these ids."""
+    tokens = []
+    if run_id is not None:
+        tokens.append((_run_id, _run_id.set(run_id)))
+    if problem_id is not None:
+        tokens.append((_problem_id, _problem_id.set(problem_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+# Queue items besides records: stop the writer, or set an event once everything before it is written
+_STOP = object()
+
+
+class TranscriptSink:
+    """
+    Structured JSONL log of a run, written by a background thread.
+
+    emit() only puts the record on a bounded queue, so solver and Model code
+    never waits on disk or terminal I/O; when the writer falls behind, records
+    are dropped (and counted) rather than blocking. Every record carries the
+    run and problem ids of the context it was logged in, so the transcripts of
+    concurrent problems can be told apart.
+    """
+
+    def __init__(self, settings: Optional[TranscriptSettings] = None):
+        self.settings = settings or TranscriptSettings()
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.settings.queue_size)
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self._thread.start()
+
+    def enabled(self, level: LogLevel) -> bool:
+        echo_level = self.settings.echo_level
+        return (self.settings.path is not None and level >= self.settings.level) or (
+            echo_level is not None and level >= echo_level
+        )
+
+    def emit(self, level: LogLevel, event: str, message: str = "", **fields: Any) -> None:
+        if not self.enabled(level):
+            return
+        record = {
+            "time": time.time(),
+            "level": level.name,
+            "event": event,
+            "run_id": current_run_id(),
+            "problem_id": current_problem_id(),
+            "message": message,
+            **fields,
+        }
+        try:
+            self._queue.put_nowait((level, record))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every record emitted so far is written; False on timeout."""
+        written = threading.Event()
+        self._queue.put(written)
+        return written.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._close_file()
+                return
+            if isinstance(item, threading.Event):
+                if self._file is not None:
+                    self._file.flush()
+                item.set()
+                continue
+            try:
+                self._write(*item)
+            except Exception as e:
+                print(f"Transcript write failed: {e}", file=sys.stderr)
+            # Flush whenever the writer catches up, rather than per record
+            if self._queue.empty() and self._file is not None:
+                self._file.flush()
+
+    def _write(self, level: LogLevel, record: Dict[str, Any]) -> None:
+        echo_level = self.settings.echo_level
+        if echo_level is not None and level >= echo_level:
+            ids = "/".join(i for i in (record["run_id"], record["problem_id"]) if i)
+            prefix = f"[{ids}] " if ids else ""
+            print(prefix + (record["message"] or record["event"]))
+        if self.settings.path is None or level < self.settings.level:
+            return
+        line = (json.dumps(record, default=str, ensure_ascii=False) + "\n").encode("utf-8")
+        if self._file is None:
+            directory = os.path.dirname(self.settings.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.settings.path, "ab")
+        if self._file.tell() and self._file.tell() + len(line) > self.settings.max_bytes:
+            self._rotate()
+        self._file.write(line)
+
+    def _backup_name(self, index: int) -> str:
+        return f"{self.settings.path}.{index}" + (".gz" if self.settings.compress else "")
+
+    def _rotate(self) -> None:
+        """transcript.jsonl becomes transcript.jsonl.1 (.gz), .1 becomes .2 and so on."""
+        self._close_file()
+        path = self.settings.path
+        if self.settings.backup_count > 0:
+            for index in range(self.settings.backup_count - 1, 0, -1):
+                if os.path.exists(self._backup_name(index)):
+                    os.replace(self._backup_name(index), self._backup_name(index + 1))
+            if self.settings.compress:
+                with open(path, "rb") as source, gzip.open(self._backup_name(1), "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(path)
+            else:
+                os.replace(path, self._backup_name(1))
+        else:
+            os.remove(path)
+        self._file = open(path, "ab")
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_sink: Optional[TranscriptSink] = None
+_sink_lock = threading.Lock()
+
+
+def transcript() -> TranscriptSink:
+    """The process-wide sink, created from the TRANSCRIPT_* environment variables on first use."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = TranscriptSink(TranscriptSettings.from_env())
+        return _sink
+
+
+def configure_transcript(settings: TranscriptSettings) -> TranscriptSink:
+    """Replace the process-wide sink, closing the old one once it has written what it has queued."""
+    global _sink
+    with _sink_lock:
+        previous, _sink = _sink, TranscriptSink(settings)
+    if previous is not None:
+        previous.close()
+    return _sink
+
+
+def log(level: LogLevel, event: str, message: str = "", **fields: Any) -> None:
+    """Emit a record to the process-wide transcript; never blocks."""
+    transcript().emit(level, event, message, **fields)
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+    # The writer is a daemon thread; give it a moment to drain the queue
+    if _sink is not None:
+        _sink.close(timeout=5.0)